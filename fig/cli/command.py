@@ -1,3 +1,4 @@
+from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 from docker import Client
@@ -6,6 +7,7 @@ import errno
 import logging
 import os
 import re
+import sys
 import yaml
 import six
 
@@ -14,8 +16,13 @@ from ..service import ConfigError
 from .docopt_command import DocoptCommand
 from .utils import docker_url, call_silently, is_mac, is_ubuntu
 from . import verbose_proxy
+from .formatter import Formatter
+from .metrics_proxy import Metrics, MetricsProxy, HEADERS
+from .trace_proxy import TraceProxy
 from . import errors
 from .. import __version__
+from .. import history
+from .. import trace
 
 log = logging.getLogger(__name__)
 
@@ -41,22 +48,71 @@ class Command(DocoptCommand):
 
     def perform_command(self, options, handler, command_options):
         explicit_config_path = options.get('--file') or os.environ.get('FIG_FILE')
-        project = self.get_project(
-            self.get_config_path(explicit_config_path),
-            project_name=options.get('--project-name'),
-            verbose=options.get('--verbose'))
-
-        handler(project, command_options)
+        # `up --metrics-addr` serves the same metrics --profile prints
+        if options.get('--profile') or command_options.get('--metrics-addr'):
+            metrics = Metrics()
+        else:
+            metrics = None
+        # Opened up front, so that a bad path is reported before the command
+        # runs rather than after
+        trace_file = None
+        if options.get('--trace'):
+            try:
+                trace_file = open(options['--trace'], 'w')
+            except IOError as e:
+                raise errors.UserError('Can\'t write --trace: %s' % e)
+        tracer = trace.start() if trace_file is not None else None
+        history_path = history.history_path()
+        recorder = history.start() if history_path else None
+        project = None
+        try:
+            project = self.get_project(
+                self.get_config_path(explicit_config_path),
+                project_name=options.get('--project-name'),
+                verbose=options.get('--verbose'),
+                metrics=metrics)
+
+            with trace.span(handler.__name__, 'command'):
+                handler(project, command_options)
+        finally:
+            # `up` is usually left by interrupting it, long after everything
+            # it times has finished
+            if recorder is not None:
+                history.stop()
+                if project is not None:
+                    self.save_history(history_path, recorder.entry(project.name, handler.__name__))
+            if options.get('--profile'):
+                print(Formatter().table(HEADERS, metrics.rows()), file=sys.stderr)
+            if tracer is not None:
+                trace.stop()
+                with trace_file:
+                    tracer.write(trace_file)
+
+    def save_history(self, path, entry):
+        # Commands that didn't build, pull, create or start anything have
+        # nothing to add
+        if not entry['durations']:
+            return
+        try:
+            history.append(path, entry)
+        except (IOError, OSError) as e:
+            log.warning("Couldn't save timings to %s: %s", path, e)
 
-    def get_client(self, verbose=False):
+    def get_client(self, verbose=False, metrics=None):
         client = Client(docker_url())
+        if metrics is not None:
+            metrics.measure_responses(client)
         if verbose:
             version_info = six.iteritems(client.version())
             log.info("Fig version %s", __version__)
             log.info("Docker base_url: %s", client.base_url)
             log.info("Docker version: %s",
                      ", ".join("%s=%s" % item for item in version_info))
-            return verbose_proxy.VerboseProxy('docker', client)
+            client = verbose_proxy.VerboseProxy('docker', client)
+        if trace.tracer is not None:
+            client = TraceProxy(client)
+        if metrics is not None:
+            client = MetricsProxy(client, metrics)
         return client
 
     def get_config(self, config_path):
@@ -68,15 +124,21 @@ class Command(DocoptCommand):
                 raise errors.FigFileNotFound(os.path.basename(e.filename))
             raise errors.UserError(six.text_type(e))
 
-    def get_project(self, config_path, project_name=None, verbose=False):
+    def get_project(self, config_path, project_name=None, verbose=False, metrics=None):
         try:
-            return Project.from_config(
+            project = Project.from_config(
                 self.get_project_name(config_path, project_name),
                 self.get_config(config_path),
-                self.get_client(verbose=verbose))
+                self.get_client(verbose=verbose, metrics=metrics))
         except ConfigError as e:
             raise errors.UserError(six.text_type(e))
 
+        if metrics is not None:
+            # Record each service's calls separately
+            for service in project.services:
+                service.client = project.client.labelled(service.name)
+        return project
+
     def get_project_name(self, config_path, project_name=None):
         def normalize_name(name):
             return re.sub(r'[^a-zA-Z0-9]', '', name)
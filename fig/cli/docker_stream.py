@@ -0,0 +1,184 @@
+"""
+Helpers for reading Docker's streaming HTTP responses straight off the socket.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import struct
+
+import six
+
+
+def response_socket(response):
+    """
+    Return the socket underneath a streamed `requests` response, along with
+    any body bytes that httplib had already read into its buffer while it was
+    parsing the headers. Those bytes will never show up on the socket again.
+    """
+    fp = response.raw._fp.fp
+    buffered = b''
+
+    if six.PY3:
+        sock = fp.raw._sock
+    else:
+        sock = fp._sock
+        rbuf = getattr(fp, '_rbuf', None)
+        if rbuf is not None:
+            buffered = rbuf.getvalue()
+            rbuf.seek(0)
+            rbuf.truncate()
+
+    return sock, buffered
+
+
+def is_chunked(response):
+    return response.headers.get('transfer-encoding', '').lower() == 'chunked'
+
+
+class ChunkedDecoder(object):
+    """
+    Incrementally decode an HTTP/1.1 body sent with chunked transfer encoding.
+    `finished` is set once the terminating zero-length chunk has been seen.
+    """
+    def __init__(self):
+        self.buffered = bytearray()
+        self.remaining = 0
+        self.skip = 0
+        self.finished = False
+
+    def feed(self, data):
+        buffered = self.buffered
+        buffered.extend(data)
+        output = []
+        offset = 0
+
+        while not self.finished:
+            if self.remaining:
+                end = min(offset + self.remaining, len(buffered))
+                output.append(bytes(buffered[offset:end]))
+                self.remaining -= end - offset
+                offset = end
+                if self.remaining:
+                    break
+                # Every chunk is followed by a CRLF
+                self.skip = 2
+
+            if self.skip:
+                skipped = min(self.skip, len(buffered) - offset)
+                offset += skipped
+                self.skip -= skipped
+                if self.skip:
+                    break
+
+            index = buffered.find(b'\r\n', offset)
+            if index == -1:
+                break
+            size = int(bytes(buffered[offset:index]).split(b';')[0], 16)
+            offset = index + 2
+            if size == 0:
+                self.finished = True
+            self.remaining = size
+
+        del buffered[:offset]
+        return b''.join(output)
+
+
+STREAM_HEADER_SIZE = 8
+READ_SIZE = 64 * 1024
+
+STDIN = 0
+STDOUT = 1
+STDERR = 2
+
+
+class FrameReader(object):
+    """
+    Reads Docker's multiplexed stdout/stderr stream format.
+
+    Data is received straight into a reusable buffer, frame headers are
+    parsed where they lie and each payload is copied out of the buffer once.
+    Both `read_from()` and `feed()` return a list of `(stream, payload)`
+    pairs, with consecutive frames from the same stream merged.
+
+    Containers with a TTY don't get their output framed, so with `tty=True`
+    everything is passed through as stdout.
+    """
+    def __init__(self, tty=False, size=READ_SIZE):
+        self.tty = tty
+        self.buffer = bytearray(size)
+        self.start = 0
+        self.end = 0
+        self.wanted = STREAM_HEADER_SIZE
+
+    def read_from(self, sock):
+        """
+        Read from `sock` once. Returns None when the other end has closed it.
+        """
+        if self.tty:
+            data = sock.recv(len(self.buffer))
+            return [(STDOUT, data)] if data else None
+
+        self._make_room(self.wanted)
+        view = memoryview(self.buffer)
+        try:
+            received = sock.recv_into(view[self.end:])
+        finally:
+            # bytearrays can't be resized while a view of them exists
+            del view
+        if not received:
+            return None
+        self.end += received
+        return self._parse()
+
+    def feed(self, data):
+        """
+        Parse data that has already been read some other way.
+        """
+        if self.tty:
+            return [(STDOUT, data)] if data else []
+
+        self._make_room(self.end - self.start + len(data))
+        self.buffer[self.end:self.end + len(data)] = data
+        self.end += len(data)
+        return self._parse()
+
+    def _make_room(self, needed):
+        """
+        Move any partial frame to the start of the buffer, and grow the buffer
+        if it still can't hold `needed` more bytes than that.
+        """
+        if self.start:
+            pending = self.end - self.start
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+        shortfall = self.start + needed - len(self.buffer)
+        if self.end == len(self.buffer) or shortfall > 0:
+            self.buffer.extend(bytearray(max(shortfall, READ_SIZE)))
+
+    def _parse(self):
+        frames = []
+        buffer = self.buffer
+        start = self.start
+        view = memoryview(buffer)
+        try:
+            while self.end - start >= STREAM_HEADER_SIZE:
+                stream, length = struct.unpack_from(str('>BxxxL'), buffer, start)
+                end = start + STREAM_HEADER_SIZE + length
+                if end > self.end:
+                    self.wanted = end - start
+                    break
+                payload = view[start + STREAM_HEADER_SIZE:end].tobytes()
+                if frames and frames[-1][0] == stream:
+                    frames[-1][1].append(payload)
+                else:
+                    frames.append((stream, [payload]))
+                start = end
+            else:
+                self.wanted = STREAM_HEADER_SIZE
+        finally:
+            del view
+
+        if start == self.end:
+            self.start = self.end = 0
+        else:
+            self.start = start
+        return [(stream_id, b''.join(payloads)) for (stream_id, payloads) in frames]
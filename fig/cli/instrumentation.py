@@ -0,0 +1,172 @@
+"""
+Statistics about a long-running `fig up`, for finding out what its memory
+is going on without restarting it: the largest allocations (or the most
+common types of object, where tracemalloc isn't available), its threads,
+the output waiting in each sink's LogWriters and how much each container
+has written.
+
+Samples are written as one JSON object per line, every `interval` seconds
+and whenever fig receives SIGUSR1.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import gc
+import json
+import os
+import resource
+import signal
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from .log_sinks import Sink
+
+
+DEFAULT_INTERVAL = 60
+DEFAULT_TOP = 10
+
+
+class OutputCounter(Sink):
+    """
+    Counts the bytes and lines each container writes, and how many times it
+    has exited.
+    """
+    stores_output = False
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.containers = {}
+
+    def write(self, source, stream, chunk):
+        with self.lock:
+            counts = self._counts(source.container)
+            counts['bytes'] += len(chunk)
+            counts['lines'] += chunk.count(b'\n')
+
+    def exit(self, source, exit_code):
+        with self.lock:
+            self._counts(source.container)['exits'] += 1
+
+    def _counts(self, container):
+        if container.name not in self.containers:
+            self.containers[container.name] = {'bytes': 0, 'lines': 0, 'exits': 0}
+        return self.containers[container.name]
+
+    def counts(self):
+        with self.lock:
+            return dict((name, dict(counts)) for (name, counts) in self.containers.items())
+
+
+class Instrumentation(object):
+    """
+    Writes samples to `output` from a background thread. `start(sinks)`
+    starts sampling the given sinks' LogWriters, and `counter` is the sink
+    that counts each container's output, which has to be added to them.
+    `output` is closed by `stop()` if `close_output` is set.
+    """
+    def __init__(self, output, interval=DEFAULT_INTERVAL, top=DEFAULT_TOP, close_output=False):
+        self.output = output
+        self.close_output = close_output
+        self.interval = interval
+        self.top = top
+        self.counter = OutputCounter()
+        self.sinks = []
+        self.wake = threading.Event()
+        self.stopped = False
+        self.tracing = False
+        self.previous_handler = None
+        self.thread = threading.Thread(target=self._run, name='instrumentation')
+        self.thread.daemon = True
+
+    def start(self, sinks):
+        self.sinks = sinks
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        if hasattr(signal, 'SIGUSR1'):
+            self.previous_handler = signal.signal(signal.SIGUSR1, self._signalled)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+        self.thread.join()
+        if self.previous_handler is not None:
+            signal.signal(signal.SIGUSR1, self.previous_handler)
+        self.write_sample()
+        if self.close_output:
+            self.output.close()
+        if self.tracing:
+            tracemalloc.stop()
+
+    def _signalled(self, signum, frame):
+        # Sampling takes locks the interrupted thread may hold, so it is
+        # left to the background thread
+        self.wake.set()
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            if self.stopped:
+                return
+            self.write_sample()
+
+    def write_sample(self):
+        self.output.write(json.dumps(self.sample(), sort_keys=True) + '\n')
+        self.output.flush()
+
+    def sample(self):
+        threads = threading.enumerate()
+        sample = {
+            'time': time.time(),
+            'pid': os.getpid(),
+            'rss': resident_size(),
+            'threads': len(threads),
+            'thread_names': sorted(thread.name for thread in threads),
+            'writers': [
+                dict(writer.stats(), sink=type(sink).__name__)
+                for sink in self.sinks
+                for writer in sink.log_writers()
+            ],
+            'containers': self.counter.counts(),
+        }
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            sample['allocations'] = top_allocations(self.top)
+        else:
+            sample['objects'] = top_object_types(self.top)
+        return sample
+
+
+def resident_size():
+    """
+    The process's resident set size in bytes, or its peak where the current
+    size isn't available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def top_allocations(limit):
+    statistics = tracemalloc.take_snapshot().statistics('lineno')
+    return [
+        {'where': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+        for stat in statistics[:limit]
+    ]
+
+
+def top_object_types(limit):
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    ordered = sorted(counts.items(), key=lambda item: -item[1])
+    return [{'type': item[0], 'count': item[1]} for item in ordered[:limit]]
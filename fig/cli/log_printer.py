@@ -1,26 +1,171 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
+import calendar
+import datetime
+import heapq
+import json
+import os
+import re
 import sys
+import time
 
-from itertools import cycle
+from itertools import count, cycle
 
-from .multiplexer import Multiplexer, STOP
+from .docker_stream import ChunkedDecoder, FrameReader, is_chunked, response_socket, READ_SIZE, STDOUT
+from .multiplexer import Multiplexer, STOP, DONE
+from .log_sinks import StreamSink
+from .log_writer import DROP
 from . import colors
-from .utils import split_buffer
+from .utils import LineBuffer, prefix_lines
+
+
+STREAM_NAMES = {0: 'stdin', 1: 'stdout', 2: 'stderr'}
+
+# In place of the stream in the item a LogSource returns once its container
+# has exited, with the exit code in place of the output.
+EXIT = 'exit'
+
+TEXT = 'text'
+JSON = 'json'
+FORMATS = (TEXT, JSON)
 
 
 class LogPrinter(object):
-    def __init__(self, containers, attach_params=None, output=sys.stdout, monochrome=False):
+    def __init__(self, containers, attach_params=None, log_params=None, output=sys.stdout, monochrome=False,
+                 grep=None, exclude=None, format=TEXT, streams=('stdout', 'stderr'), merge=False,
+                 sinks=(), prefix=True, shards=1, **writer_options):
+        """
+        Output is read by attaching to each container with `attach_params`,
+        unless `log_params` are given, in which case it is read from the logs
+        endpoint instead. That supports `follow`, `tail` and `since`.
+
+        Only the `streams` asked for are requested from Docker, so leaving one
+        out costs nothing. Containers with a TTY only have stdout.
+
+        `grep` and `exclude` are compiled byte-string patterns; only lines
+        that match `grep` and don't match `exclude` are printed.
+
+        With `format='json'`, each line is printed as a JSON object instead
+        of with a coloured prefix. With `prefix=False`, lines are printed as
+        they are.
+
+        With `merge`, the history is read with timestamps and printed in
+        timestamp order across all containers before new output is followed.
+
+        Output goes to `output` through a StreamSink, which `writer_options`
+        are passed on to, and to any further `sinks`. Unless a `policy` is
+        given, the StreamSink drops output once its backlog is full when any
+        of `sinks` stores output, so that a slow terminal doesn't stop them
+        getting it, and blocks otherwise. When there is nothing to
+        do to the output of a single container but copy it to a file or pipe,
+        that is done directly instead; see pass_through().
+
+        With more than one of `shards`, the containers are split between
+        that many worker processes, which read and format their output and
+        pass it on to this one. Only the output sink can be used then, as it
+        is the only one that wants formatted output.
+        """
+        if shards > 1 and sinks:
+            raise ValueError("Output can't be sent to other sinks when it is read by several processes")
         self.containers = containers
         self.attach_params = attach_params or {}
+        self.log_params = log_params
+        self.streams = streams
+        self.line_filter = LineFilter(grep, exclude) if grep or exclude else None
+        self.format = format
+        self.merge = merge
+        self.prefix = prefix
+        self.shards = min(shards, len(containers))
+        if merge and log_params is None:
+            self.log_params = {}
+        # The timestamp of the last line of each container's merged history,
+        # once it has been printed
+        self.history_ends = None
         self.prefix_width = self._calculate_prefix_width(containers)
-        self.generators = self._make_log_generators(monochrome)
+        self.formatters = self._make_formatters(monochrome)
+        # Attach to containers before log printer starts running, unless the
+        # history has to be printed first
+        self.sources = [] if merge else self._make_log_sources()
         self.output = output
+        if any(sink.stores_output for sink in sinks):
+            writer_options.setdefault('policy', DROP)
+        # The terminal is fed last, as it is the sink that may block
+        self.sinks = list(sinks) + [StreamSink(output, **writer_options)]
 
     def run(self):
-        mux = Multiplexer(self.generators)
-        for line in mux.loop():
-            self.output.write(line)
+        if self._can_pass_through():
+            return self._pass_through()
+
+        for sink in self.sinks:
+            sink.start()
+        try:
+            if self.merge:
+                self.history_ends = self._print_history()
+                if not self.log_params.get('follow', True):
+                    return
+                self.sources = self._make_log_sources()
+
+            for source, stream, data in Multiplexer(self.sources).loop():
+                if stream == EXIT:
+                    for sink in self.sinks:
+                        sink.exit(source, data)
+                else:
+                    self._write(source, stream, data)
+        finally:
+            for source in self.sources:
+                if hasattr(source, 'close'):
+                    source.close()
+            for sink in self.sinks:
+                sink.close()
+
+    def _can_pass_through(self):
+        if len(self.sources) != 1 or len(self.sinks) != 1:
+            return False
+        if self.prefix or self.format != TEXT or self.line_filter:
+            return False
+        try:
+            return not os.isatty(self.output.fileno())
+        except (AttributeError, IOError, ValueError):
+            return False
+
+    def _pass_through(self):
+        source = self.sources[0]
+        # Anything already written to `output` has to come first
+        self.output.flush()
+        pass_through(source.socket, self.output.fileno(), buffered=source.buffered,
+                     chunked=source.chunks is not None, tty=source.frames.tty)
+        source.socket.close()
+        if source.follow:
+            self.output.write(source.formatter.exit(source.container.wait()))
+            self.output.flush()
+
+    def _write(self, source, stream, chunk):
+        # Sharded output has been filtered by the worker that read it
+        if self.line_filter and self.shards <= 1:
+            chunk = self.line_filter(chunk)
+        if chunk:
+            for sink in self.sinks:
+                sink.write(source, stream, chunk)
+
+    def _print_history(self):
+        """
+        Print the history of all containers in timestamp order, and return
+        the timestamp key of the last line printed for each container.
+        """
+        params = dict(self.log_params, follow=False, timestamps=True)
+        readers = []
+        try:
+            for index, (container, formatter) in enumerate(zip(self.containers, self.formatters)):
+                socket, buffered, chunked = self._open_logs(container, params)
+                readers.append(HistoryReader(index, container, socket, formatter, buffered=buffered,
+                                             chunked=chunked, tty=bool(container.get('Config.Tty'))))
+
+            for reader, stream, chunk in merge_history(readers):
+                self._write(reader, stream, chunk)
+        finally:
+            for reader in readers:
+                reader.close()
+        return dict((reader.container.name, reader.last_key) for reader in readers if reader.last_key)
 
     def _calculate_prefix_width(self, containers):
         """
@@ -35,30 +180,60 @@ class LogPrinter(object):
             prefix_width = max(prefix_width, len(container.name_without_project))
         return prefix_width
 
-    def _make_log_generators(self, monochrome):
+    def _make_formatters(self, monochrome):
         color_fns = cycle(colors.rainbow())
-        generators = []
+        formatters = []
 
         for container in self.containers:
+            if self.format == JSON:
+                formatters.append(JsonFormatter(container))
+                continue
             if monochrome:
                 color_fn = lambda s: s
             else:
-                color_fn = color_fns.next()
-            generators.append(self._make_log_generator(container, color_fn))
+                color_fn = next(color_fns)
+            prefix = self._generate_prefix(container) if self.prefix else ''
+            formatters.append(TextFormatter(container, prefix, color_fn))
+
+        return formatters
+
+    def _make_log_sources(self, log_params=None):
+        log_params = log_params or self.log_params
+        if self.shards > 1:
+            return self._make_shards(log_params)
+        return [
+            self._make_log_source(container, formatter, log_params)
+            for (container, formatter) in zip(self.containers, self.formatters)
+        ]
 
-        return generators
+    def _make_shards(self, log_params):
+        # Imported here as log_shards imports from this module
+        from .log_shards import split, start_shard
 
-    def _make_log_generator(self, container, color_fn):
-        prefix = color_fn(self._generate_prefix(container)).encode('utf-8')
-        # Attach to container before log printer starts running
-        line_generator = split_buffer(self._attach(container), '\n')
+        def make_source(container, formatter):
+            return self._make_log_source(container, formatter, log_params)
 
-        for line in line_generator:
-            yield prefix + line
+        entries = list(zip(range(len(self.containers)), self.containers, self.formatters))
+        return [start_shard(shard, make_source, self.line_filter) for shard in split(entries, self.shards)]
 
-        exit_code = container.wait()
-        yield color_fn("%s exited with code %s\n" % (container.name, exit_code))
-        yield STOP
+    def _make_log_source(self, container, formatter, log_params):
+        after = None
+        if self.history_ends is not None:
+            # Following on from the merged history. A container that had any
+            # is followed from the second its last line was written in, so
+            # that nothing written since it was read is missed, and the lines
+            # that were already printed are skipped by their timestamps. The
+            # history of one that had none was empty, so anything it has now
+            # is new.
+            after = self.history_ends.get(container.name)
+            log_params = dict(log_params, timestamps=True)
+            if after is not None:
+                log_params.update(tail='all', since=timestamp_seconds(after))
+        socket, buffered, chunked = self._attach(container, log_params)
+        follow = log_params is None or log_params.get('follow', True)
+        return LogSource(container, socket, formatter, buffered=buffered, chunked=chunked, follow=follow,
+                         tty=bool(container.get('Config.Tty')), timestamps=self.history_ends is not None,
+                         after=after)
 
     def _generate_prefix(self, container):
         """
@@ -68,12 +243,435 @@ class LogPrinter(object):
         padding = ' ' * (self.prefix_width - len(name))
         return ''.join([name, padding, ' | '])
 
-    def _attach(self, container):
+    def _attach(self, container, log_params):
+        """
+        Return the socket to read the container's output from, any of it that
+        has already been read off that socket, and whether it is chunked.
+        """
+        if log_params is not None:
+            return self._open_logs(container, log_params)
+
         params = {
-            'stdout': True,
-            'stderr': True,
+            'stdout': 'stdout' in self.streams,
+            'stderr': 'stderr' in self.streams,
             'stream': True,
         }
         params.update(self.attach_params)
         params = dict((name, 1 if value else 0) for (name, value) in list(params.items()))
-        return container.attach(**params)
+        # With logs=1, the start of the history can arrive with the headers
+        response = container.attach_response(**params)
+        socket, buffered = response_socket(response)
+        return socket, buffered, False
+
+    def _open_logs(self, container, log_params):
+        params = {
+            'stdout': 'stdout' in self.streams,
+            'stderr': 'stderr' in self.streams,
+            'follow': True,
+            'tail': 'all',
+        }
+        params.update(log_params)
+        for (name, value) in list(params.items()):
+            if isinstance(value, bool):
+                params[name] = 1 if value else 0
+            elif value is None:
+                del params[name]
+
+        response = container.logs_response(**params)
+        socket, buffered = response_socket(response)
+        return socket, buffered, is_chunked(response)
+
+
+class LogSource(object):
+    """
+    Reads the multiplexed output of a single container from its attach or
+    logs socket and splits it into lines. `read()` must only be called when
+    the socket is readable or has_buffered_data() is True, so that it never
+    blocks.
+
+    All the complete lines that arrive on one stream in one read are returned
+    as a single `(source, stream, chunk)` item, so the cost per line stays in
+    C rather than in the Python loop.
+
+    With `timestamps`, output was requested with timestamps, which are
+    stripped off each line, and lines stamped at or before the timestamp key
+    `after` are skipped.
+    """
+    def __init__(self, container, socket, formatter, buffered=b'', chunked=False, follow=True, tty=False,
+                 timestamps=False, after=None):
+        self.container = container
+        self.timestamps = timestamps
+        self.after = after
+        self.socket = socket
+        self.socket.settimeout(None)
+        self.formatter = formatter
+        self.buffered = buffered
+        self.chunks = ChunkedDecoder() if chunked else None
+        self.follow = follow
+        self.frames = FrameReader(tty=tty)
+        self.lines = {}
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def has_buffered_data(self):
+        return bool(self.buffered)
+
+    def read(self):
+        if self.buffered:
+            data, self.buffered = self.buffered, b''
+            frames = self._feed(data)
+        elif self.chunks is not None:
+            frames = self._feed(self.socket.recv(READ_SIZE))
+        else:
+            frames = self.frames.read_from(self.socket)
+        if frames is None:
+            return self._finish()
+
+        items = []
+        for (stream, payload) in frames:
+            self._add_lines(items, stream, self._line_buffer(stream).feed(payload))
+
+        if self.chunks is not None and self.chunks.finished:
+            items.extend(self._finish())
+        return items
+
+    def _feed(self, data):
+        """
+        Parse data that didn't come straight off the socket: either bytes
+        httplib had already buffered, or a read that needs de-chunking.
+        """
+        if not data:
+            return None
+        if self.chunks is not None:
+            data = self.chunks.feed(data)
+        return self.frames.feed(data)
+
+    def _line_buffer(self, stream):
+        # stdout and stderr are split into lines separately, so that a partial
+        # line on one isn't glued to the other
+        if stream not in self.lines:
+            self.lines[stream] = LineBuffer()
+        return self.lines[stream]
+
+    def _add_lines(self, items, stream, chunk):
+        if chunk and self.timestamps:
+            chunk = self._strip_timestamps(chunk)
+        if chunk:
+            items.append((self, stream, chunk))
+
+    def _strip_timestamps(self, chunk):
+        lines = []
+        for line in split_lines(chunk):
+            stamp, _, line = line.partition(b' ')
+            if self.after is None or timestamp_key(stamp) > self.after:
+                lines.append(line)
+        return b''.join(lines)
+
+    def _finish(self):
+        self.socket.close()
+        items = []
+        for (stream, lines) in sorted(self.lines.items()):
+            self._add_lines(items, stream, lines.flush())
+
+        if not self.follow:
+            items.append(DONE)
+            return items
+
+        items.append((self, EXIT, self.container.wait()))
+        items.append(STOP)
+        return items
+
+
+class HistoryReader(object):
+    """
+    Reads a container's history from the logs endpoint, requested with
+    timestamps and without following. Iterating over it blocks on the socket
+    and yields `(key, index, seq, reader, stream, line)` tuples with the
+    timestamp stripped off the line, so that readers can be merged with
+    `heapq.merge`. Only one read's worth of lines is held at a time.
+    """
+    def __init__(self, index, container, socket, formatter, buffered=b'', chunked=False, tty=False):
+        self.index = index
+        self.container = container
+        self.socket = socket
+        self.socket.settimeout(None)
+        self.formatter = formatter
+        self.buffered = buffered
+        self.chunks = ChunkedDecoder() if chunked else None
+        self.frames = FrameReader(tty=tty)
+        self.lines = {}
+        self.seq = count()
+        self.last_key = None
+
+    def __iter__(self):
+        while True:
+            frames = self._read()
+            if frames is None:
+                break
+            for (stream, payload) in frames:
+                for line in self._split(stream, self._line_buffer(stream).feed(payload)):
+                    yield line
+            if self.chunks is not None and self.chunks.finished:
+                break
+
+        for (stream, lines) in sorted(self.lines.items()):
+            for line in self._split(stream, lines.flush()):
+                yield line
+        self.close()
+
+    def close(self):
+        self.socket.close()
+
+    def _read(self):
+        if self.buffered:
+            data, self.buffered = self.buffered, b''
+        elif self.chunks is not None:
+            data = self.socket.recv(READ_SIZE)
+        else:
+            return self.frames.read_from(self.socket)
+        if not data:
+            return None
+        if self.chunks is not None:
+            data = self.chunks.feed(data)
+        return self.frames.feed(data)
+
+    def _line_buffer(self, stream):
+        if stream not in self.lines:
+            self.lines[stream] = LineBuffer()
+        return self.lines[stream]
+
+    def _split(self, stream, chunk):
+        result = []
+        for line in split_lines(chunk):
+            stamp, _, line = line.partition(b' ')
+            key = timestamp_key(stamp)
+            if self.last_key is None or key > self.last_key:
+                self.last_key = key
+            result.append((key, self.index, next(self.seq), self, stream, line))
+        return result
+
+
+def split_lines(chunk):
+    """
+    The lines of `chunk`, each with its newline except perhaps the last.
+    """
+    if not chunk:
+        return []
+    lines = chunk.split(b'\n')
+    last = lines.pop()
+    lines = [line + b'\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def merge_history(readers):
+    """
+    Merge the lines of several HistoryReaders into timestamp order, yielding
+    `(reader, stream, chunk)` for each run of consecutive lines that came from
+    the same reader and stream, so they can be formatted in one go.
+    """
+    current, lines = None, []
+    for (_, _, _, reader, stream, line) in heapq.merge(*readers):
+        if (reader, stream) != current:
+            if lines:
+                yield current + (b''.join(lines),)
+            current, lines = (reader, stream), []
+        lines.append(line)
+    if lines:
+        yield current + (b''.join(lines),)
+
+
+def timestamp_key(stamp):
+    """
+    Docker's RFC 3339 timestamps are in UTC but leave trailing zeros off the
+    fraction of a second, so they don't sort as they are; pad it out to
+    nanoseconds.
+    """
+    seconds, _, fraction = stamp.rstrip(b'Z').partition(b'.')
+    return seconds + b'.' + fraction.ljust(9, b'0')
+
+
+def timestamp_seconds(key):
+    """
+    The whole seconds since the epoch of a timestamp key, for `since`.
+    """
+    seconds = key.partition(b'.')[0].decode('ascii')
+    return calendar.timegm(time.strptime(seconds, '%Y-%m-%dT%H:%M:%S'))
+
+
+PASS_THROUGH_SIZE = 1024 * 1024
+
+
+def pass_through(sock, fd, buffered=b'', chunked=False, tty=False, size=PASS_THROUGH_SIZE):
+    """
+    Copy a container's output from `sock` to the file descriptor `fd` as it
+    is, without splitting it into lines or queueing it for a writer thread.
+    Output from a container with a TTY that isn't chunked is received into a
+    buffer and written from it without ever being copied.
+    """
+    for data in raw_output(sock, buffered, chunked, tty, size):
+        while data:
+            data = data[os.write(fd, data):]
+
+
+def raw_output(sock, buffered, chunked, tty, size):
+    sock.settimeout(None)
+    frames = FrameReader(tty=tty, size=size)
+    chunks = ChunkedDecoder() if chunked else None
+    view = memoryview(bytearray(size)) if tty and not chunked else None
+    data = buffered
+
+    while True:
+        if data:
+            if chunks is not None:
+                data = chunks.feed(data)
+            payloads = frames.feed(data)
+            data = b''
+        elif chunks is not None:
+            if chunks.finished:
+                return
+            data = sock.recv(size)
+            if not data:
+                return
+            continue
+        elif view is not None:
+            received = sock.recv_into(view)
+            if not received:
+                return
+            payloads = [(STDOUT, view[:received])]
+        else:
+            payloads = frames.read_from(sock)
+            if payloads is None:
+                return
+
+        for (_, payload) in payloads:
+            yield payload
+
+
+class TextFormatter(object):
+    """
+    Formats output as lines prefixed with the (coloured) container name.
+    """
+    def __init__(self, container, prefix, color_fn):
+        self.container = container
+        self.prefix = color_fn(prefix).encode('utf-8')
+        self.color_fn = color_fn
+
+    def lines(self, stream, chunk):
+        if not self.prefix:
+            return chunk
+        return prefix_lines(self.prefix, chunk)
+
+    def notice(self, message):
+        return self.prefix + ("[%s]\n" % message).encode('utf-8')
+
+    def exit(self, exit_code):
+        message = "%s exited with code %s\n" % (self.container.name, exit_code)
+        return self.color_fn(message).encode('utf-8')
+
+
+class JsonFormatter(object):
+    """
+    Formats output as one compact JSON object per line, with the container's
+    name, service and number, the stream, the time fig received the line
+    and the line itself.
+    """
+    def __init__(self, container):
+        self.container = container
+        name = container.name_without_project
+        self.fields = {
+            'container': name,
+            'service': name.rsplit('_', 1)[0],
+            'number': container.number,
+        }
+        self.heads = {}
+
+    def lines(self, stream, chunk):
+        head = self._head(stream)
+        received = ',"time":"%s","message":' % timestamp()
+        lines = chunk.split(b'\n')
+        if not lines[-1]:
+            lines.pop()
+        return ''.join(
+            '%s%s%s}\n' % (head, received, json.dumps(line.decode('utf-8', 'replace')))
+            for line in lines
+        ).encode('utf-8')
+
+    def notice(self, message):
+        return self._event(event='notice', message=message)
+
+    def exit(self, exit_code):
+        return self._event(event='exit', exit_code=exit_code)
+
+    def _head(self, stream):
+        """
+        Everything up to the time, which is the same for every line read from
+        one stream, serialized once.
+        """
+        if stream not in self.heads:
+            fields = dict(self.fields, stream=STREAM_NAMES.get(stream, str(stream)))
+            self.heads[stream] = dumps(fields)[:-1]
+        return self.heads[stream]
+
+    def _event(self, **fields):
+        fields.update(self.fields, time=timestamp())
+        return (dumps(fields) + '\n').encode('utf-8')
+
+
+def dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True)
+
+
+def timestamp():
+    return datetime.datetime.utcfromtimestamp(time.time()).isoformat() + 'Z'
+
+
+class LineFilter(object):
+    """
+    Keep the lines of a chunk that match `grep` (if given) and don't match
+    `exclude` (if given). Matching is done on the raw bytes, and a chunk with
+    no match for `grep` anywhere in it is discarded without being split,
+    unless the pattern can look past the ends of a line.
+    """
+    def __init__(self, grep=None, exclude=None):
+        self.grep = grep
+        self.exclude = exclude
+        # Searching a whole chunk at once needs ^ and $ to match at each
+        # line in it, as they do when searching line by line. These are None
+        # when a search of the chunk could miss a line that matches.
+        self.chunk_grep = multiline(grep)
+        self.chunk_exclude = multiline(exclude)
+
+    def __call__(self, chunk):
+        if self.chunk_grep is not None and not self.chunk_grep.search(chunk):
+            return b''
+        if self.grep is None and self.chunk_exclude is not None and not self.chunk_exclude.search(chunk):
+            return chunk
+
+        lines = chunk.split(b'\n')
+        last = lines.pop()
+        kept = [line + b'\n' for line in lines if self.keep(line)]
+        if last and self.keep(last):
+            kept.append(last)
+        return b''.join(kept)
+
+    def keep(self, line):
+        if self.grep is not None and not self.grep.search(line):
+            return False
+        if self.exclude is not None and self.exclude.search(line):
+            return False
+        return True
+
+
+# \A and \Z match only at the ends of the chunk, and lookarounds see the
+# newlines either side of a line, so patterns with these have to be matched
+# line by line
+LINE_BOUNDS = re.compile(br'\\[AZ]|\(\?<?[=!]')
+
+
+def multiline(pattern):
+    if pattern is None or LINE_BOUNDS.search(pattern.pattern):
+        return None
+    return re.compile(pattern.pattern, pattern.flags | re.MULTILINE)
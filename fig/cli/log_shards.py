@@ -0,0 +1,159 @@
+"""
+Spread the work of reading and formatting containers' output across worker
+processes, for projects with more containers than one process can keep up
+with.
+
+Each worker reads its share of the containers and sends their formatted
+output to the parent over a pipe, in frames of `(container index, kind,
+length)` followed by the data. Every container is read by exactly one worker
+and a pipe delivers frames in order, so each container's output stays in
+order.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import multiprocessing
+import os
+import struct
+import sys
+
+from .log_printer import EXIT
+from .log_writer import LogWriter, BLOCK
+from .multiplexer import Multiplexer, STOP, DONE
+
+
+HEADER = struct.Struct(str('>HBL'))
+LINES = 0
+EXITED = 1
+READ_SIZE = 1024 * 1024
+
+
+def split(items, count):
+    """
+    Split `items` into `count` shards of nearly equal size.
+    """
+    return [items[i::count] for i in range(count)]
+
+
+def start_shard(entries, make_source, line_filter=None):
+    """
+    Start a worker process for `entries`, a list of `(index, container,
+    formatter)`, and return the ShardSource the parent reads its output from.
+    `make_source(container, formatter)` attaches to a container; it is
+    called in the worker.
+    """
+    read_fd, write_fd = os.pipe()
+    # Anything still buffered would otherwise be written by the worker too
+    sys.stdout.flush()
+    process = multiprocessing.Process(
+        target=run_shard,
+        args=(entries, make_source, line_filter, read_fd, write_fd),
+    )
+    process.daemon = True
+    process.start()
+    os.close(write_fd)
+    outputs = dict((index, ShardedOutput(container, formatter)) for (index, container, formatter) in entries)
+    return ShardSource(process, read_fd, outputs)
+
+
+def run_shard(entries, make_source, line_filter, read_fd, write_fd):
+    os.close(read_fd)
+    # Connections the parent had pooled were inherited, and requests from
+    # both processes over one would get each other's responses. Closing them
+    # here only closes the worker's copies, and it opens its own.
+    for client in set(container.client for (index, container, formatter) in entries):
+        client.close()
+    # Frames are written for their container, so that once the parent stops
+    # reading and a container's backlog fills up, the worker stops reading
+    # from it too. Dropping output would break the frames up, so the parent
+    # applies the overflow policy.
+    writer = LogWriter(os.fdopen(write_fd, 'wb'), policy=BLOCK).start()
+    try:
+        indexes = {}
+        for (index, container, formatter) in entries:
+            indexes[make_source(container, formatter)] = index
+
+        for source, stream, data in Multiplexer(list(indexes)).loop():
+            if stream == EXIT:
+                writer.write(frame(indexes[source], EXITED, str(data).encode('ascii')), source)
+                continue
+            if line_filter:
+                data = line_filter(data)
+            if data:
+                writer.write(frame(indexes[source], LINES, source.formatter.lines(stream, data)), source)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        writer.output.close()
+
+
+def frame(index, kind, data):
+    return HEADER.pack(index, kind, len(data)) + data
+
+
+class ShardSource(object):
+    """
+    Reads the frames a worker sends as a Multiplexer source, and turns them
+    back into the items a LogSource would have returned.
+    """
+    def __init__(self, process, fd, outputs):
+        self.process = process
+        self.fd = fd
+        self.outputs = outputs
+        self.buffer = bytearray()
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        data = os.read(self.fd, READ_SIZE)
+        if not data:
+            return [DONE]
+        self.buffer.extend(data)
+
+        items = []
+        start = 0
+        while len(self.buffer) - start >= HEADER.size:
+            index, kind, length = HEADER.unpack_from(self.buffer, start)
+            end = start + HEADER.size + length
+            if end > len(self.buffer):
+                break
+            payload = bytes(self.buffer[start + HEADER.size:end])
+            start = end
+            if kind == EXITED:
+                items.append((self.outputs[index], EXIT, int(payload)))
+                items.append(STOP)
+                break
+            items.append((self.outputs[index], None, payload))
+        del self.buffer[:start]
+        return items
+
+    def close(self):
+        os.close(self.fd)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+
+class ShardedOutput(object):
+    """
+    Stands in for a container's LogSource in the parent, where its output
+    arrives already formatted.
+    """
+    def __init__(self, container, formatter):
+        self.container = container
+        self.formatter = Preformatted(formatter)
+
+
+class Preformatted(object):
+    def __init__(self, formatter):
+        self.formatter = formatter
+
+    def lines(self, stream, chunk):
+        return chunk
+
+    def notice(self, message):
+        return self.formatter.notice(message)
+
+    def exit(self, exit_code):
+        return self.formatter.exit(exit_code)
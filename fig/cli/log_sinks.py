@@ -0,0 +1,309 @@
+"""
+Destinations for the output LogPrinter reads from containers.
+
+Every sink formats output in its own way and hands it to a LogWriter of its
+own, so it is written out on the sink's own thread. The file, syslog and
+store sinks drop the oldest output rather than block once their backlog is
+full. All sinks are fed from one thread, so a sink that blocks stops output
+being read for all of them; LogPrinter feeds the terminal last, and has it
+drop output too unless told otherwise when there are sinks that store it.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import gzip
+import os
+import shutil
+import socket
+import time
+
+from .log_writer import LogWriter, DROP
+from .utils import prefix_lines
+
+
+DEFAULT_KEEP = 5
+SYSLOG_PORT = 514
+
+# Syslog facility and severities (RFC 3164)
+USER = 1
+ERROR = 3
+WARNING = 4
+NOTICE = 5
+INFO = 6
+SEVERITIES = {1: INFO, 2: ERROR}
+
+
+class Sink(object):
+    """
+    Receives the output LogPrinter reads, on the thread that reads it, so
+    none of these methods should block for long. `source` has the
+    `container` the output came from and the `formatter` chosen for it.
+    """
+    # Whether this sink keeps output somewhere, which a blocked terminal
+    # would keep from it
+    stores_output = True
+
+    def start(self):
+        return self
+
+    def write(self, source, stream, chunk):
+        raise NotImplementedError
+
+    def exit(self, source, exit_code):
+        pass
+
+    def close(self):
+        pass
+
+    def log_writers(self):
+        """
+        The LogWriters this sink writes through, to report on their backlog.
+        """
+        return []
+
+
+class ContainerOutputs(object):
+    """
+    The output for a LogWriter split by `container_name`, that writes each
+    container's output to a file-like object of its own, opened with
+    `open_output(name)` the first time the container has output.
+    """
+    def __init__(self, open_output):
+        self.open_output = open_output
+        self.outputs = {}
+        self.written = set()
+
+    def write(self, data, name):
+        if name not in self.outputs:
+            self.outputs[name] = self.open_output(name)
+        self.outputs[name].write(data)
+        self.written.add(name)
+
+    def flush(self):
+        for name in self.written:
+            self.outputs[name].flush()
+        self.written.clear()
+
+    def close(self):
+        for output in self.outputs.values():
+            output.close()
+
+
+class StreamSink(Sink):
+    """
+    Writes formatted output to a file object, normally the terminal.
+    """
+    def __init__(self, output, **writer_options):
+        self.writer = LogWriter(output, format_notice=format_notice, **writer_options)
+
+    def start(self):
+        self.writer.start()
+        return self
+
+    def write(self, source, stream, chunk):
+        self.writer.write(source.formatter.lines(stream, chunk), source)
+
+    def exit(self, source, exit_code):
+        # Not attributed to the source, so that it is never dropped
+        self.writer.write(source.formatter.exit(exit_code))
+
+    def close(self):
+        self.writer.close()
+
+    def log_writers(self):
+        return [self.writer]
+
+
+class FileSink(Sink):
+    """
+    Writes each container's output as it is, without prefixes, to a file
+    named after the container in `directory`. See RotatingFile for the
+    rotation options. All the files are written by one LogWriter.
+    """
+    def __init__(self, directory, max_size=None, max_age=None, compress=False, keep=DEFAULT_KEEP,
+                 policy=DROP, **writer_options):
+        self.directory = directory
+        self.file_options = dict(max_size=max_size, max_age=max_age, compress=compress, keep=keep)
+        self.files = ContainerOutputs(self._open_file)
+        self.writer = LogWriter(self.files, policy=policy, split_by=container_name, **writer_options)
+
+    def start(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.writer.start()
+        return self
+
+    def write(self, source, stream, chunk):
+        self.writer.write(chunk, source)
+
+    def exit(self, source, exit_code):
+        message = "[%s exited with code %s]\n" % (source.container.name, exit_code)
+        self.writer.write(message.encode('utf-8'), source, exempt=True)
+
+    def close(self):
+        self.writer.close()
+        self.files.close()
+
+    def log_writers(self):
+        return [self.writer]
+
+    def _open_file(self, name):
+        return RotatingFile(os.path.join(self.directory, name + '.log'), **self.file_options)
+
+
+class RotatingFile(object):
+    """
+    A file that is appended to, and rotated before a write would take it
+    past `max_size` bytes or once it has been open for `max_age` seconds.
+    Rotated files are numbered from 1, the most recent, and only `keep` of
+    them are kept. With `compress` they are gzipped as they are rotated.
+    """
+    def __init__(self, path, max_size=None, max_age=None, compress=False, keep=DEFAULT_KEEP):
+        if keep < 1:
+            raise ValueError("keep should be at least 1")
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.compress = compress
+        self.keep = keep
+        self._open()
+
+    def write(self, data):
+        if self._should_rotate(len(data)):
+            self.rotate()
+        self.file.write(data)
+        self.size += len(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def rotate(self):
+        self.file.close()
+        suffix = '.gz' if self.compress else ''
+        for number in range(self.keep - 1, 0, -1):
+            older = '%s.%d%s' % (self.path, number, suffix)
+            if os.path.exists(older):
+                os.rename(older, '%s.%d%s' % (self.path, number + 1, suffix))
+
+        if self.compress:
+            gzip_file(self.path, '%s.1.gz' % self.path)
+            os.remove(self.path)
+        else:
+            os.rename(self.path, '%s.1' % self.path)
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, 'ab')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.opened = time.time()
+
+    def _should_rotate(self, size):
+        if not self.size:
+            return False
+        if self.max_size is not None and self.size + size > self.max_size:
+            return True
+        return self.max_age is not None and time.time() - self.opened >= self.max_age
+
+
+def gzip_file(source, destination):
+    with open(source, 'rb') as src:
+        dst = gzip.open(destination, 'wb')
+        try:
+            shutil.copyfileobj(src, dst)
+        finally:
+            dst.close()
+
+
+class SyslogSink(Sink):
+    """
+    Sends every line to a syslog server over UDP in the BSD syslog format
+    (RFC 3164), tagged with the name of the container. stdout is logged with
+    severity info and stderr with severity error.
+    """
+    def __init__(self, address, facility=USER, hostname=None, policy=DROP, **writer_options):
+        self.output = SyslogOutput(address)
+        self.facility = facility
+        self.hostname = hostname or socket.gethostname()
+        self.writer = LogWriter(self.output, policy=policy, format_notice=self._format_notice, **writer_options)
+
+    def start(self):
+        self.writer.start()
+        return self
+
+    def write(self, source, stream, chunk):
+        self.writer.write(self._messages(source.container, SEVERITIES.get(stream, INFO), chunk), source)
+
+    def exit(self, source, exit_code):
+        message = "exited with code %s\n" % exit_code
+        self.writer.write(self._messages(source.container, NOTICE, message.encode('utf-8')))
+
+    def close(self):
+        self.writer.close()
+        self.output.close()
+
+    def log_writers(self):
+        return [self.writer]
+
+    def _messages(self, container, severity, chunk):
+        now = time.localtime()
+        # The day of the month is padded with a space, not a zero
+        stamp = '%s %2d %s' % (time.strftime('%b', now), now.tm_mday, time.strftime('%H:%M:%S', now))
+        head = '<%d>%s %s %s: ' % (self.facility * 8 + severity, stamp, self.hostname, container.name)
+        if not chunk.endswith(b'\n'):
+            chunk += b'\n'
+        return prefix_lines(head.encode('utf-8'), chunk)
+
+    def _format_notice(self, source, message):
+        return self._messages(source.container, WARNING, message.encode('utf-8'))
+
+
+class SyslogOutput(object):
+    """
+    A file-like object that sends each line written to it as a datagram.
+    Syslog over UDP is best effort, so errors sending are ignored.
+    """
+    def __init__(self, address):
+        host, port = address
+        family, _, _, _, self.address = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0]
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+
+    def write(self, data):
+        for line in data.split(b'\n'):
+            if not line:
+                continue
+            try:
+                self.socket.sendto(line, self.address)
+            except socket.error:
+                pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.socket.close()
+
+
+def parse_address(value, default_port=SYSLOG_PORT):
+    """
+    Parse HOST, HOST:PORT or :PORT into a (host, port) pair. The host is
+    empty with :PORT.
+    """
+    host, separator, port = value.rpartition(':')
+    if not separator:
+        return value, default_port
+    try:
+        return host.strip('[]'), int(port)
+    except ValueError:
+        raise ValueError('Invalid port in "%s"' % value)
+
+
+def container_name(source):
+    return source.container.name
+
+
+def format_notice(source, message):
+    if source is None:
+        return ("[%s]\n" % message).encode('utf-8')
+    return source.formatter.notice(message)
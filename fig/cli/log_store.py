@@ -0,0 +1,332 @@
+"""
+A local, append-only store of container output that can be searched without
+going back to Docker.
+
+Each container's output goes into a directory named after it, split into
+segments that each cover one time window and are named after the time it
+starts at. Every line is stored as `<time> <stream> <line>`. As a segment
+is written, the time range it covers and the set of trigrams that appear in
+its lines are kept track of, and written to an index next to it when it is
+finished with, so that searches can skip segments that are too old or can't
+contain what they are looking for.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import base64
+import bisect
+import heapq
+import json
+import mmap
+import os
+import time
+from array import array
+
+import six
+from six.moves import zip
+
+from .log_sinks import ContainerOutputs, Sink, container_name
+from .log_writer import LogWriter, DROP
+from .utils import prefix_lines
+
+
+DEFAULT_WINDOW = 60 * 60
+SEGMENT_SUFFIX = '.log'
+INDEX_SUFFIX = '.idx'
+
+
+class StoreSink(Sink):
+    """
+    Appends the output of each container to the store in `directory`, all
+    through one LogWriter.
+    """
+    def __init__(self, directory, window=DEFAULT_WINDOW, policy=DROP, **writer_options):
+        self.store = LogStore(directory, window)
+        self.segments = ContainerOutputs(self._open_segments)
+        self.writer = LogWriter(self.segments, policy=policy, split_by=container_name, **writer_options)
+
+    def start(self):
+        self.writer.start()
+        return self
+
+    def write(self, source, stream, chunk):
+        head = ('%.6f %d ' % (time.time(), stream)).encode('ascii')
+        if not chunk.endswith(b'\n'):
+            chunk += b'\n'
+        self.writer.write(prefix_lines(head, chunk), source)
+
+    def close(self):
+        self.writer.close()
+        self.segments.close()
+
+    def log_writers(self):
+        return [self.writer]
+
+    def _open_segments(self, name):
+        return SegmentWriter(self.store.path(name), self.store.window)
+
+
+class SegmentWriter(object):
+    """
+    A file-like object that appends records to the segment for the time
+    window they were stored in, in `directory`, and indexes each segment as
+    it is written, so that the index only has to be saved once it moves on
+    to the next one or is closed.
+    """
+    def __init__(self, directory, window):
+        self.directory = directory
+        self.window = window
+        self.file = None
+        self.start = None
+        self.index = None
+
+    def write(self, data):
+        for (start, records) in split_windows(data, self.window):
+            if start != self.start:
+                self._close_segment()
+                self._open_segment(start)
+            self.file.write(records)
+            if self.index is not None:
+                self.index.add(records)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        self._close_segment()
+
+    def _open_segment(self, start):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = os.path.join(self.directory, '%d%s' % (start, SEGMENT_SUFFIX))
+        # Appending to a segment makes any index of it out of date
+        if os.path.exists(path + INDEX_SUFFIX):
+            os.remove(path + INDEX_SUFFIX)
+        self.file = open(path, 'ab')
+        self.start = start
+        # Only a segment this writer has written all of can be indexed
+        # without reading it back, and the rest are searched in full
+        self.index = SegmentIndex() if os.path.getsize(path) == 0 else None
+
+    def _close_segment(self):
+        if self.file is None:
+            return
+        self.file.close()
+        index, self.index = self.index, None
+        if index is not None and os.path.getsize(self.file.name) == index.size:
+            index.write(self.file.name + INDEX_SUFFIX)
+        self.file = None
+        self.start = None
+
+
+class SegmentIndex(object):
+    """
+    The time of the first and last records of a segment, its number of
+    records and the trigrams that appear in their lines, kept up to date as
+    whole records are appended to it.
+    """
+    def __init__(self):
+        self.start = None
+        self.end = None
+        self.lines = 0
+        self.size = 0
+        self.grams = set()
+
+    def add(self, data):
+        if not data:
+            return
+        self.size += len(data)
+        self.lines += data.count(b'\n')
+
+        first = first_record(data)
+        if self.start is None and first is not None:
+            self.start = first[0]
+        last = last_record(data)
+        if last is not None:
+            self.end = last[0]
+
+        # Only lines are searched, not the time and stream in front of them,
+        # and the same lines tend to be logged over and over, so the
+        # trigrams of each distinct line in a write are worked out once
+        for line in set(record.split(b' ', 2)[-1] for record in data.split(b'\n')):
+            self.grams.update(trigrams(line))
+
+    def write(self, path):
+        if self.start is None or self.end is None:
+            return
+        grams = array(str('I'), trigram_numbers(self.grams))
+        index = {
+            'start': self.start,
+            'end': self.end,
+            'lines': self.lines,
+            'trigrams': base64.b64encode(grams.tobytes() if six.PY3 else grams.tostring()).decode('ascii'),
+        }
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(index, f)
+        os.rename(temporary, path)
+
+
+class LogStore(object):
+    def __init__(self, directory, window=DEFAULT_WINDOW):
+        self.directory = directory
+        self.window = window
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if os.path.isdir(self.path(name))
+        )
+
+    def search(self, needle, since=None, names=None):
+        """
+        Yield `(time, name, stream, line)` for every stored line containing
+        the byte string `needle`, stored at or after `since`, from the
+        containers called `names` (or all of them), in time order.
+        """
+        if names is None:
+            names = self.names()
+        grams = trigram_numbers(trigrams(needle))
+        return heapq.merge(*[self._search(name, needle, since, grams) for name in names])
+
+    def _search(self, name, needle, since, grams):
+        for segment in self._segments(name, since):
+            index = read_index(segment)
+            if index is not None:
+                if since is not None and index['end'] < since:
+                    continue
+                if not contains_all(index['trigrams'], grams):
+                    continue
+            for match in search_segment(segment, needle, since, name):
+                yield match
+
+    def _segments(self, name, since):
+        directory = self.path(name)
+        if not os.path.isdir(directory):
+            return []
+        starts = sorted(
+            int(filename[:-len(SEGMENT_SUFFIX)]) for filename in os.listdir(directory)
+            if filename.endswith(SEGMENT_SUFFIX)
+        )
+        return [
+            os.path.join(directory, '%d%s' % (start, SEGMENT_SUFFIX)) for start in starts
+            if since is None or start + self.window > since
+        ]
+
+
+def search_segment(path, needle, since, name):
+    """
+    Find `needle` with mmap.find(), so that only the lines that contain it
+    are ever split out and parsed.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = data.find(needle)
+            while offset != -1:
+                start = data.rfind(b'\n', 0, offset) + 1
+                end = data.find(b'\n', offset)
+                if end == -1:
+                    end = len(data)
+                record = parse_record(data[start:end])
+                if record is not None and needle in record[2] and (since is None or record[0] >= since):
+                    yield (record[0], name, record[1], record[2])
+                offset = data.find(needle, end)
+        finally:
+            data.close()
+
+
+def split_windows(data, window):
+    """
+    Split whole records into runs of those stored in the same time window,
+    as `(start of the window, records)`.
+    """
+    first, last = first_record(data), last_record(data)
+    if first is None or last is None:
+        return [(window_start(time.time(), window), data)]
+    start = window_start(first[0], window)
+    if window_start(last[0], window) == start:
+        return [(start, data)]
+
+    runs = []
+    for record in data[:-1].split(b'\n'):
+        parsed = parse_record(record)
+        if parsed is not None:
+            start = window_start(parsed[0], window)
+        if runs and runs[-1][0] == start:
+            runs[-1][1].append(record)
+        else:
+            runs.append((start, [record]))
+    return [(run_start, b'\n'.join(records) + b'\n') for (run_start, records) in runs]
+
+
+def window_start(stamp, window):
+    return int(stamp // window * window)
+
+
+def first_record(data):
+    end = data.find(b'\n')
+    return parse_record(data if end == -1 else data[:end])
+
+
+def last_record(data):
+    return parse_record(data[data.rfind(b'\n', 0, len(data) - 1) + 1:].rstrip(b'\n'))
+
+
+def parse_record(record):
+    try:
+        stamp, stream, line = record.split(b' ', 2)
+        return float(stamp), int(stream), line
+    except ValueError:
+        return None
+
+
+def read_index(path):
+    try:
+        with open(path + INDEX_SUFFIX) as f:
+            index = json.load(f)
+    except (IOError, ValueError):
+        return None
+    grams = array(str('I'))
+    data = base64.b64decode(index['trigrams'])
+    if six.PY3:
+        grams.frombytes(data)
+    else:
+        grams.fromstring(data)
+    index['trigrams'] = grams
+    return index
+
+
+def trigrams(data):
+    # zip() walks the three offsets in C, rather than slicing at every byte
+    return set(zip(data, data[1:], data[2:]))
+
+
+def trigram_numbers(grams):
+    """
+    Sorted trigrams as integers, which take a quarter of the space of
+    strings in an index and can be searched with bisect.
+    """
+    return sorted(
+        (byte_value(gram[0]) << 16) | (byte_value(gram[1]) << 8) | byte_value(gram[2])
+        for gram in grams
+    )
+
+
+def byte_value(byte):
+    return byte if isinstance(byte, int) else ord(byte)
+
+
+def contains_all(sorted_numbers, numbers):
+    for number in numbers:
+        i = bisect.bisect_left(sorted_numbers, number)
+        if i == len(sorted_numbers) or sorted_numbers[i] != number:
+            return False
+    return True
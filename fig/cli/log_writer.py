@@ -0,0 +1,241 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from collections import deque, OrderedDict
+from threading import Condition, Thread
+import time
+
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_BACKLOG = 1024 * 1024
+DEFAULT_RATE = 1000
+
+# What to do when a source has more than `backlog` bytes waiting to be written.
+BLOCK = 'block'    # make the caller wait, which stops reading from the container
+DROP = 'drop'      # throw away the oldest buffered output for that source
+SAMPLE = 'sample'  # limit each source to `rate` lines per second, drop the rest
+POLICIES = (BLOCK, DROP, SAMPLE)
+
+
+class LogWriter(object):
+    """
+    Coalesce log output into large writes on a background thread.
+
+    Buffered data is written out as soon as `buffer_size` bytes are pending
+    or `flush_interval` seconds have passed since the oldest pending write,
+    whichever comes first. `close()` writes out anything that is left.
+
+    Output is buffered separately for each source, and no source may have
+    more than `backlog` bytes waiting; `policy` decides what happens when it
+    would. Lines that are dropped are counted, and a notice produced by
+    `format_notice(source, message)` is written in their place.
+
+    With `split_by`, output is written separately for each value of
+    `split_by(source)`, as `output.write(data, key)`, so that one writer can
+    keep many sources apart, such as in a file for each container.
+    """
+    def __init__(self, output, buffer_size=DEFAULT_BUFFER_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 backlog=DEFAULT_BACKLOG, policy=BLOCK, rate=DEFAULT_RATE, format_notice=None,
+                 split_by=None):
+        if policy not in POLICIES:
+            raise ValueError("Unknown overflow policy: %s" % policy)
+        self.output = output
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.backlog = backlog
+        self.policy = policy
+        self.rate = rate
+        self.format_notice = format_notice or default_notice
+        self.split_by = split_by
+        self.condition = Condition()
+        self.queues = {}
+        self.sizes = {}
+        self.order = deque()
+        self.stale = {}
+        self.pending_size = 0
+        self.pending_since = None
+        self.dropped = {}
+        self.dropped_lines = 0
+        self.buckets = {}
+        self.closed = False
+        self.thread = Thread(target=self._run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def write(self, data, source=None, exempt=False):
+        """
+        Buffer `data` from `source`. `exempt` data is left alone by the
+        overflow policy, for messages that should never be dropped.
+        """
+        with self.condition:
+            dropped = b''
+            if source is not None and not exempt:
+                data, dropped = self._apply_policy(source, data)
+            was_idle = not self.order
+            if data:
+                self._append(source, data)
+            if dropped:
+                self._count_dropped(source, dropped)
+            # Wake the writer thread to start the flush interval, or to write
+            # a full buffer straight away
+            if (was_idle and self.order) or self.pending_size >= self.buffer_size:
+                self.condition.notify_all()
+
+    def backlog_size(self, source):
+        with self.condition:
+            return self._queue_size(source)
+
+    def stats(self):
+        """
+        The bytes waiting to be written, and the lines dropped since the start.
+        """
+        with self.condition:
+            return {'pending': self.pending_size, 'dropped': self.dropped_lines}
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread.is_alive():
+            self.thread.join()
+        else:
+            self._write(self._take_pending())
+
+    def _apply_policy(self, source, data):
+        """
+        Return the part of `data` to keep and the part that was dropped.
+        """
+        if self.policy == SAMPLE:
+            data, dropped = self._sample(source, data)
+            if self._queue_size(source) + len(data) > self.backlog:
+                return b'', data + dropped
+            return data, dropped
+        elif self.policy == DROP:
+            queue = self.queues.get(source)
+            while queue and self._queue_size(source) + len(data) > self.backlog:
+                notices, old = queue.popleft()
+                self.sizes[source] -= len(old)
+                self.pending_size -= len(old)
+                self.stale[source] = self.stale.get(source, 0) + 1
+                self.dropped[source] = self.dropped.get(source, 0) + notices
+                self._count_dropped(source, old)
+        else:
+            while (self._queue_size(source) > 0
+                    and self._queue_size(source) + len(data) > self.backlog
+                    and not self.closed):
+                self.condition.notify_all()
+                # Wait with a timeout so that Ctrl+C still gets through
+                self.condition.wait(self.flush_interval)
+        return data, b''
+
+    def _sample(self, source, data):
+        """
+        Token bucket allowing `rate` lines per second, with bursts of up to
+        one second's worth.
+        """
+        now = time.time()
+        tokens, last = self.buckets.get(source, (self.rate, now))
+        tokens = min(self.rate, tokens + (now - last) * self.rate)
+
+        lines = count_lines(data)
+        if lines <= tokens:
+            self.buckets[source] = (tokens - lines, now)
+            return data, b''
+
+        keep = int(tokens)
+        end = 0
+        for _ in range(keep):
+            end = data.index(b'\n', end) + 1
+        self.buckets[source] = (tokens - keep, now)
+        return data[:end], data[end:]
+
+    def _count_dropped(self, source, data):
+        lines = count_lines(data)
+        self.dropped[source] = self.dropped.get(source, 0) + lines
+        self.dropped_lines += lines
+
+    def _queue_size(self, source):
+        return self.sizes.get(source, 0)
+
+    def _append(self, source, data):
+        if not self.order:
+            self.pending_since = time.time()
+        # Lines dropped so far are reported just ahead of this chunk
+        self.queues.setdefault(source, deque()).append((self.dropped.pop(source, 0), data))
+        self.sizes[source] = self.sizes.get(source, 0) + len(data)
+        if self.stale.get(source):
+            self.stale[source] -= 1
+        else:
+            self.order.append(source)
+        self.pending_size += len(data)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self._wait_for_flush()
+                batch = self._take_pending()
+                closed = self.closed
+                self.condition.notify_all()
+
+            self._write(batch)
+            if closed:
+                return
+
+    def _wait_for_flush(self):
+        while not self.closed and self.pending_size < self.buffer_size:
+            if not self.order:
+                self.condition.wait()
+                continue
+            remaining = self.pending_since + self.flush_interval - time.time()
+            if remaining <= 0:
+                return
+            self.condition.wait(remaining)
+
+    def _take_pending(self):
+        batch = []
+        while self.order:
+            source = self.order.popleft()
+            queue = self.queues.get(source)
+            if not queue:
+                continue
+            dropped, data = queue.popleft()
+            self._add_notice(source, dropped, batch)
+            batch.append((source, data))
+
+        if self.closed:
+            for source in list(self.dropped):
+                self._add_notice(source, self.dropped.pop(source), batch)
+
+        self.stale.clear()
+        self.sizes.clear()
+        self.pending_size = 0
+        self.pending_since = None
+        return batch
+
+    def _add_notice(self, source, dropped, batch):
+        if dropped:
+            batch.append((source, self.format_notice(source, "dropped %d lines" % dropped)))
+
+    def _write(self, batch):
+        if not batch:
+            return
+        if self.split_by is not None:
+            chunks = OrderedDict()
+            for (source, data) in batch:
+                chunks.setdefault(self.split_by(source), []).append(data)
+            for (key, data) in chunks.items():
+                self.output.write(b''.join(data), key)
+        else:
+            self.output.write(b''.join(data for (source, data) in batch))
+        self.output.flush()
+
+
+def count_lines(data):
+    return data.count(b'\n') or (1 if data else 0)
+
+
+def default_notice(source, message):
+    return ("[%s]\n" % message).encode('utf-8')
@@ -1,24 +1,37 @@
 from __future__ import print_function
 from __future__ import unicode_literals
+import json
 import logging
 import sys
 import re
 import signal
+import socket
 
 from inspect import getdoc
 import dockerpty
+import six
 
 from .. import __version__
+from .. import history
+from ..timings import Timings
 from ..project import NoSuchService, ConfigurationError
 from ..service import BuildError, CannotBeScaledError
 from .command import Command
 from .formatter import Formatter
-from .log_printer import LogPrinter
-from .utils import yesno
+from .instrumentation import Instrumentation, OutputCounter, DEFAULT_INTERVAL as DEFAULT_STATS_INTERVAL
+from .log_printer import LogPrinter, FORMATS, JSON
+from .log_sinks import FileSink, SyslogSink, parse_address
+from .log_store import LogStore, StoreSink
+from .log_writer import POLICIES
+from .metrics_proxy import MetricsProxy, format_seconds
+from .prometheus import Collector, MetricsServer, DEFAULT_PORT as DEFAULT_METRICS_PORT
+from .trace_proxy import TraceProxy
+from .utils import yesno, parse_since
+from .verbose_proxy import VerboseProxy
 
 from docker.errors import APIError
 from .errors import UserError
-from .docopt_command import NoSuchCommand
+from .docopt_command import NoSuchCommand, docopt_full_help
 
 log = logging.getLogger(__name__)
 
@@ -75,6 +88,9 @@ class TopLevelCommand(Command):
 
     Options:
       --verbose                 Show more output
+      --profile                 Print a summary of the Docker API calls made on exit
+      --trace FILE              Write a trace of what fig spent its time on to FILE,
+                                in Chrome's trace_event format
       --version                 Print version and exit
       -f, --file FILE           Specify an alternate fig file (default: fig.yml)
       -p, --project-name NAME   Specify an alternate project name (default: directory name)
@@ -84,6 +100,7 @@ class TopLevelCommand(Command):
       help      Get help on a command
       kill      Kill containers
       logs      View output from containers
+      perf      Show how long services have been taking to start
       port      Print the public port for a port binding
       ps        List containers
       rm        Remove stopped containers
@@ -141,13 +158,93 @@ class TopLevelCommand(Command):
         Usage: logs [options] [SERVICE...]
 
         Options:
-            --no-color  Produce monochrome output.
+            --no-color           Produce monochrome output.
+            --no-prefix          Don't prefix lines with the container name.
+            --tail=N             Only show the last N lines of each
+                                 container's history.
+            --since=TIME         Only show output since TIME: a Unix
+                                 timestamp, a date such as 2014-08-01T10:00:00
+                                 (UTC) or a duration such as 10m or 2h.
+            --no-follow          Show the history and exit instead of
+                                 following new output.
+            --merge              Show the history of all containers in the
+                                 order it was written, then follow new
+                                 output.
+            --grep=PATTERN       Only show lines matching the regular
+                                 expression PATTERN. Each line is matched
+                                 on its own, without its newline.
+            --exclude=PATTERN    Don't show lines matching the regular
+                                 expression PATTERN.
+            --format=FORMAT      Output format: text, or json for one JSON
+                                 object per line (default: text).
+            --stdout-only        Only show what containers write to stdout.
+            --stderr-only        Only show what containers write to stderr.
+            --buffer-size=BYTES  Write output once this many bytes are
+                                 buffered (default: 65536).
+            --flush-interval=MS  Write buffered output at least this often,
+                                 in milliseconds (default: 50).
+            --backlog=BYTES      Maximum output to hold for each container
+                                 while the terminal catches up
+                                 (default: 1048576).
+            --overflow=POLICY    What to do when a container's backlog is
+                                 full: block, drop (oldest output first) or
+                                 sample (default: block, or drop with
+                                 --log-dir, --syslog or --store).
+            --rate=LINES         Lines per second to keep from each container
+                                 with --overflow=sample (default: 1000).
+            --shards=N           Read and format output in N worker
+                                 processes, for projects with very many
+                                 containers (default: 1).
+            --log-dir=DIR        Also write each container's output to a
+                                 file in DIR.
+            --log-max-size=BYTES Rotate files in --log-dir once they would
+                                 grow past this size.
+            --log-max-age=SECS   Rotate files in --log-dir once they are
+                                 this old.
+            --log-gzip           Compress files in --log-dir as they are
+                                 rotated.
+            --syslog=HOST:PORT   Also send output to a syslog server over
+                                 UDP (default port: 514).
+            --store=DIR          Also keep output in an indexed store in DIR.
+            --search=TEXT        Print the lines containing TEXT from the
+                                 store given with --store, instead of
+                                 reading output from Docker. Combine with
+                                 --since to only search recent output.
         """
+        if options['--search'] is not None:
+            return search_store(project, options)
+
         containers = project.containers(service_names=options['SERVICE'], stopped=True)
+        printer_options = log_printer_options(options)
+
+        print_status("Attaching to %s" % list_containers(containers), printer_options)
+        LogPrinter(
+            containers,
+            attach_params={'logs': True},
+            log_params=log_params(options),
+            merge=options['--merge'],
+            **printer_options
+        ).run()
+
+    def perf(self, project, options):
+        """
+        Look into how long services have been taking to start, from the
+        timings fig keeps after each command that builds, pulls, creates or
+        starts containers.
 
-        monochrome = options['--no-color']
-        print("Attaching to", list_containers(containers))
-        LogPrinter(containers, attach_params={'logs': True}, monochrome=monochrome).run()
+        Timings are kept in ~/.fig/history.jsonl, or the file given by
+        FIG_HISTORY_FILE; set it to an empty string to stop keeping them.
+
+        Usage: perf COMMAND [ARGS...]
+
+        Commands:
+          history   Show trends and flag services that have got slower
+        """
+        command = options['COMMAND']
+        if command not in PERF_COMMANDS:
+            raise NoSuchCommand(command, self.perf)
+        handler = PERF_COMMANDS[command]
+        handler(project, docopt_full_help(getdoc(handler), options['ARGS'], options_first=True))
 
     def port(self, project, options):
         """
@@ -353,43 +450,454 @@ class TopLevelCommand(Command):
         Usage: up [options] [SERVICE...]
 
         Options:
-            -d             Detached mode: Run containers in the background,
-                           print new container names.
-            --no-color     Produce monochrome output.
-            --no-deps      Don't start linked services.
-            --no-recreate  If containers already exist, don't recreate them.
+            -d                   Detached mode: Run containers in the background,
+                                 print new container names.
+            --no-color           Produce monochrome output.
+            --no-deps            Don't start linked services.
+            --no-recreate        If containers already exist, don't recreate them.
+            --buffer-size=BYTES  Write output once this many bytes are
+                                 buffered (default: 65536).
+            --flush-interval=MS  Write buffered output at least this often,
+                                 in milliseconds (default: 50).
+            --backlog=BYTES      Maximum output to hold for each container
+                                 while the terminal catches up
+                                 (default: 1048576).
+            --overflow=POLICY    What to do when a container's backlog is
+                                 full: block, drop (oldest output first) or
+                                 sample (default: block, or drop with
+                                 --log-dir, --syslog or --store).
+            --rate=LINES         Lines per second to keep from each container
+                                 with --overflow=sample (default: 1000).
+            --shards=N           Read and format output in N worker
+                                 processes, for projects with very many
+                                 containers (default: 1).
+            --format=FORMAT      Output format: text, or json for one JSON
+                                 object per line (default: text).
+            --log-dir=DIR        Also write each container's output to a
+                                 file in DIR.
+            --log-max-size=BYTES Rotate files in --log-dir once they would
+                                 grow past this size.
+            --log-max-age=SECS   Rotate files in --log-dir once they are
+                                 this old.
+            --log-gzip           Compress files in --log-dir as they are
+                                 rotated.
+            --syslog=HOST:PORT   Also send output to a syslog server over
+                                 UDP (default port: 514).
+            --store=DIR          Also keep output in an indexed store in DIR,
+                                 for `fig logs --search`.
+            --stats-file=FILE    Write memory, thread and output statistics
+                                 as JSON to FILE (- for stderr) every so
+                                 often and whenever fig receives SIGUSR1.
+            --stats-interval=SECS
+                                 How often to write statistics to the
+                                 stats file (default: 60).
+            --metrics-addr=HOST:PORT
+                                 Serve metrics for Prometheus at
+                                 http://HOST:PORT/metrics while attached
+                                 (default port: 9100). Leave out HOST, as
+                                 in :9100, to serve on all interfaces.
+            --timings            Print when each service started and was
+                                 ready, and the critical path through the
+                                 services' dependencies.
+            --timings-file=FILE  Write the same timings to FILE as JSON.
         """
         detached = options['-d']
-
-        monochrome = options['--no-color']
+        if detached and options['--metrics-addr'] is not None:
+            raise UserError('--metrics-addr can\'t be used with -d')
 
         start_links = not options['--no-deps']
         recreate = not options['--no-recreate']
         service_names = options['SERVICE']
 
+        timings = None
+        if options['--timings'] or options['--timings-file'] is not None:
+            timings = Timings()
+
+        if not detached:
+            printer_options = log_printer_options(options)
+            instrumentation = make_instrumentation(options, printer_options)
+            counter = make_output_counter(options, printer_options)
+
         project.up(
             service_names=service_names,
             start_links=start_links,
-            recreate=recreate
+            recreate=recreate,
+            timings=timings,
         )
 
+        if timings is not None:
+            report_timings(timings.report(), options)
+
         to_attach = [c for s in project.get_services(service_names) for c in s.containers()]
 
         if not detached:
-            print("Attaching to", list_containers(to_attach))
-            log_printer = LogPrinter(to_attach, attach_params={"logs": True}, monochrome=monochrome)
-
+            print_status("Attaching to %s" % list_containers(to_attach), printer_options)
+            log_printer = LogPrinter(to_attach, attach_params={"logs": True}, **printer_options)
+
+            if instrumentation is not None:
+                instrumentation.start(log_printer.sinks)
+            server = None
+            if counter is not None:
+                server = start_metrics_server(options['--metrics-addr'], project, counter, log_printer.sinks)
             try:
                 log_printer.run()
             finally:
+                if server is not None:
+                    server.stop()
+                if instrumentation is not None:
+                    instrumentation.stop()
+
                 def handler(signal, frame):
                     project.kill(service_names=service_names)
                     sys.exit(0)
                 signal.signal(signal.SIGINT, handler)
 
-                print("Gracefully stopping... (press Ctrl+C again to force)")
+                print_status("Gracefully stopping... (press Ctrl+C again to force)", printer_options)
                 project.stop(service_names=service_names)
 
 
 def list_containers(containers):
     return ", ".join(c.name for c in containers)
+
+
+def print_status(message, printer_options):
+    """
+    Print a message about what fig is doing, to stderr if stdout is to hold
+    nothing but containers' output: JSON lines with --format json, or the
+    output as it is with --no-prefix.
+    """
+    if printer_options.get('format') == JSON or not printer_options.get('prefix', True):
+        print(message, file=sys.stderr)
+    else:
+        print(message)
+
+
+def log_printer_options(options):
+    """
+    Translate the output options shared by `logs` and `up` into keyword
+    arguments for LogPrinter.
+    """
+    kwargs = {'monochrome': options['--no-color']}
+
+    if options.get('--no-prefix'):
+        kwargs['prefix'] = False
+
+    if options.get('--buffer-size') is not None:
+        kwargs['buffer_size'] = parse_positive_int('--buffer-size', options['--buffer-size'])
+
+    if options.get('--flush-interval') is not None:
+        kwargs['flush_interval'] = parse_positive_int('--flush-interval', options['--flush-interval']) / 1000.0
+
+    if options.get('--backlog') is not None:
+        kwargs['backlog'] = parse_positive_int('--backlog', options['--backlog'])
+
+    if options.get('--overflow') is not None:
+        if options['--overflow'] not in POLICIES:
+            raise UserError('--overflow should be one of: %s' % ', '.join(POLICIES))
+        kwargs['policy'] = options['--overflow']
+
+    if options.get('--rate') is not None:
+        kwargs['rate'] = parse_positive_int('--rate', options['--rate'])
+
+    if options.get('--format') is not None:
+        if options['--format'] not in FORMATS:
+            raise UserError('--format should be one of: %s' % ', '.join(FORMATS))
+        kwargs['format'] = options['--format']
+
+    if options.get('--stdout-only') and options.get('--stderr-only'):
+        raise UserError('--stdout-only and --stderr-only can\'t be used together')
+    if options.get('--stdout-only'):
+        kwargs['streams'] = ('stdout',)
+    if options.get('--stderr-only'):
+        kwargs['streams'] = ('stderr',)
+
+    for name in ('--grep', '--exclude'):
+        if options.get(name) is not None:
+            kwargs[name.lstrip('-')] = compile_pattern(name, options[name])
+
+    sinks = log_sinks(options)
+    if sinks:
+        kwargs['sinks'] = sinks
+
+    if options.get('--shards') is not None:
+        kwargs['shards'] = parse_positive_int('--shards', options['--shards'])
+        if kwargs['shards'] > 1 and sinks:
+            raise UserError('--shards can\'t be used with --log-dir, --syslog or --store')
+
+    return kwargs
+
+
+def perf_history(project, options):
+    """
+    Show how long services have been taking to build, pull, create and
+    start.
+
+    The median of each service's latest runs is compared with the median
+    of the runs before them, and services that have got slower by more
+    than the threshold are flagged.
+
+    Usage: history [options] [SERVICE...]
+
+    Options:
+        --recent=N           Number of latest runs to compare (default: 5).
+        --baseline=N         Number of runs before them to compare with
+                             (default: 20).
+        --threshold=PERCENT  Flag services whose median grew by more than
+                             this (default: 20).
+        --fail               Exit with an error if any service is flagged.
+    """
+    recent = parse_count('--recent', options['--recent'], history.DEFAULT_RECENT)
+    baseline = parse_count('--baseline', options['--baseline'], history.DEFAULT_BASELINE)
+    threshold = history.DEFAULT_THRESHOLD
+    if options['--threshold'] is not None:
+        threshold = parse_non_negative_int('--threshold', options['--threshold'])
+
+    path = history.history_path()
+    if path is None:
+        raise UserError('No timings are kept while FIG_HISTORY_FILE is empty')
+
+    try:
+        entries = history.load(path, project.name)
+    except IOError as e:
+        raise UserError('Can\'t read %s: %s' % (path, e))
+
+    results = history.trends(entries, recent, baseline, threshold)
+    if options['SERVICE']:
+        results = [result for result in results if result['service'] in options['SERVICE']]
+    if not results:
+        log.info('No timings recorded for %s yet' % project.name)
+        return
+
+    headers = ['Service', 'Phase', 'Runs', 'Baseline', 'Recent', 'Change', 'Status']
+    rows = [
+        [
+            result['service'],
+            result['phase'],
+            str(result['runs']),
+            format_seconds(result['baseline']) if result['baseline'] is not None else '-',
+            format_seconds(result['recent']),
+            '%+.0f%%' % result['change'] if result['change'] is not None else '-',
+            perf_status(result),
+        ]
+        for result in results
+    ]
+    print(Formatter().table(headers, rows))
+
+    regressed = ['%s (%s)' % (result['service'], result['phase']) for result in results if result['regressed']]
+    if regressed and options['--fail']:
+        raise UserError('Slower by more than %d%%: %s' % (threshold, ', '.join(regressed)))
+
+
+def perf_status(result):
+    if result['regressed']:
+        return 'REGRESSED'
+    return 'ok' if result['change'] is not None else '-'
+
+
+# `fig perf` commands, which are kept out of TopLevelCommand so that they
+# can't be run on their own
+PERF_COMMANDS = {'history': perf_history}
+
+
+def report_timings(report, options):
+    if options['--timings']:
+        headers = ['Service', 'Waited for', 'Start', 'Ready', 'Took', 'Critical path']
+        rows = [
+            [
+                service['name'],
+                service['waited_for'] or '-',
+                '%.2fs' % service['start'],
+                '%.2fs' % service['ready'],
+                '%.2fs' % service['duration'],
+                '*' if service['critical'] else '',
+            ]
+            for service in report['services']
+        ]
+        print(Formatter().table(headers, rows))
+        print("Took %.2fs in all. Critical path: %s (%.2fs)" % (
+            report['total'], ' -> '.join(report['critical_path']), report['critical_path_duration']))
+
+    if options['--timings-file'] is not None:
+        try:
+            with open(options['--timings-file'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        except IOError as e:
+            raise UserError('Can\'t write --timings-file: %s' % e)
+
+
+def make_instrumentation(options, printer_options):
+    """
+    The Instrumentation asked for with --stats-file, if any, with the sink
+    that counts each container's output added to `printer_options`.
+    """
+    if options.get('--stats-file') is None:
+        return None
+    if printer_options.get('shards', 1) > 1:
+        raise UserError('--shards can\'t be used with --stats-file')
+
+    interval = DEFAULT_STATS_INTERVAL
+    if options.get('--stats-interval') is not None:
+        interval = parse_positive_int('--stats-interval', options['--stats-interval'])
+
+    if options['--stats-file'] == '-':
+        instrumentation = Instrumentation(sys.stderr, interval)
+    else:
+        try:
+            output = open(options['--stats-file'], 'a')
+        except IOError as e:
+            raise UserError('Can\'t write --stats-file: %s' % e)
+        instrumentation = Instrumentation(output, interval, close_output=True)
+    printer_options['sinks'] = printer_options.get('sinks', []) + [instrumentation.counter]
+    return instrumentation
+
+
+def make_output_counter(options, printer_options):
+    """
+    The sink that counts each container's output for --metrics-addr, if it
+    was given, added to `printer_options`.
+    """
+    if options.get('--metrics-addr') is None:
+        return None
+    if printer_options.get('shards', 1) > 1:
+        raise UserError('--shards can\'t be used with --metrics-addr')
+
+    counter = OutputCounter()
+    printer_options['sinks'] = printer_options.get('sinks', []) + [counter]
+    return counter
+
+
+def start_metrics_server(value, project, counter, sinks):
+    # The project's client records its calls when --metrics-addr is given
+    collector = Collector(project, counter, sinks, getattr(project.client, 'metrics', None),
+                          client=unwrap_client(project.client))
+    try:
+        return MetricsServer(parse_address(value, DEFAULT_METRICS_PORT), collector).start()
+    except (ValueError, socket.error) as e:
+        raise UserError('Can\'t serve metrics on "%s": %s' % (value, e))
+
+
+def unwrap_client(client):
+    """
+    The docker-py client underneath the proxies get_client() may have put
+    around it, to make calls that aren't recorded, traced or logged.
+    """
+    while isinstance(client, (MetricsProxy, TraceProxy, VerboseProxy)):
+        client = client.obj
+    return client
+
+
+def log_sinks(options):
+    """
+    The sinks, beyond the terminal, that output should also go to.
+    """
+    sinks = []
+
+    if options.get('--log-dir') is not None:
+        file_options = {'compress': bool(options.get('--log-gzip'))}
+        if options.get('--log-max-size') is not None:
+            file_options['max_size'] = parse_positive_int('--log-max-size', options['--log-max-size'])
+        if options.get('--log-max-age') is not None:
+            file_options['max_age'] = parse_positive_int('--log-max-age', options['--log-max-age'])
+        sinks.append(FileSink(options['--log-dir'], **file_options))
+
+    if options.get('--syslog') is not None:
+        try:
+            sinks.append(SyslogSink(parse_address(options['--syslog'])))
+        except (ValueError, socket.error) as e:
+            raise UserError('Invalid --syslog address "%s": %s' % (options['--syslog'], e))
+
+    if options.get('--store') is not None:
+        sinks.append(StoreSink(options['--store']))
+
+    return sinks
+
+
+def search_store(project, options):
+    """
+    Print the stored lines that contain the --search text, without talking
+    to Docker at all.
+    """
+    if options['--store'] is None:
+        raise UserError('--search needs the --store directory to search')
+
+    since = None
+    if options['--since'] is not None:
+        try:
+            since = parse_since(options['--since'])
+        except ValueError as e:
+            raise UserError(str(e))
+
+    store = LogStore(options['--store'])
+    prefix = project.name + '_'
+    services = options['SERVICE'] or [service.name for service in project.services]
+    names = [
+        name for name in store.names()
+        if name.startswith(prefix) and name[len(prefix):].rsplit('_', 1)[0] in services
+    ]
+
+    needle = options['--search']
+    if isinstance(needle, six.text_type):
+        needle = needle.encode('utf-8')
+
+    width = max([len(name) - len(prefix) for name in names] or [0])
+    output = getattr(sys.stdout, 'buffer', sys.stdout)
+    for (_, name, _, line) in store.search(needle, since=since, names=names):
+        output.write(name[len(prefix):].ljust(width).encode('utf-8') + b' | ' + line + b'\n')
+    output.flush()
+
+
+def log_params(options):
+    """
+    Parameters for reading history from the logs endpoint, or None if the
+    options don't call for it and attaching will do.
+    """
+    if options['--tail'] is None and options['--since'] is None and not options['--no-follow']:
+        return None
+
+    params = {'follow': not options['--no-follow']}
+
+    if options['--tail'] is not None:
+        params['tail'] = parse_non_negative_int('--tail', options['--tail'])
+
+    if options['--since'] is not None:
+        try:
+            params['since'] = parse_since(options['--since'])
+        except ValueError as e:
+            raise UserError(str(e))
+
+    return params
+
+
+def compile_pattern(name, pattern):
+    """
+    Compile a pattern given on the command line to match raw log bytes.
+    """
+    if isinstance(pattern, six.text_type):
+        pattern = pattern.encode('utf-8')
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise UserError('Invalid %s pattern "%s": %s' % (name, pattern, e))
+
+
+def parse_count(name, value, default):
+    if value is None:
+        return default
+    return parse_positive_int(name, value)
+
+
+def parse_positive_int(name, value):
+    number = parse_non_negative_int(name, value)
+    if number == 0:
+        raise UserError('%s should be at least 1' % name)
+    return number
+
+
+def parse_non_negative_int(name, value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise UserError('%s should be a number, not "%s"' % (name, value))
+    return number
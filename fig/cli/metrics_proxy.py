@@ -0,0 +1,176 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from bisect import bisect_left
+import functools
+import threading
+import time
+
+import six
+
+
+# Upper bounds of the latency histogram's buckets, in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60, float('inf'))
+
+NO_SERVICE = '-'
+
+# docker-py's private methods that make a request, which fig calls directly
+# for endpoints it doesn't support. Its other private methods, like _url,
+# are helpers and not calls to Docker.
+REQUEST_METHODS = ('_get', '_post', '_delete')
+
+
+def is_api_call(name, attr):
+    return six.callable(attr) and (not name.startswith('_') or name in REQUEST_METHODS)
+
+
+class CallStats(object):
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * len(BUCKETS)
+
+    def add(self, seconds, size):
+        self.count += 1
+        self.bytes += size
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.histogram[bisect_left(BUCKETS, seconds)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.bytes += other.bytes
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.histogram = [a + b for (a, b) in zip(self.histogram, other.histogram)]
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, fraction):
+        """
+        The upper bound of the bucket the call at `fraction` of the way
+        through falls in, which is as precise as a histogram can be.
+        """
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.histogram):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics(object):
+    """
+    Counts the calls made through MetricsProxies, with the bytes received
+    and a latency histogram for each method and service. Calls can be
+    recorded from any thread.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.local = threading.local()
+
+    def measure_responses(self, client):
+        """
+        Count the bytes of every response `client` receives, as given by its
+        Content-Length. Streamed responses don't have one and count as 0.
+        """
+        client.hooks.setdefault('response', []).append(self._count_response)
+
+    def _count_response(self, response, *args, **kwargs):
+        self.local.bytes = getattr(self.local, 'bytes', 0) + int(response.headers.get('content-length') or 0)
+        return response
+
+    def start_call(self):
+        self.local.bytes = 0
+        return time.time()
+
+    def end_call(self, method, service, started):
+        seconds = time.time() - started
+        size = getattr(self.local, 'bytes', 0)
+        with self.lock:
+            key = (service or NO_SERVICE, method)
+            if key not in self.stats:
+                self.stats[key] = CallStats()
+            self.stats[key].add(seconds, size)
+
+    def snapshot(self):
+        """
+        A copy of the stats for each (service, method), as they are now.
+        """
+        with self.lock:
+            copies = {}
+            for (key, stats) in self.stats.items():
+                copies[key] = CallStats()
+                copies[key].merge(stats)
+            return copies
+
+    def rows(self):
+        """
+        A row for each method and service, slowest in total first, followed
+        by the totals.
+        """
+        with self.lock:
+            items = sorted(self.stats.items(), key=lambda item: -item[1].total)
+            total = CallStats()
+            for (_, stats) in items:
+                total.merge(stats)
+
+        rows = [[service, method] + format_stats(stats) for ((service, method), stats) in items]
+        rows.append(['Total', ''] + format_stats(total))
+        return rows
+
+
+HEADERS = ['Service', 'Method', 'Calls', 'Bytes', 'Total', 'Mean', 'p50', 'p95', 'Max']
+
+
+def format_stats(stats):
+    return [
+        six.text_type(stats.count),
+        six.text_type(stats.bytes),
+        format_seconds(stats.total),
+        format_seconds(stats.mean),
+        format_seconds(stats.percentile(0.5)),
+        format_seconds(stats.percentile(0.95)),
+        format_seconds(stats.max),
+    ]
+
+
+def format_seconds(seconds):
+    if seconds < 1:
+        return '%.1fms' % (seconds * 1000)
+    return '%.2fs' % seconds
+
+
+class MetricsProxy(object):
+    """Proxy all function calls to another object and record how many calls
+    are made to each method, how long they take and how many bytes they
+    receive. `labelled()` gives a proxy that records them against a service.
+    """
+
+    def __init__(self, obj, metrics, service=None):
+        self.obj = obj
+        self.metrics = metrics
+        self.service = service
+
+    def __getattr__(self, name):
+        attr = getattr(self.obj, name)
+
+        if not is_api_call(name, attr):
+            return attr
+
+        return functools.partial(self.proxy_callable, name)
+
+    def labelled(self, service):
+        return MetricsProxy(self.obj, self.metrics, service)
+
+    def proxy_callable(self, call_name, *args, **kwargs):
+        started = self.metrics.start_call()
+        try:
+            return getattr(self.obj, call_name)(*args, **kwargs)
+        finally:
+            self.metrics.end_call(call_name, self.service, started)
@@ -1,42 +1,122 @@
 from __future__ import absolute_import
-from threading import Thread
+import errno
+import select
 
-try:
-    from Queue import Queue, Empty
-except ImportError:
-    from queue import Queue, Empty  # Python 3.x
 
-
-# Yield STOP from an input generator to stop the
+# Return STOP from a source's read() to stop the
 # top-level loop without processing any more input.
 STOP = object()
 
+# Return DONE from a source's read() once it has no more
+# input. The loop finishes when every source is done.
+DONE = object()
+
 
 class Multiplexer(object):
-    def __init__(self, generators):
-        self.generators = generators
-        self.queue = Queue()
+    """
+    Serve a number of readable sources from a single thread.
+
+    A source is any object with a `fileno()` and a `read()` method. `read()`
+    is called as soon as the source's file descriptor becomes readable and
+    returns a list of items, which are yielded from `loop()` in order.
+
+    A source may also have a `has_buffered_data()` method, in which case it
+    is read whenever that returns True, without waiting on its descriptor.
+    """
+    def __init__(self, sources):
+        self.sources = sources
 
     def loop(self):
-        self._init_readers()
-
-        while True:
-            try:
-                item = self.queue.get(timeout=0.1)
-                if item is STOP:
-                    break
-                else:
-                    yield item
-            except Empty:
-                pass
-
-    def _init_readers(self):
-        for generator in self.generators:
-            t = Thread(target=_enqueue_output, args=(generator, self.queue))
-            t.daemon = True
-            t.start()
-
-
-def _enqueue_output(generator, queue):
-    for item in generator:
-        queue.put(item)
+        poller = make_poller()
+        try:
+            for source in self.sources:
+                poller.register(source)
+
+            while poller.sources:
+                for source in self._buffered(poller) or poller.poll():
+                    for item in source.read():
+                        if item is STOP:
+                            return
+                        if item is DONE:
+                            poller.unregister(source)
+                            break
+                        yield item
+        finally:
+            poller.close()
+
+    def _buffered(self, poller):
+        return [
+            source for source in poller.sources.values()
+            if getattr(source, 'has_buffered_data', None) and source.has_buffered_data()
+        ]
+
+
+def make_poller():
+    if hasattr(select, 'epoll'):
+        return EpollPoller()
+    return SelectPoller()
+
+
+class EpollPoller(object):
+    def __init__(self):
+        self.epoll = select.epoll()
+        self.sources = {}
+
+    def register(self, source):
+        fd = source.fileno()
+        self.sources[fd] = source
+        self.epoll.register(fd, select.EPOLLIN)
+
+    def unregister(self, source):
+        fd = pop_source(self.sources, source)
+        try:
+            self.epoll.unregister(fd)
+        except (IOError, OSError) as e:
+            # Closing a descriptor removes it from the epoll set already
+            if e.args[0] not in (errno.EBADF, errno.ENOENT):
+                raise
+
+    def poll(self):
+        events = retry_on_eintr(self.epoll.poll)
+        return [self.sources[fd] for (fd, _) in events if fd in self.sources]
+
+    def close(self):
+        self.epoll.close()
+
+
+class SelectPoller(object):
+    def __init__(self):
+        self.sources = {}
+
+    def register(self, source):
+        self.sources[source.fileno()] = source
+
+    def unregister(self, source):
+        pop_source(self.sources, source)
+
+    def poll(self):
+        readable, _, _ = retry_on_eintr(select.select, list(self.sources), [], [])
+        return [self.sources[fd] for fd in readable if fd in self.sources]
+
+    def close(self):
+        pass
+
+
+def pop_source(sources, source):
+    """
+    Remove `source` from a dict of sources keyed by file descriptor, without
+    asking for its fileno(), which may already have been closed.
+    """
+    for fd, registered in list(sources.items()):
+        if registered is source:
+            del sources[fd]
+            return fd
+
+
+def retry_on_eintr(fn, *args):
+    while True:
+        try:
+            return fn(*args)
+        except (IOError, OSError, select.error) as e:
+            if e.args[0] != errno.EINTR:
+                raise
@@ -0,0 +1,172 @@
+"""
+Serve the state of a running `fig up` over HTTP in Prometheus' text format,
+so that it can be scraped and alerted on like any other service.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import threading
+
+from six.moves import BaseHTTPServer
+
+from .metrics_proxy import BUCKETS
+
+
+DEFAULT_PORT = 9100
+ALL_INTERFACES = '0.0.0.0'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Collector(object):
+    """
+    Gathers the metrics for one scrape: the state of the project's
+    containers, from a single call to Docker, and what `counter` (an
+    OutputCounter), the LogWriters of `sinks` and `metrics` (the Metrics of
+    the project's client, if any) have recorded so far. Docker is called
+    through `client`, or the project's client, which shouldn't be one that
+    records its calls in `metrics`, or every scrape would show up in them.
+    """
+    def __init__(self, project, counter, sinks=(), metrics=None, client=None):
+        self.project = project
+        self.counter = counter
+        self.sinks = sinks
+        self.metrics = metrics
+        self.client = client or project.client
+
+    def collect(self):
+        families = [
+            self.containers(),
+            self.output('fig_container_output_lines_total', 'Lines written by each container.', 'lines'),
+            self.output('fig_container_output_bytes_total', 'Bytes written by each container.', 'bytes'),
+            self.output('fig_container_exits_total', 'Times each container has exited.', 'exits'),
+        ] + self.writers()
+        if self.metrics is not None:
+            families += self.api_calls()
+        return ''.join(format_family(*family) for family in families)
+
+    def containers(self):
+        counts = dict(
+            ((service.name, state), 0)
+            for service in self.project.services
+            for state in ('running', 'exited')
+        )
+        for container in self.client.containers(all=True):
+            for service in self.project.services:
+                if service.has_container(container):
+                    running = container.get('Status', '').startswith('Up')
+                    counts[(service.name, 'running' if running else 'exited')] += 1
+        return (
+            'fig_containers', 'gauge', 'Containers of each service, by state.',
+            [({'service': service, 'state': state}, count) for ((service, state), count) in sorted(counts.items())],
+        )
+
+    def output(self, name, description, key):
+        return (
+            name, 'counter', description,
+            [({'container': container}, counts[key]) for (container, counts) in sorted(self.counter.counts().items())],
+        )
+
+    def writers(self):
+        pending = {}
+        dropped = {}
+        for sink in self.sinks:
+            kind = type(sink).__name__
+            for writer in sink.log_writers():
+                stats = writer.stats()
+                pending[kind] = pending.get(kind, 0) + stats['pending']
+                dropped[kind] = dropped.get(kind, 0) + stats['dropped']
+        return [
+            ('fig_output_backlog_bytes', 'gauge', 'Output waiting to be written, for each destination.',
+             [({'sink': name}, size) for (name, size) in sorted(pending.items())]),
+            ('fig_output_dropped_lines_total', 'counter', 'Lines dropped because a destination fell behind.',
+             [({'sink': name}, lines) for (name, lines) in sorted(dropped.items())]),
+        ]
+
+    def api_calls(self):
+        durations = []
+        sizes = []
+        for ((service, method), stats) in sorted(self.metrics.snapshot().items()):
+            labels = {'service': service, 'method': method}
+            seen = 0
+            for (bound, count) in zip(BUCKETS, stats.histogram):
+                seen += count
+                durations.append((dict(labels, le=format_value(bound)), seen, '_bucket'))
+            durations.append((labels, stats.total, '_sum'))
+            durations.append((labels, stats.count, '_count'))
+            sizes.append((labels, stats.bytes))
+        return [
+            ('fig_docker_api_request_duration_seconds', 'histogram', 'Time taken by Docker API calls.', durations),
+            ('fig_docker_api_response_bytes_total', 'counter', 'Bytes received from Docker API calls.', sizes),
+        ]
+
+
+def format_family(name, kind, description, samples):
+    lines = ['# HELP %s %s' % (name, description), '# TYPE %s %s' % (name, kind)]
+    for sample in samples:
+        labels, value = sample[:2]
+        suffix = sample[2] if len(sample) > 2 else ''
+        lines.append('%s%s%s %s' % (name, suffix, format_labels(labels), format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(labels[name])) for name in sorted(labels))
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else '%d' % value
+
+
+class MetricsServer(object):
+    """
+    Serves `collector`'s metrics at /metrics on `address`, a (host, port)
+    pair, from a background thread. An empty host means all interfaces.
+    """
+    def __init__(self, address, collector):
+        host, port = address
+        self.server = BaseHTTPServer.HTTPServer((host or ALL_INTERFACES, port), MetricsHandler)
+        self.server.collector = collector
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-server')
+        self.thread.daemon = True
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        try:
+            body = self.server.collector.collect().encode('utf-8')
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
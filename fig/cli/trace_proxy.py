@@ -0,0 +1,28 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import functools
+
+from .. import trace
+from .metrics_proxy import is_api_call
+
+
+class TraceProxy(object):
+    """Proxy all function calls to another object and record each call as a
+    span in the trace, while one is being recorded.
+    """
+
+    def __init__(self, obj, category='docker'):
+        self.obj = obj
+        self.category = category
+
+    def __getattr__(self, name):
+        attr = getattr(self.obj, name)
+
+        if not is_api_call(name, attr):
+            return attr
+
+        return functools.partial(self.proxy_callable, name)
+
+    def proxy_callable(self, call_name, *args, **kwargs):
+        with trace.span(call_name, self.category):
+            return getattr(self.obj, call_name)(*args, **kwargs)
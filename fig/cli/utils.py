@@ -1,10 +1,13 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import division
+import calendar
 import datetime
 import os
+import re
 import subprocess
 import platform
+import time
 
 
 def yesno(prompt, default=None):
@@ -53,6 +56,36 @@ def prettydate(d):
         return '{0} hours ago'.format(s / 3600)
 
 
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_since(value, now=None):
+    """
+    Turn a point in time given on the command line into a Unix timestamp.
+
+    Accepts a timestamp, a duration back from now such as `90s`, `10m`, `2h`
+    or `1d`, or a UTC date like `2014-08-01` or `2014-08-01T10:00:00`.
+    Raises ValueError for anything else.
+    """
+    if now is None:
+        now = time.time()
+
+    if re.match(r'^\d+$', value):
+        return int(value)
+
+    match = re.match(r'^(\d+)([smhd])$', value)
+    if match:
+        return int(now) - int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return calendar.timegm(time.strptime(value.rstrip('Z'), fmt))
+        except ValueError:
+            pass
+
+    raise ValueError('Invalid time: %s' % value)
+
+
 def mkdir(path, permissions=0o700):
     if not os.path.exists(path):
         os.mkdir(path)
@@ -75,20 +108,68 @@ def split_buffer(reader, separator):
     separator, except for the last one if none was found on the end
     of the input.
     """
-    buffered = str('')
-    separator = str(separator)
+    buffered = bytearray()
+    separator = bytes(separator)
 
     for data in reader:
-        buffered += data
+        buffered.extend(data)
+        start = 0
         while True:
-            index = buffered.find(separator)
+            index = buffered.find(separator, start)
             if index == -1:
                 break
-            yield buffered[:index + 1]
-            buffered = buffered[index + 1:]
+            yield bytes(buffered[start:index + 1])
+            start = index + 1
+        del buffered[:start]
 
     if len(buffered) > 0:
-        yield buffered
+        yield bytes(buffered)
+
+
+class LineBuffer(object):
+    """
+    Incremental counterpart to split_buffer() which works a chunk at a time.
+
+    `feed()` returns everything up to and including the last separator seen
+    so far as a single string, and keeps the incomplete tail around for the
+    next call.
+    """
+    def __init__(self, separator=b'\n'):
+        self.separator = bytes(separator)
+        self.buffered = bytearray()
+
+    def feed(self, data):
+        index = data.rfind(self.separator)
+        if index == -1:
+            self.buffered.extend(data)
+            return b''
+
+        end = index + len(self.separator)
+        if self.buffered:
+            self.buffered.extend(data[:end])
+            chunk = bytes(self.buffered)
+            del self.buffered[:]
+        else:
+            chunk = data[:end]
+        self.buffered.extend(data[end:])
+        return chunk
+
+    def flush(self):
+        rest = bytes(self.buffered)
+        del self.buffered[:]
+        return rest
+
+
+def prefix_lines(prefix, chunk):
+    """
+    Put `prefix` in front of every line in `chunk`, in one pass rather than
+    line by line.
+    """
+    if not chunk:
+        return chunk
+    if chunk.endswith(b'\n'):
+        return prefix + chunk[:-1].replace(b'\n', b'\n' + prefix) + b'\n'
+    return prefix + chunk.replace(b'\n', b'\n' + prefix)
 
 
 def call_silently(*args, **kwargs):
@@ -157,6 +157,29 @@ class Container(object):
     def attach_socket(self, **kwargs):
         return self.client.attach_socket(self.id, **kwargs)
 
+    def attach_response(self, **params):
+        """Stream POST /containers/:id:/attach with the given query parameters.
+
+        Unlike docker-py's `attach_socket()`, this returns the unread
+        response, so that any output that arrived along with its headers can
+        be got at as well as the socket.
+        """
+        url = self.client._url("/containers/{0}/attach".format(self.id))
+        response = self.client._post(url, params=params, stream=True)
+        self.client._raise_for_status(response)
+        return response
+
+    def logs_response(self, **params):
+        """Stream GET /containers/:id:/logs with the given query parameters.
+
+        docker-py's `logs()` doesn't know about `tail` or `since`, so this
+        makes the request directly and returns the unread response.
+        """
+        url = self.client._url("/containers/{0}/logs".format(self.id))
+        response = self.client._get(url, params=params, stream=True)
+        self.client._raise_for_status(response)
+        return response
+
     def __repr__(self):
         return '<Container: %s>' % self.name
 
@@ -0,0 +1,179 @@
+"""
+How long each service took to build, pull, create and start, kept across
+commands so that a service slowly getting slower to start can be spotted.
+
+Recording is off until start() is called. After each command, what was
+recorded is appended to a history file as one JSON object per line, and
+trends() compares the latest runs of each service with the ones before.
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from contextlib import contextmanager
+import functools
+import json
+import os
+import threading
+import time
+
+from . import trace
+
+
+PHASES = ('build', 'pull', 'create', 'start')
+
+DEFAULT_PATH = os.path.join('~', '.fig', 'history.jsonl')
+DEFAULT_RECENT = 5
+DEFAULT_BASELINE = 20
+DEFAULT_THRESHOLD = 20
+
+recorder = None
+
+
+class Recorder(object):
+    """
+    Records how long each phase took for each service, from any thread.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+
+    def add(self, service, phase, seconds):
+        with self.lock:
+            self.durations.setdefault(service, {}).setdefault(phase, []).append(seconds)
+
+    def entry(self, project, command):
+        with self.lock:
+            return {
+                'time': time.time(),
+                'project': project,
+                'command': command,
+                'durations': dict(
+                    (service, dict((phase, list(seconds)) for (phase, seconds) in phases.items()))
+                    for (service, phases) in self.durations.items()
+                ),
+            }
+
+
+def start():
+    global recorder
+    recorder = Recorder()
+    return recorder
+
+
+def stop():
+    global recorder
+    stopped, recorder = recorder, None
+    return stopped
+
+
+@contextmanager
+def phase(name, service, **args):
+    """
+    Record how long the block takes as phase `name` of `service`, and trace
+    it as a span. Blocks that raise an exception aren't recorded, as a call
+    that failed says nothing about how long one that succeeds takes.
+    """
+    started = time.time()
+    with trace.span(name, service=service, **args):
+        yield
+    if recorder is not None:
+        recorder.add(service, name, time.time() - started)
+
+
+def timed(name):
+    """
+    Decorate a method of Service so that each call to it is recorded as
+    phase `name` of the service.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(service, *args, **kwargs):
+            with phase(name, service.name):
+                return func(service, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def history_path():
+    """
+    The file given by FIG_HISTORY_FILE, or the default one. Setting it to an
+    empty string turns the history off, and gives None.
+    """
+    path = os.environ.get('FIG_HISTORY_FILE', DEFAULT_PATH)
+    if not path:
+        return None
+    return os.path.expanduser(path)
+
+
+def append(path, entry):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+def load(path, project):
+    """
+    The entries recorded for `project`, oldest first. Lines that can't be
+    read, such as one cut short by a full disk, are skipped.
+    """
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and entry.get('project') == project:
+                entries.append(entry)
+    return entries
+
+
+def trends(entries, recent=DEFAULT_RECENT, baseline=DEFAULT_BASELINE, threshold=DEFAULT_THRESHOLD):
+    """
+    A dict for each service and phase in `entries`, comparing the median of
+    its `recent` latest runs with the median of the `baseline` runs before
+    them. A run's time is the mean of its calls, so that scaling a service
+    up doesn't count as it getting slower. It has regressed if the recent
+    median is more than `threshold` percent above the baseline one, and
+    there were at least as many baseline runs as recent ones to tell.
+    """
+    runs = {}
+    for entry in entries:
+        for (service, phases) in entry.get('durations', {}).items():
+            for (name, seconds) in phases.items():
+                if seconds:
+                    runs.setdefault((service, name), []).append(float(sum(seconds)) / len(seconds))
+
+    results = []
+    for ((service, name), values) in sorted(runs.items(), key=lambda item: sort_key(*item[0])):
+        latest = values[-recent:]
+        before = values[:-recent][-baseline:]
+        result = {
+            'service': service,
+            'phase': name,
+            'runs': len(values),
+            'recent': median(latest),
+            'baseline': median(before) if before else None,
+            'change': None,
+            'regressed': False,
+        }
+        if result['baseline']:
+            result['change'] = (result['recent'] - result['baseline']) / result['baseline'] * 100
+            result['regressed'] = len(before) >= len(latest) and result['change'] > threshold
+        results.append(result)
+    return results
+
+
+def sort_key(service, name):
+    return (service, PHASES.index(name) if name in PHASES else len(PHASES), name)
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
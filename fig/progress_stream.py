@@ -1,52 +1,177 @@
 import json
 import os
 import codecs
+import re
+import threading
+import time
+
+from . import trace
+
+
+# How often a terminal is redrawn with the latest progress, at most
+DEFAULT_FPS = 10
+
+WHITESPACE = re.compile(r'\s*')
+
+# How often TransferTracker prints a status line when output isn't a terminal
+DEFAULT_STATUS_INTERVAL = 5
 
 
 class StreamOutputError(Exception):
     pass
 
 
-def stream_output(output, stream):
-    is_terminal = hasattr(stream, 'fileno') and os.isatty(stream.fileno())
-    stream = codecs.getwriter('utf-8')(stream)
-    all_events = []
-    lines = {}
-    diff = 0
+@trace.traced('stream_output')
+def stream_output(output, stream, consumers=()):
+    """
+    Decode the progress events in a build or pull `output`, print them to
+    `stream` and hand each one to every one of `consumers` in turn. Events
+    aren't kept once they have been consumed, so memory use doesn't grow
+    with the length of the output.
+
+    Consumers that have a `finish()` method have it called at the end.
+
+    Raises StreamOutputError as soon as an event reports an error.
+    """
+    consumers = [ErrorDetector(), make_renderer(stream)] + list(consumers)
+
+    for event in json_stream(output):
+        for consumer in consumers:
+            consumer(event)
+
+    for consumer in consumers:
+        if hasattr(consumer, 'finish'):
+            consumer.finish()
+
+
+def json_stream(chunks):
+    """
+    Decode a stream of JSON documents from `chunks` of UTF-8, whichever way
+    the documents are split across chunks or share them. Whitespace between
+    documents is skipped.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffered = ''
+
+    for chunk in chunks:
+        buffered += text.decode(chunk)
+        end = 0
+        while True:
+            start = WHITESPACE.match(buffered, end).end()
+            if start == len(buffered):
+                buffered = ''
+                break
+            try:
+                document, end = decoder.raw_decode(buffered, start)
+            except ValueError:
+                # Incomplete, until more of it arrives
+                buffered = buffered[start:]
+                break
+            yield document
+
+    if buffered.strip():
+        raise StreamOutputError("Invalid JSON in output: %r" % buffered[:100])
+
+
+class ErrorDetector(object):
+    def __call__(self, event):
+        if 'errorDetail' in event:
+            raise StreamOutputError(event['errorDetail']['message'])
 
-    for chunk in output:
-        event = json.loads(chunk)
-        all_events.append(event)
 
+class ImageIdExtractor(object):
+    """
+    Picks the id of the built image out of a build's output. The last event
+    is kept as well, to explain what happened when there isn't one.
+    """
+    pattern = re.compile(r'Successfully built ([0-9a-f]+)')
+
+    def __init__(self):
+        self.image_id = None
+        self.last_event = None
+
+    def __call__(self, event):
+        self.last_event = event
+        if 'stream' in event:
+            match = self.pattern.search(event['stream'])
+            if match:
+                self.image_id = match.group(1)
+
+
+class TerminalRenderer(object):
+    """
+    Draws each image's progress on its own line of a terminal. Only the
+    latest event for each image is kept, and lines are redrawn at most `fps`
+    times a second, however fast events arrive.
+    """
+    def __init__(self, stream, fps=DEFAULT_FPS):
+        self.stream = codecs.getwriter('utf-8')(stream)
+        self.interval = 1.0 / fps
+        self.lines = {}
+        self.pending = {}
+        self.last_draw = 0
+
+    def __call__(self, event):
         if 'progress' in event or 'progressDetail' in event:
             image_id = event['id']
+            if image_id not in self.lines:
+                self.lines[image_id] = len(self.lines)
+                self.stream.write("\n")
+            self.pending[image_id] = event
+            if time.time() - self.last_draw >= self.interval:
+                self.draw()
+            return
+
+        self.draw()
+        print_output_event(event, self.stream, True)
+        self.stream.flush()
+
+    def draw(self):
+        stream = self.stream
+        for image_id in sorted(self.pending, key=self.lines.get):
+            diff = len(self.lines) - self.lines[image_id]
+            # move cursor up `diff` rows, draw, and move back down
+            stream.write("%c[%dA" % (27, diff))
+            print_output_event(self.pending[image_id], stream, True)
+            stream.write("%c[%dB" % (27, diff))
+        self.pending.clear()
+        self.last_draw = time.time()
+        stream.flush()
 
-            if image_id in lines:
-                diff = len(lines) - lines[image_id]
-            else:
-                lines[image_id] = len(lines)
-                stream.write("\n")
-                diff = 0
+    def finish(self):
+        self.draw()
 
-            if is_terminal:
-                # move cursor up `diff` rows
-                stream.write("%c[%dA" % (27, diff))
 
-        print_output_event(event, stream, is_terminal)
+class SummaryRenderer(object):
+    """
+    Prints events to a file or pipe, where progress can't be redrawn. Rather
+    than a line for every progress event, an image gets a line each time its
+    status changes.
+    """
+    def __init__(self, stream):
+        self.stream = codecs.getwriter('utf-8')(stream)
+        self.statuses = {}
 
-        if 'id' in event and is_terminal:
-            # move cursor back down
-            stream.write("%c[%dB" % (27, diff))
+    def __call__(self, event):
+        if 'id' in event:
+            status = event.get('status', '')
+            if self.statuses.get(event['id']) == status:
+                return
+            self.statuses[event['id']] = status
+            event = dict((key, event[key]) for key in ('time', 'id', 'from', 'status') if key in event)
 
-        stream.flush()
+        print_output_event(event, self.stream, False)
+        self.stream.flush()
 
-    return all_events
 
+def make_renderer(stream):
+    if hasattr(stream, 'fileno') and os.isatty(stream.fileno()):
+        return TerminalRenderer(stream)
+    return SummaryRenderer(stream)
 
-def print_output_event(event, stream, is_terminal):
-    if 'errorDetail' in event:
-        raise StreamOutputError(event['errorDetail']['message'])
 
+def print_output_event(event, stream, is_terminal):
     terminator = ''
 
     if is_terminal and 'stream' not in event:
@@ -81,3 +206,160 @@ def print_output_event(event, stream, is_terminal):
         stream.write("%s%s" % (event['stream'], terminator))
     else:
         stream.write("%s%s\n" % (status, terminator))
+
+
+class TransferTracker(object):
+    """
+    Adds up the progress of any number of pulls and builds, which may be
+    streaming in different threads at the same time. Each stream gets its
+    own consumer from `consumer(name)`.
+
+    When `stream` is given and isn't a terminal, a status line with the
+    bytes transferred, throughput and estimated time left for every image
+    and in total is printed at most every `interval` seconds, as download
+    progress comes in. `summary()` gives the final statistics.
+    """
+    def __init__(self, stream=None, interval=DEFAULT_STATUS_INTERVAL):
+        if stream is not None and hasattr(stream, 'fileno') and os.isatty(stream.fileno()):
+            stream = None
+        self.stream = stream
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.images = []
+        self.last_status = time.time()
+
+    def consumer(self, name):
+        transfer = ImageTransfer(name, self)
+        with self.lock:
+            self.images.append(transfer)
+        return transfer
+
+    def update(self, transfer, event):
+        # A build's output says nothing about what is being transferred
+        if 'stream' in event:
+            return
+        now = time.time()
+        with self.lock:
+            transfer.update(event, now)
+            if self.stream is None or now - self.last_status < self.interval:
+                return
+            if not any(image.total and not image.done for image in self.images):
+                return
+            self.last_status = now
+            status = self.status(now)
+        self.stream.write(status + '\n')
+        self.stream.flush()
+
+    def status(self, now):
+        parts = [image.describe(now) for image in self.images if image.total and not image.done]
+        parts.append('total %s' % describe_transfer(self.current, self.total, self.rate(now)))
+        return 'Downloading: %s' % ', '.join(parts)
+
+    @property
+    def current(self):
+        return sum(image.current for image in self.images)
+
+    @property
+    def total(self):
+        return sum(image.total for image in self.images)
+
+    def elapsed(self, now=None):
+        if not self.images:
+            return 0
+        end = max(image.finished if image.done else (now or time.time()) for image in self.images)
+        return end - min(image.started for image in self.images)
+
+    def rate(self, now=None):
+        elapsed = self.elapsed(now)
+        return self.current / elapsed if elapsed > 0 else 0
+
+    def summary(self):
+        """
+        One line for each image, and one for the lot, with how much was
+        transferred, how long it took and the average throughput.
+        """
+        with self.lock:
+            lines = [image.summary() for image in self.images]
+            if len(self.images) > 1:
+                lines.append('Total: %s in %s (%s/s) for %d images' % (
+                    format_bytes(self.current), format_duration(self.elapsed()),
+                    format_bytes(self.rate()), len(self.images)))
+            return lines
+
+
+class ImageTransfer(object):
+    """
+    The progress of one pull or build, as a stream_output() consumer. Bytes
+    are counted from the `Downloading` events of each layer.
+    """
+    def __init__(self, name, tracker):
+        self.name = name
+        self.tracker = tracker
+        self.layers = {}
+        self.started = self.finished = time.time()
+        self.done = False
+
+    def __call__(self, event):
+        self.tracker.update(self, event)
+
+    def finish(self):
+        with self.tracker.lock:
+            self.done = True
+            self.finished = time.time()
+
+    def update(self, event, now):
+        self.finished = now
+        detail = event.get('progressDetail') or {}
+        layer = self.layers.get(event.get('id'))
+
+        if event.get('status') == 'Downloading' and 'total' in detail:
+            self.layers[event['id']] = [detail.get('current', 0), detail['total']]
+        elif event.get('status') == 'Download complete' and layer is not None:
+            layer[0] = layer[1]
+
+    @property
+    def current(self):
+        return sum(current for (current, _) in self.layers.values())
+
+    @property
+    def total(self):
+        return sum(total for (_, total) in self.layers.values())
+
+    def elapsed(self, now=None):
+        end = self.finished if self.done else (now or time.time())
+        return end - self.started
+
+    def rate(self, now=None):
+        elapsed = self.elapsed(now)
+        return self.current / elapsed if elapsed > 0 else 0
+
+    def summary(self):
+        if not self.total:
+            return '%s: took %s' % (self.name, format_duration(self.elapsed()))
+        return '%s: %s in %s (%s/s)' % (
+            self.name, format_bytes(self.current), format_duration(self.elapsed()), format_bytes(self.rate()))
+
+    def describe(self, now):
+        return '%s %s' % (self.name, describe_transfer(self.current, self.total, self.rate(now)))
+
+
+def describe_transfer(current, total, rate):
+    description = '%s/%s, %s/s' % (format_bytes(current), format_bytes(total), format_bytes(rate))
+    if rate > 0 and total > current:
+        description += ', ETA %s' % format_duration((total - current) / rate)
+    return description
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return '%.1f %s' % (size, unit) if unit != 'B' else '%d B' % size
+        size /= 1024.0
+    return '%.1f GB' % size
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return '%ds' % seconds
+    return '%dm%02ds' % divmod(seconds, 60)
@@ -1,7 +1,10 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
 import logging
+import sys
 
+from .progress_stream import TransferTracker
+from . import trace
 from .service import Service
 from .container import Container
 from docker.errors import APIError
@@ -48,6 +51,8 @@ class Project(object):
         self.name = name
         self.services = services
         self.client = client
+        # Shared by every service, to report on all the images pulled or built
+        self.transfers = TransferTracker(sys.stdout)
 
     @classmethod
     def from_dicts(cls, name, service_dicts, client):
@@ -59,7 +64,8 @@ class Project(object):
             links = project.get_links(service_dict)
             volumes_from = project.get_volumes_from(service_dict)
 
-            project.services.append(Service(client=client, project=name, links=links, volumes_from=volumes_from, **service_dict))
+            project.services.append(Service(client=client, project=name, links=links, volumes_from=volumes_from,
+                                            transfers=project.transfers, **service_dict))
         return project
 
     @classmethod
@@ -162,20 +168,31 @@ class Project(object):
                 service.build(no_cache)
             else:
                 log.info('%s uses an image, skipping' % service.name)
+        self._report_transfers()
 
-    def up(self, service_names=None, start_links=True, recreate=True):
+    @trace.traced('Project.up')
+    def up(self, service_names=None, start_links=True, recreate=True, timings=None):
         running_containers = []
 
         for service in self.get_services(service_names, include_links=start_links):
+            if timings is not None:
+                timings.start(service)
             if recreate:
                 for (_, container) in service.recreate_containers():
                     running_containers.append(container)
             else:
                 for container in service.start_or_create_containers():
                     running_containers.append(container)
+            if timings is not None:
+                timings.ready(service)
 
+        self._report_transfers()
         return running_containers
 
+    def _report_transfers(self):
+        for line in self.transfers.summary():
+            log.info(line)
+
     def remove_stopped(self, service_names=None, **options):
         for service in self.get_services(service_names):
             service.remove_stopped(**options)
@@ -10,7 +10,9 @@ import os
 from operator import attrgetter
 import sys
 from .container import Container
-from .progress_stream import stream_output, StreamOutputError
+from .progress_stream import stream_output, StreamOutputError, ImageIdExtractor
+from . import history
+from . import trace
 
 log = logging.getLogger(__name__)
 
@@ -69,7 +71,8 @@ VolumeSpec = namedtuple('VolumeSpec', 'external internal mode')
 
 
 class Service(object):
-    def __init__(self, name, client=None, project='default', links=None, volumes_from=None, **options):
+    def __init__(self, name, client=None, project='default', links=None, volumes_from=None, transfers=None,
+                 **options):
         if not re.match('^%s+$' % VALID_NAME_CHARS, name):
             raise ConfigError('Invalid service name "%s" - only %s are allowed' % (name, VALID_NAME_CHARS))
         if not re.match('^%s+$' % VALID_NAME_CHARS, project):
@@ -94,6 +97,7 @@ class Service(object):
         self.project = project
         self.links = links or []
         self.volumes_from = volumes_from or []
+        self.transfers = transfers
         self.options = options
 
     @property
@@ -199,15 +203,19 @@ class Service(object):
         """
         container_options = self._get_container_create_options(override_options, one_off=one_off)
         try:
-            return Container.create(self.client, **container_options)
+            with history.phase('create', self.name):
+                return Container.create(self.client, **container_options)
         except APIError as e:
             if e.response.status_code == 404 and e.explanation and 'No such image' in str(e.explanation):
                 log.info('Pulling image %s...' % container_options['image'])
-                output = self.client.pull(container_options['image'], stream=True)
-                stream_output(output, sys.stdout)
-                return Container.create(self.client, **container_options)
+                with history.phase('pull', self.name, image=container_options['image']):
+                    output = self.client.pull(container_options['image'], stream=True)
+                    stream_output(output, sys.stdout, self._track_transfer(container_options['image']))
+                with history.phase('create', self.name):
+                    return Container.create(self.client, **container_options)
             raise
 
+    @trace.traced('recreate_containers', lambda self, **_: {'service': self.name})
     def recreate_containers(self, **override_options):
         """
         If a container for this service doesn't exist, create and start one. If there are
@@ -229,6 +237,7 @@ class Service(object):
 
             return tuples
 
+    @trace.traced('recreate_container', lambda self, container, **_: {'container': container.name})
     def recreate_container(self, container, **override_options):
         """Recreate a container. An intermediate container is created so that
         the new container has the same name, while still supporting
@@ -283,15 +292,19 @@ class Service(object):
         net = options.get('net', 'bridge')
         dns = options.get('dns', None)
 
-        container.start(
-            links=self._get_links(link_to_self=options.get('one_off', False)),
-            port_bindings=ports,
-            binds=volume_bindings,
-            volumes_from=self._get_volumes_from(intermediate_container),
-            privileged=privileged,
-            network_mode=net,
-            dns=dns,
-        )
+        links = self._get_links(link_to_self=options.get('one_off', False))
+        volumes_from = self._get_volumes_from(intermediate_container)
+
+        with history.phase('start', self.name):
+            container.start(
+                links=links,
+                port_bindings=ports,
+                binds=volume_bindings,
+                volumes_from=volumes_from,
+                privileged=privileged,
+                network_mode=net,
+                dns=dns,
+            )
         return container
 
     def start_or_create_containers(self):
@@ -405,6 +418,7 @@ class Service(object):
 
         return container_options
 
+    @history.timed('build')
     def build(self, no_cache=False):
         log.info('Building %s...' % self.name)
 
@@ -416,25 +430,25 @@ class Service(object):
             nocache=no_cache,
         )
 
+        extractor = ImageIdExtractor()
         try:
-            all_events = stream_output(build_output, sys.stdout)
+            stream_output(build_output, sys.stdout, [extractor] + self._track_transfer(self.full_name))
         except StreamOutputError, e:
             raise BuildError(self, unicode(e))
 
-        image_id = None
-
-        for event in all_events:
-            if 'stream' in event:
-                match = re.search(r'Successfully built ([0-9a-f]+)', event.get('stream', ''))
-                if match:
-                    image_id = match.group(1)
+        image_id = extractor.image_id
 
         if image_id is None:
-            raise BuildError(self, event if all_events else 'Unknown')
+            raise BuildError(self, extractor.last_event or 'Unknown')
 
         self.tag_image(image_id)
         return image_id
 
+    def _track_transfer(self, name):
+        if self.transfers is None:
+            return []
+        return [self.transfers.consumer(name)]
+
     def tag_image(self, image_id):
         for tag in self.options.get('tags', []):
             image_name, image_tag = split_tag(tag)
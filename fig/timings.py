@@ -0,0 +1,94 @@
+"""
+When each service of a `fig up` started being created and was ready, and
+the critical path through the dependencies between services: the chain of
+links and volumes_from that would still have to be started one after the
+other if every service were started as soon as it could be.
+
+Fig has no way of telling when what runs in a container is ready, so a
+service counts as ready once all of its containers have started.
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import time
+
+from .service import Service
+
+
+class Timings(object):
+    def __init__(self):
+        self.started = time.time()
+        self.services = []
+        self.times = {}
+        self.dependencies = {}
+
+    def start(self, service):
+        self.services.append(service.name)
+        self.times[service.name] = [time.time(), None]
+        self.dependencies[service.name] = dependency_names(service)
+
+    def ready(self, service):
+        self.times[service.name][1] = time.time()
+
+    def report(self):
+        """
+        A dict with an entry for each service in `services`, giving when it
+        started and was ready (in seconds since the Timings were created),
+        how long it took, the dependency that was ready last before it
+        started (the edge it was waiting on) and whether it is on the
+        critical path. `critical_path` lists the services on it, and it
+        takes `critical_path_duration` seconds.
+        """
+        services = [name for name in self.services if self.times[name][1] is not None]
+        durations = dict((name, self.times[name][1] - self.times[name][0]) for name in services)
+
+        # The earliest each service could be ready, if started as soon as its
+        # dependencies were, and the dependency that decides it
+        earliest = {}
+        blocking = {}
+        for name in services:
+            dependencies = [d for d in self.dependencies[name] if d in earliest]
+            blocking[name] = max(dependencies, key=earliest.get) if dependencies else None
+            earliest[name] = (earliest[blocking[name]] if blocking[name] else 0) + durations[name]
+
+        path = []
+        if services:
+            last = max(services, key=earliest.get)
+            while last is not None:
+                path.insert(0, last)
+                last = blocking[last]
+
+        return {
+            'services': [
+                {
+                    'name': name,
+                    'depends_on': self.dependencies[name],
+                    'start': self.times[name][0] - self.started,
+                    'ready': self.times[name][1] - self.started,
+                    'duration': durations[name],
+                    'waited_for': self._waited_for(name),
+                    'critical': name in path,
+                }
+                for name in services
+            ],
+            'total': sum(durations.values()),
+            'critical_path': path,
+            'critical_path_duration': earliest[path[-1]] if path else 0,
+        }
+
+    def _waited_for(self, name):
+        """
+        The dependency that was ready last before `name` started.
+        """
+        ready = [d for d in self.dependencies[name] if d in self.times and self.times[d][1] is not None]
+        if not ready:
+            return None
+        return max(ready, key=lambda d: self.times[d][1])
+
+
+def dependency_names(service):
+    names = service.get_linked_names()
+    for source in service.volumes_from:
+        # Containers are already there, so only services are waited for
+        if isinstance(source, Service) and source.name not in names:
+            names.append(source.name)
+    return names
@@ -0,0 +1,115 @@
+"""
+Nested spans of what fig spends its time on, written in Chrome's
+trace_event format so that they can be loaded into chrome://tracing or any
+other viewer that reads it.
+
+Tracing is off until start() is called, and spans cost next to nothing
+while it is.
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from contextlib import contextmanager
+import functools
+import json
+import os
+import threading
+import time
+
+
+tracer = None
+
+
+class Tracer(object):
+    """
+    Records complete ("X") events for spans in any thread, with times in
+    microseconds since the tracer was created.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.threads = {}
+        self.pid = os.getpid()
+        self.started = time.time()
+
+    @contextmanager
+    def span(self, name, category='fig', **args):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.time(), args)
+
+    def add(self, name, category, start, end, args):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': self.microseconds(start),
+            'dur': int(round((end - start) * 1000000)),
+            'pid': self.pid,
+            'tid': thread.ident,
+            'args': args,
+        }
+        with self.lock:
+            self.events.append(event)
+            self.threads[thread.ident] = thread.name
+
+    def microseconds(self, seconds):
+        return int(round((seconds - self.started) * 1000000))
+
+    def trace_events(self):
+        with self.lock:
+            metadata = [self.metadata('process_name', None, 'fig')] + [
+                self.metadata('thread_name', ident, name)
+                for (ident, name) in sorted(self.threads.items())
+            ]
+            return metadata + sorted(self.events, key=lambda event: event['ts'])
+
+    def metadata(self, name, tid, value):
+        event = {'name': name, 'ph': 'M', 'pid': self.pid, 'args': {'name': value}}
+        if tid is not None:
+            event['tid'] = tid
+        return event
+
+    def write(self, output):
+        json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, output)
+
+
+def start():
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+
+def stop():
+    global tracer
+    stopped, tracer = tracer, None
+    return stopped
+
+
+@contextmanager
+def span(name, category='fig', **args):
+    if tracer is None:
+        yield
+        return
+    with tracer.span(name, category, **args):
+        yield
+
+
+def traced(name, describe=None):
+    """
+    Decorate a function so that each call to it is a span called `name`.
+    `describe` is called with the same arguments and returns the span's
+    args, such as which service or container it is for.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if tracer is None:
+                return func(*args, **kwargs)
+            span_args = describe(*args, **kwargs) if describe else {}
+            with tracer.span(name, **span_args):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,313 @@
+"""Time fig's commands against a fake Docker daemon, over projects of
+different sizes and daemons of different latencies.
+
+Each combination of --services, --containers and --latency gets a project
+of that many services (each one after the first linked to the first) and a
+fresh fake daemon, and runs `up -d`, `scale`, `ps`, `logs --no-follow`,
+`stop` and `rm --force` in turn, --repeat times. The fastest time and the
+number of API calls for each command are printed and appended to --results
+along with the commit they were measured at, so that runs at different
+commits can be compared with --compare. Run it with
+`python -m tests.benchmark` or script/benchmark.
+
+With --throughput, it instead measures how fast the code that fig runs over
+every byte of output gets through it, and fails if any of it is slower than
+a generous lower bound. These are wall-clock measurements, which is why they
+are here and not in the unit tests.
+
+Usage:
+  benchmark [options]
+
+Options:
+  --services=LIST    Comma-separated numbers of services (default: 1,5,20).
+  --containers=LIST  Comma-separated numbers of containers for each service
+                     (default: 1,3).
+  --latency=LIST     Comma-separated latencies of every API call, in
+                     milliseconds (default: 0,5).
+  --repeat=N         Run every command N times and keep the fastest
+                     (default: 3).
+  --results=FILE     File to append results to
+                     (default: .benchmarks/results.jsonl).
+  --compare=COMMIT   Compare with the latest results recorded at COMMIT.
+  --throughput       Measure the throughput of output parsing instead.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from contextlib import contextmanager
+import functools
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+import yaml
+
+from fig.cli.formatter import Formatter
+from fig.cli.main import TopLevelCommand
+from fig.cli.utils import split_buffer, LineBuffer, prefix_lines
+from fig.progress_stream import json_stream
+from .fake_docker import FakeDocker
+
+
+PROJECT = 'bench'
+DEFAULT_RESULTS = os.path.join('.benchmarks', 'results.jsonl')
+
+
+def main(argv=None):
+    options = docopt(__doc__, argv)
+    if options['--throughput']:
+        return measure_throughput(int(options['--repeat'] or 3))
+
+    sizes = [
+        (services, containers, latency)
+        for services in parse_list(options['--services'] or '1,5,20')
+        for containers in parse_list(options['--containers'] or '1,3')
+        for latency in parse_list(options['--latency'] or '0,5')
+    ]
+    repeat = int(options['--repeat'] or 3)
+    path = options['--results'] or DEFAULT_RESULTS
+
+    # Commands log what they are doing, which would swamp the results
+    logging.disable(logging.CRITICAL)
+
+    commit = current_commit()
+    results = []
+    for (services, containers, latency) in sizes:
+        results.extend(run(commit, services, containers, latency, repeat))
+
+    save_results(path, results)
+
+    previous = None
+    if options['--compare']:
+        previous = load_results(path, options['--compare'])
+    print(format_results(results, previous, options['--compare']))
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def commands(services, containers):
+    names = ['s%d' % i for i in range(services)]
+    return [
+        ('up', ['up', '-d']),
+        ('scale', ['scale'] + ['%s=%d' % (name, containers) for name in names]),
+        ('ps', ['ps']),
+        ('logs', ['logs', '--no-follow', '--no-color']),
+        ('stop', ['stop']),
+        ('rm', ['rm', '--force']),
+    ]
+
+
+def write_project(directory, services):
+    config = {}
+    for i in range(services):
+        config['s%d' % i] = {'image': 'busybox', 'command': 'sleep 300'}
+        if i > 0:
+            config['s%d' % i]['links'] = ['s0']
+
+    path = os.path.join(directory, 'fig.yml')
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f, default_flow_style=False)
+    return path
+
+
+def run(commit, services, containers, latency, repeat):
+    """
+    Run every command against a fresh fake daemon `repeat` times, and return
+    a result for each with the fastest time it took.
+    """
+    directory = tempfile.mkdtemp()
+    fig_file = write_project(directory, services)
+    times = {}
+    calls = {}
+
+    try:
+        with FakeDocker(latency=latency / 1000.0) as docker:
+            os.environ['DOCKER_HOST'] = docker.base_url
+            # Keep the fake daemon's timings out of the real history
+            os.environ['FIG_HISTORY_FILE'] = ''
+            for _ in range(repeat):
+                for (name, argv) in commands(services, containers):
+                    docker.reset_calls()
+                    started = time.time()
+                    with silenced_stdout():
+                        # As native strings, the way they would come from sys.argv
+                        TopLevelCommand().dispatch([str(arg) for arg in ['-f', fig_file, '-p', PROJECT] + argv], None)
+                    times.setdefault(name, []).append(time.time() - started)
+                    calls[name] = sum(docker.calls.values())
+    finally:
+        shutil.rmtree(directory)
+
+    return [
+        {
+            'commit': commit,
+            'services': services,
+            'containers': containers,
+            'latency': latency,
+            'command': name,
+            'seconds': min(times[name]),
+            'calls': calls[name],
+        }
+        for (name, _) in commands(services, containers)
+    ]
+
+
+@contextmanager
+def silenced_stdout():
+    sys.stdout.flush()
+    saved = os.dup(1)
+    null = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(null, 1)
+    os.close(null)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def chatty_output():
+    return ''.join('line %06d of a fairly chatty service\n' % i for i in range(50000)).encode('ascii')
+
+
+def split_buffer_case():
+    chunk = chatty_output()
+
+    def run():
+        for _ in split_buffer(iter([chunk] * 4), b'\n'):
+            pass
+    return run, len(chunk) * 4
+
+
+def line_buffer_case():
+    chunk = chatty_output()
+
+    def run():
+        lines = LineBuffer()
+        for i in range(0, len(chunk), 65536):
+            prefix_lines(b'web_1 | ', lines.feed(chunk[i:i + 65536]))
+    return run, len(chunk)
+
+
+def recorded_stream_case(name):
+    path = os.path.join(os.path.dirname(__file__), 'fixtures', 'progress-streams', name)
+    with open(path, 'rb') as f:
+        data = f.read() * 40
+    chunks = [data[i:i + 65536] for i in range(0, len(data), 65536)]
+
+    def run():
+        for _ in json_stream(chunks):
+            pass
+    return run, len(data)
+
+
+# (name, make the case, minimum bytes per second). The minimums are
+# generous: the old split_buffer() re-sliced the buffer for every line and
+# took minutes to get through one of its cases, and json_stream() decodes
+# pulls and builds about as fast as json.loads() on each line.
+THROUGHPUT_CASES = [
+    ('split_buffer', split_buffer_case, 5 * 1024 * 1024),
+    ('LineBuffer', line_buffer_case, 5 * 1024 * 1024),
+    ('json_stream (pull)', functools.partial(recorded_stream_case, 'pull.json'), 2 * 1024 * 1024),
+    ('json_stream (build)', functools.partial(recorded_stream_case, 'build.json'), 2 * 1024 * 1024),
+]
+
+
+def measure_throughput(repeat):
+    """
+    Run every throughput case `repeat` times, print the best rate of each,
+    and exit with an error if any is below its minimum.
+    """
+    rows = []
+    slow = []
+    for (name, make_case, minimum) in THROUGHPUT_CASES:
+        run, size = make_case()
+        fastest = None
+        for _ in range(repeat):
+            started = time.time()
+            run()
+            elapsed = max(time.time() - started, 1e-6)
+            fastest = elapsed if fastest is None else min(fastest, elapsed)
+        rate = size / fastest
+        rows.append([name, '%.1f' % (rate / 1024 / 1024), '%.1f' % (minimum / 1024.0 / 1024)])
+        if rate < minimum:
+            slow.append(name)
+
+    print(Formatter().table(['Case', 'MB/s', 'Minimum'], rows))
+    if slow:
+        sys.exit('Slower than the minimum: %s' % ', '.join(slow))
+
+
+def current_commit():
+    try:
+        output = subprocess.check_output(['git', 'describe', '--always', '--dirty'])
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return output.decode('utf-8').strip()
+
+
+def save_results(path, results):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'a') as f:
+        for result in results:
+            f.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+def load_results(path, commit):
+    """
+    The latest result recorded for each size and command at `commit`, which
+    can be abbreviated.
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f:
+            result = json.loads(line)
+            if result['commit'].startswith(commit):
+                results[result_key(result)] = result
+    return results
+
+
+def result_key(result):
+    return (result['services'], result['containers'], result['latency'], result['command'])
+
+
+def format_results(results, previous=None, commit=None):
+    headers = ['Services', 'Containers', 'Latency', 'Command', 'Calls', 'Seconds']
+    if previous is not None:
+        headers += [commit, 'Change']
+
+    rows = []
+    for result in results:
+        row = [
+            str(result['services']),
+            str(result['containers']),
+            '%dms' % result['latency'],
+            result['command'],
+            str(result['calls']),
+            '%.3f' % result['seconds'],
+        ]
+        if previous is not None:
+            before = previous.get(result_key(result))
+            if before is None:
+                row += ['-', '-']
+            else:
+                change = (result['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0
+                row += ['%.3f' % before['seconds'], '%+.0f%%' % change]
+        rows.append(row)
+    return Formatter().table(headers, rows)
+
+
+if __name__ == '__main__':
+    main()
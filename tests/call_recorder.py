@@ -0,0 +1,77 @@
+"""
+Count the round trips fig makes to Docker, so that tests can pin them down
+and catch an extra call per container before it reaches a real daemon.
+
+    client = CallRecorder(Client(docker.base_url))
+    project = Project.from_dicts('figtest', dicts, client)
+    project.up()
+    client.assert_counts({'containers': 12, 'create_container': 5, ...})
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import functools
+import threading
+
+from fig.cli.metrics_proxy import is_api_call
+
+
+class CallRecorder(object):
+    """Proxy all function calls to a Docker client and record the name and
+    arguments of each one that makes a request.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+
+        if not is_api_call(name, attr):
+            return attr
+
+        return functools.partial(self.proxy_callable, name)
+
+    def proxy_callable(self, call_name, *args, **kwargs):
+        with self.lock:
+            self.calls.append((call_name, args, kwargs))
+        return getattr(self.client, call_name)(*args, **kwargs)
+
+    def reset(self):
+        with self.lock:
+            self.calls = []
+
+    def counts(self):
+        counts = {}
+        for (name, _, _) in self.calls:
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def count(self, name=None):
+        if name is None:
+            return len(self.calls)
+        return self.counts().get(name, 0)
+
+    def assert_counts(self, expected):
+        """
+        Assert that exactly the calls in `expected`, a dict of method names
+        to how many times each was called, were made.
+        """
+        counts = self.counts()
+        if counts != expected:
+            raise AssertionError('Expected calls %s, got %s' % (
+                format_counts(expected), format_counts(counts)))
+
+    def assert_at_most(self, limit, name=None):
+        """
+        Assert that no more than `limit` calls were made, to `name` or in all.
+        """
+        count = self.count(name)
+        if count > limit:
+            raise AssertionError('Expected at most %d calls%s, got %d: %s' % (
+                limit, ' to %s' % name if name else '', count, format_counts(self.counts())))
+
+
+def format_counts(counts):
+    return ', '.join('%s=%d' % item for item in sorted(counts.items())) or 'none'
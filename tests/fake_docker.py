@@ -0,0 +1,460 @@
+"""
+An in-memory Docker daemon that speaks enough of the Remote API for fig to
+run against it, over a Unix socket or TCP, with a configurable delay before
+every response to stand in for a slow or busy daemon.
+
+    with FakeDocker(latency=0.01) as docker:
+        os.environ['DOCKER_HOST'] = docker.base_url
+        ...
+
+Containers don't run anything. Starting one marks it as running, waiting
+for one stops it straight away, and its output is `log_lines` lines saying
+which line of which container it is.
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import binascii
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs
+
+
+DEFAULT_IMAGES = ('busybox:latest',)
+DEFAULT_LOG_LINES = 10
+API_VERSION = '1.12'
+
+# docker-py reads the streams it follows itself, such as a pull's, straight
+# off the socket, and would miss any of the body that arrived with the
+# headers and was buffered along with them
+STREAM_DELAY = 0.01
+
+# (method, path, handler) for every endpoint, in the order they are tried
+ROUTES = [
+    ('GET', r'/version', 'version'),
+    ('GET', r'/_ping', 'ping'),
+    ('GET', r'/containers/json', 'containers'),
+    ('POST', r'/containers/create', 'create_container'),
+    ('GET', r'/containers/(?P<id>[^/]+)/json', 'inspect_container'),
+    ('POST', r'/containers/(?P<id>[^/]+)/start', 'start'),
+    ('POST', r'/containers/(?P<id>[^/]+)/stop', 'stop'),
+    ('POST', r'/containers/(?P<id>[^/]+)/restart', 'restart'),
+    ('POST', r'/containers/(?P<id>[^/]+)/kill', 'kill'),
+    ('POST', r'/containers/(?P<id>[^/]+)/wait', 'wait'),
+    ('POST', r'/containers/(?P<id>[^/]+)/attach', 'attach'),
+    ('GET', r'/containers/(?P<id>[^/]+)/logs', 'logs'),
+    ('DELETE', r'/containers/(?P<id>[^/]+)', 'remove_container'),
+    ('GET', r'/images/json', 'images'),
+    ('POST', r'/images/create', 'pull'),
+    ('POST', r'/images/(?P<id>.+)/tag', 'tag'),
+    ('POST', r'/build', 'build'),
+]
+ROUTES = [(method, re.compile(r'^(?:/v[0-9.]+)?%s$' % path), name) for (method, path, name) in ROUTES]
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super(APIError, self).__init__(message)
+        self.status = status
+        self.message = message
+
+
+class FakeDocker(object):
+    """
+    Serves the Remote API on a Unix socket at `socket_path` (or in a temporary
+    directory), or on a TCP port on localhost if `tcp` is set, from a thread. `latency` is how long every call takes, in
+    seconds, and `latencies` can set it for each endpoint by the name of its
+    handler, such as `create_container` or `start`.
+
+    `calls` counts the calls made to each endpoint.
+    """
+    def __init__(self, socket_path=None, latency=0, latencies=None, images=DEFAULT_IMAGES,
+                 log_lines=DEFAULT_LOG_LINES, tcp=False):
+        self.directory = None
+        self.tcp = tcp
+        if socket_path is None and not tcp:
+            self.directory = tempfile.mkdtemp()
+            socket_path = os.path.join(self.directory, 'docker.sock')
+        self.socket_path = socket_path
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.log_lines = log_lines
+
+        self.lock = threading.Lock()
+        self.containers = []
+        self.images = {}
+        self.calls = {}
+        for name in images:
+            self.add_image(name)
+
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        if self.tcp:
+            return 'tcp://%s:%d' % self.server.server_address
+        return 'unix://%s' % self.socket_path
+
+    def start(self):
+        if self.tcp:
+            self.server = TCPHTTPServer(('127.0.0.1', 0), RequestHandler)
+        else:
+            self.server = UnixHTTPServer(self.socket_path, RequestHandler)
+        self.server.docker = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-docker')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        if not self.tcp:
+            os.remove(self.socket_path)
+        if self.directory is not None:
+            shutil.rmtree(self.directory)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls = {}
+
+    def delay(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        seconds = self.latencies.get(name, self.latency)
+        if seconds:
+            time.sleep(seconds)
+
+    def add_image(self, name, image_id=None):
+        if ':' not in name.split('/')[-1]:
+            name += ':latest'
+        image_id = image_id or self.images.get(name) or new_id()
+        self.images[name] = image_id
+        return image_id
+
+    # Endpoints, named after their route with `api_` in front. Each is called
+    # with the parsed query, the decoded JSON body (if any) and the path's
+    # parameters, and returns what to respond with.
+
+    def api_version(self, query, body):
+        return {'Version': '1.0.0-fake', 'ApiVersion': API_VERSION, 'GoVersion': 'go1.2', 'Os': 'linux'}
+
+    def api_ping(self, query, body):
+        return 'OK'
+
+    def api_containers(self, query, body):
+        show_all = flag(query, 'all')
+        return [
+            self.summary(container) for container in reversed(self.containers)
+            if show_all or container['State']['Running']
+        ]
+
+    def api_create_container(self, query, body):
+        image = body.get('Image')
+        image_id = self.find_image(image)
+        if image_id is None:
+            raise APIError(404, 'No such image: %s' % image)
+
+        name = query.get('name') or new_id()[:12]
+        if any(container['Name'] == '/' + name for container in self.containers):
+            raise APIError(409, 'Conflict, The name %s is already assigned.' % name)
+
+        container = {
+            'Id': new_id(),
+            'Name': '/' + name,
+            'Image': image_id,
+            'Created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'Config': dict(body, Image=image),
+            'State': {'Running': False, 'ExitCode': 0, 'Pid': 0},
+            'NetworkSettings': {'Ports': None},
+            'HostConfig': {},
+        }
+        self.containers.append(container)
+        return 201, {'Id': container['Id'], 'Warnings': None}
+
+    def api_inspect_container(self, query, body, id):
+        container = self.find_container(id)
+        return dict((key, value) for (key, value) in container.items() if key != 'LinkedAs')
+
+    def api_start(self, query, body, id):
+        container = self.find_container(id)
+        body = body or {}
+        links = []
+        for link in body.get('Links') or []:
+            name, alias = link.split(':')
+            links.append((self.find_container(name), alias))
+
+        container['HostConfig'] = body
+        container['State'] = {'Running': True, 'ExitCode': 0, 'Pid': 1}
+        container['NetworkSettings']['Ports'] = body.get('PortBindings') or {}
+        for (target, alias) in links:
+            target.setdefault('LinkedAs', []).append('%s/%s' % (container['Name'], alias))
+        return 204, None
+
+    def api_stop(self, query, body, id):
+        self.exit(self.find_container(id), 0)
+        return 204, None
+
+    def api_restart(self, query, body, id):
+        container = self.find_container(id)
+        container['State'] = {'Running': True, 'ExitCode': 0, 'Pid': 1}
+        return 204, None
+
+    def api_kill(self, query, body, id):
+        self.exit(self.find_container(id), 137)
+        return 204, None
+
+    def api_wait(self, query, body, id):
+        container = self.find_container(id)
+        if container['State']['Running']:
+            self.exit(container, 0)
+        return {'StatusCode': container['State']['ExitCode']}
+
+    def exit(self, container, exit_code):
+        if container['State']['Running']:
+            container['State'] = {'Running': False, 'ExitCode': exit_code, 'Pid': 0}
+
+    def api_remove_container(self, query, body, id):
+        container = self.find_container(id)
+        if container['State']['Running'] and not flag(query, 'force'):
+            raise APIError(500, 'Conflict, You cannot remove a running container. Stop the container before attempting removal or use -f')
+        self.containers.remove(container)
+        for other in self.containers:
+            other['LinkedAs'] = [name for name in other.get('LinkedAs', []) if not name.startswith(container['Name'] + '/')]
+        return 204, None
+
+    def api_logs(self, query, body, id):
+        return Output(self.output(self.find_container(id), query), chunked=True)
+
+    def api_attach(self, query, body, id):
+        return Output(self.output(self.find_container(id), query), chunked=False)
+
+    def output(self, container, query):
+        streams = []
+        if flag(query, 'stdout', True):
+            streams.append(1)
+        if flag(query, 'stderr', True):
+            streams.append(2)
+        if not streams:
+            return []
+        return [
+            frame(streams[i % len(streams)], ('%s line %d\n' % (container['Name'][1:], i)).encode('utf-8'))
+            for i in range(self.log_lines)
+        ]
+
+    def api_images(self, query, body):
+        name = query.get('filter')
+        images = {}
+        for (tag, image_id) in sorted(self.images.items()):
+            if name is None or tag.rsplit(':', 1)[0] == name or tag == name:
+                images.setdefault(image_id, []).append(tag)
+        return [{'Id': image_id, 'RepoTags': tags, 'Created': 0, 'Size': 0, 'VirtualSize': 0}
+                for (image_id, tags) in sorted(images.items())]
+
+    def api_pull(self, query, body):
+        name = query.get('fromImage')
+        tag = query.get('tag') or 'latest'
+        layer = new_id()[:12]
+        self.add_image('%s:%s' % (name, tag))
+        return Output([json_line(event) for event in [
+            {'status': 'Pulling repository %s' % name},
+            {'status': 'Pulling image (%s) from %s' % (tag, name), 'id': layer},
+            {'status': 'Downloading', 'progressDetail': {'current': 512, 'total': 1024}, 'id': layer},
+            {'status': 'Downloading', 'progressDetail': {'current': 1024, 'total': 1024}, 'id': layer},
+            {'status': 'Download complete', 'progressDetail': {}, 'id': layer},
+        ]], chunked=True, delayed=True)
+
+    def api_tag(self, query, body, id):
+        image_id = self.find_image(id)
+        if image_id is None:
+            raise APIError(404, 'No such image: %s' % id)
+        self.add_image('%s:%s' % (query['repo'], query.get('tag') or 'latest'), image_id)
+        return 201, None
+
+    def api_build(self, query, body):
+        image_id = new_id()
+        if query.get('t'):
+            self.add_image(query['t'], image_id)
+        return Output([json_line(event) for event in [
+            {'stream': 'Step 0 : FROM busybox\n'},
+            {'stream': ' ---> %s\n' % image_id[:12]},
+            {'stream': 'Successfully built %s\n' % image_id[:12]},
+        ]], chunked=True, delayed=True)
+
+    def find_container(self, id):
+        for container in self.containers:
+            if container['Id'].startswith(id) or container['Name'] == '/' + id:
+                return container
+        raise APIError(404, 'No such container: %s' % id)
+
+    def find_image(self, name):
+        if name is None:
+            return None
+        if name in self.images.values():
+            return name
+        if ':' not in name.split('/')[-1]:
+            name += ':latest'
+        return self.images.get(name)
+
+    def summary(self, container):
+        state = container['State']
+        config = container['Config']
+        return {
+            'Id': container['Id'],
+            'Image': config['Image'],
+            'Names': [container['Name']] + container.get('LinkedAs', []),
+            'Command': ' '.join((config.get('Entrypoint') or []) + (config.get('Cmd') or [])),
+            'Created': 0,
+            'Status': 'Up 1 seconds' if state['Running'] else 'Exit %d' % state['ExitCode'],
+            'Ports': [],
+        }
+
+
+class Output(object):
+    """
+    A streamed response: chunked, or written as it is until the connection
+    is closed, the way attach hijacks it. The start of it is sent along
+    with the headers, as Docker does, unless `delayed` because docker-py
+    reads it straight off the socket, rather than fig.
+    """
+    def __init__(self, chunks, chunked, delayed=False):
+        self.chunks = chunks
+        self.chunked = chunked
+        self.delayed = delayed
+
+
+def flag(query, name, default=False):
+    if name not in query:
+        return default
+    return query[name].lower() in ('1', 'true')
+
+
+def frame(stream, data):
+    return struct.pack(str('>BxxxL'), stream, len(data)) + data
+
+
+def json_line(event):
+    return (json.dumps(event) + '\r\n').encode('utf-8')
+
+
+def new_id():
+    return binascii.hexlify(os.urandom(32)).decode('ascii')
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TCPHTTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffered, so that headers and the start of the body go out together
+    wbufsize = -1
+
+    def do_GET(self):
+        self.dispatch()
+
+    do_POST = do_DELETE = do_GET
+
+    def dispatch(self):
+        docker = self.server.docker
+        url = urlparse(self.path)
+        query = dict((key, values[-1]) for (key, values) in parse_qs(url.query).items())
+        body = self.read_body()
+
+        for (method, pattern, name) in ROUTES:
+            match = pattern.match(url.path)
+            if method == self.command and match:
+                break
+        else:
+            return self.respond(404, 'page not found')
+
+        docker.delay(name)
+        try:
+            if body and self.headers.get('Content-Type') == 'application/json':
+                body = json.loads(body.decode('utf-8'))
+            else:
+                body = None
+            with docker.lock:
+                result = getattr(docker, 'api_' + name)(query, body, **match.groupdict())
+        except APIError as e:
+            return self.respond(e.status, e.message)
+
+        if isinstance(result, Output):
+            return self.stream(result)
+        if isinstance(result, tuple):
+            return self.respond(*result)
+        return self.respond(200, result)
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+                if size == 0:
+                    return b''.join(chunks)
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def respond(self, status, result):
+        if result is None:
+            data = b''
+            content_type = 'text/plain'
+        elif isinstance(result, six.string_types):
+            data = result.encode('utf-8')
+            content_type = 'text/plain'
+        else:
+            data = json.dumps(result).encode('utf-8')
+            content_type = 'application/json'
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, output):
+        self.send_response(200)
+        if output.chunked:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        if output.delayed:
+            self.wfile.flush()
+            time.sleep(STREAM_DELAY)
+
+        for chunk in output.chunks:
+            if output.chunked:
+                chunk = ('%x\r\n' % len(chunk)).encode('ascii') + chunk + b'\r\n'
+            self.wfile.write(chunk)
+        if output.chunked:
+            self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
@@ -1,4 +1,5 @@
 from __future__ import absolute_import
+import os
 import sys
 
 from mock import patch
@@ -16,9 +17,12 @@ class CLITestCase(DockerClientTestCase):
         sys.exit = lambda code=0: None
         self.command = TopLevelCommand()
         self.command.base_dir = 'tests/fixtures/simple-figfile'
+        self.history = patch.dict(os.environ, {'FIG_HISTORY_FILE': ''})
+        self.history.start()
 
     def tearDown(self):
         sys.exit = self.old_sys_exit
+        self.history.stop()
         self.project.kill()
         self.project.remove_stopped()
 
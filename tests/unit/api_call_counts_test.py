@@ -0,0 +1,115 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from docker import Client
+import mock
+
+from fig.project import Project
+from ..call_recorder import CallRecorder
+from ..fake_docker import FakeDocker
+from .. import unittest
+
+
+def service_dicts(count):
+    return [
+        {
+            'name': 'service%d' % i,
+            'image': 'busybox',
+            'command': ['sleep', '300'],
+            'links': ['service0'] if i else [],
+        }
+        for i in range(count)
+    ]
+
+
+class APICallCountsTest(unittest.TestCase):
+    """
+    The Docker API calls each command makes. A new call here is a round trip
+    to the daemon for every service or container, so if one of these fails,
+    make sure the extra calls are really needed before updating it.
+    """
+    def setUp(self):
+        docker = FakeDocker().start()
+        self.addCleanup(docker.stop)
+        self.client = CallRecorder(Client(docker.base_url))
+        self.project = Project.from_dicts('figtest', service_dicts(5), self.client)
+
+    def scale(self, count):
+        for service in self.project.services:
+            service.scale(count)
+        self.client.reset()
+
+    def test_up_creates_containers(self):
+        self.project.up()
+
+        self.client.assert_counts({
+            'containers': 14,
+            'create_container': 5,
+            'inspect_container': 5,
+            'start': 5,
+        })
+
+    def test_up_recreates_containers(self):
+        self.scale(3)
+
+        self.project.up()
+
+        self.client.assert_counts({
+            'containers': 32,
+            'create_container': 30,
+            'inspect_container': 30,
+            'remove_container': 30,
+            'start': 30,
+            'stop': 15,
+            'wait': 15,
+        })
+
+    def test_up_without_recreating(self):
+        self.scale(3)
+
+        self.project.up(recreate=False)
+
+        self.client.assert_counts({'containers': 5, 'inspect_container': 15})
+
+    def test_stop(self):
+        self.scale(3)
+
+        self.project.stop()
+
+        self.client.assert_counts({'containers': 5, 'stop': 15})
+
+    def test_remove_stopped(self):
+        self.scale(3)
+        self.project.stop()
+        self.client.reset()
+
+        self.project.remove_stopped()
+
+        self.client.assert_at_most(5, 'containers')
+        self.client.assert_at_most(35)
+
+
+class CallRecorderTest(unittest.TestCase):
+    def test_records_requests(self):
+        client = mock.Mock()
+        client.containers.return_value = []
+        recorder = CallRecorder(client)
+
+        self.assertEqual(recorder.containers(all=True), [])
+        recorder._url('/containers/json')
+        recorder._get('/containers/json')
+
+        self.assertEqual(recorder.calls, [('containers', (), {'all': True}), ('_get', ('/containers/json',), {})])
+        self.assertEqual(recorder.counts(), {'containers': 1, '_get': 1})
+
+    def test_assertions(self):
+        recorder = CallRecorder(mock.Mock())
+        recorder.start('abc')
+        recorder.start('def')
+
+        recorder.assert_counts({'start': 2})
+        recorder.assert_at_most(2, 'start')
+        with self.assertRaises(AssertionError):
+            recorder.assert_counts({'start': 1})
+        with self.assertRaises(AssertionError):
+            recorder.assert_at_most(1)
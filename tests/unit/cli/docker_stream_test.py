@@ -0,0 +1,89 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import socket
+import struct
+from tests import unittest
+
+import mock
+import six
+
+from fig.cli.docker_stream import ChunkedDecoder, FrameReader, is_chunked, response_socket, STDOUT, STDERR
+
+
+class ChunkedDecoderTest(unittest.TestCase):
+    def test_whole_body(self):
+        decoder = ChunkedDecoder()
+        self.assertEqual(decoder.feed(b'5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n'), b'hello world')
+        self.assertTrue(decoder.finished)
+
+    def test_split_at_every_byte(self):
+        body = b'5\r\nhello\r\nc;ext=1\r\n and goodbye\r\n0\r\n\r\n'
+        decoder = ChunkedDecoder()
+        output = b''.join(decoder.feed(body[i:i + 1]) for i in range(len(body)))
+
+        self.assertEqual(output, b'hello and goodbye')
+        self.assertTrue(decoder.finished)
+
+    def test_unfinished(self):
+        decoder = ChunkedDecoder()
+        self.assertEqual(decoder.feed(b'a\r\nhello'), b'hello')
+        self.assertFalse(decoder.finished)
+
+
+class ResponseSocketTest(unittest.TestCase):
+    @unittest.skipIf(six.PY3, "reads Python 2's socket._fileobject buffer")
+    def test_returns_buffered_body(self):
+        rbuf = six.BytesIO()
+        rbuf.write(b'already read')
+        response = mock.Mock()
+        response.raw._fp.fp._rbuf = rbuf
+
+        sock, buffered = response_socket(response)
+
+        self.assertEqual(sock, response.raw._fp.fp._sock)
+        self.assertEqual(buffered, b'already read')
+        self.assertEqual(rbuf.getvalue(), b'')
+
+    def test_is_chunked(self):
+        response = mock.Mock(headers={'transfer-encoding': 'Chunked'})
+        self.assertTrue(is_chunked(response))
+        response.headers = {}
+        self.assertFalse(is_chunked(response))
+
+
+def frame(stream, payload):
+    return struct.pack(str('>BxxxL'), stream, len(payload)) + payload
+
+
+class FrameReaderTest(unittest.TestCase):
+    def test_merges_frames_from_the_same_stream(self):
+        data = frame(STDOUT, b'a') + frame(STDOUT, b'b') + frame(STDERR, b'c') + frame(STDOUT, b'd')
+        self.assertEqual(FrameReader().feed(data), [(STDOUT, b'ab'), (STDERR, b'c'), (STDOUT, b'd')])
+
+    def test_frame_split_across_feeds(self):
+        data = frame(STDOUT, b'hello') + frame(STDERR, b'world')
+        reader = FrameReader()
+        frames = []
+        for i in range(len(data)):
+            frames.extend(reader.feed(data[i:i + 1]))
+
+        self.assertEqual(frames, [(STDOUT, b'hello'), (STDERR, b'world')])
+
+    def test_frame_larger_than_buffer(self):
+        payload = b'x' * 100
+        ours, theirs = socket.socketpair()
+        ours.sendall(frame(STDOUT, payload) + frame(STDERR, b'after'))
+        ours.close()
+
+        reader = FrameReader(size=16)
+        frames = []
+        while True:
+            read = reader.read_from(theirs)
+            if read is None:
+                break
+            frames.extend(read)
+
+        self.assertEqual(frames, [(STDOUT, payload), (STDERR, b'after')])
+
+    def test_tty(self):
+        self.assertEqual(FrameReader(tty=True).feed(b'\x02raw'), [(STDOUT, b'\x02raw')])
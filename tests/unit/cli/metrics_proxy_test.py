@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from tests import unittest
+
+import mock
+
+from fig.cli.metrics_proxy import CallStats, Metrics, MetricsProxy
+
+
+class MetricsProxyTest(unittest.TestCase):
+    def test_calls_are_recorded_per_method_and_service(self):
+        client = mock.Mock()
+        client.containers.return_value = ['a']
+        metrics = Metrics()
+        proxy = MetricsProxy(client, metrics)
+
+        self.assertEqual(proxy.containers(all=True), ['a'])
+        proxy.containers()
+        proxy.labelled('web').start('abc')
+
+        client.containers.assert_called_with()
+        client.start.assert_called_once_with('abc')
+        self.assertEqual(metrics.stats[('-', 'containers')].count, 2)
+        self.assertEqual(metrics.stats[('web', 'start')].count, 1)
+
+    def test_only_requests_are_recorded(self):
+        client = mock.Mock()
+        client._url.return_value = '/containers/abc/logs'
+        metrics = Metrics()
+        proxy = MetricsProxy(client, metrics)
+
+        # What Container.logs_response does
+        response = proxy._get(proxy._url('/containers/abc/logs'), stream=True)
+        proxy._raise_for_status(response)
+
+        self.assertEqual(list(metrics.stats), [('-', '_get')])
+
+    def test_failed_calls_are_recorded(self):
+        client = mock.Mock()
+        client.inspect_container.side_effect = ValueError
+        metrics = Metrics()
+
+        with self.assertRaises(ValueError):
+            MetricsProxy(client, metrics).inspect_container('abc')
+        self.assertEqual(metrics.stats[('-', 'inspect_container')].count, 1)
+
+    def test_response_bytes(self):
+        client = mock.Mock(hooks={})
+        metrics = Metrics()
+        metrics.measure_responses(client)
+
+        def inspect_container(container_id):
+            for hook in client.hooks['response']:
+                hook(mock.Mock(headers={'content-length': '120'}))
+                hook(mock.Mock(headers={}))
+        client.inspect_container.side_effect = inspect_container
+
+        MetricsProxy(client, metrics).inspect_container('abc')
+        self.assertEqual(metrics.stats[('-', 'inspect_container')].bytes, 120)
+
+    def test_rows(self):
+        metrics = Metrics()
+        metrics.stats[('web', 'start')] = stats(0.5, 0.5)
+        metrics.stats[('-', 'containers')] = stats(0.001, 0.003, 0.004)
+
+        rows = metrics.rows()
+
+        self.assertEqual([row[:3] for row in rows], [['web', 'start', '2'], ['-', 'containers', '3'], ['Total', '', '5']])
+        self.assertEqual(rows[0][4:], ['1.00s', '500.0ms', '500.0ms', '500.0ms', '500.0ms'])
+
+
+class CallStatsTest(unittest.TestCase):
+    def test_percentiles_are_bucket_bounds(self):
+        calls = stats(*([0.003] * 90 + [0.3] * 10))
+        self.assertEqual(calls.percentile(0.5), 0.005)
+        self.assertEqual(calls.percentile(0.95), 0.3)
+
+
+def stats(*latencies):
+    call_stats = CallStats()
+    for seconds in latencies:
+        call_stats.add(seconds, 0)
+    return call_stats
@@ -0,0 +1,108 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from tests import unittest
+
+import mock
+from six.moves.urllib.request import urlopen
+from six.moves.urllib.error import HTTPError
+
+from fig.cli.instrumentation import OutputCounter
+from fig.cli.log_sinks import StreamSink
+from fig.cli.metrics_proxy import Metrics
+from fig.cli.prometheus import Collector, MetricsServer, format_family
+from fig.service import Service
+
+
+def make_source(name):
+    container = mock.Mock()
+    container.name = name
+    source = mock.Mock(container=container)
+    source.formatter.lines.side_effect = lambda stream, chunk: chunk
+    return source
+
+
+class CollectorTest(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.containers.return_value = [
+            {'Id': '1', 'Names': ['/myapp_web_1'], 'Status': 'Up 2 hours'},
+            {'Id': '2', 'Names': ['/myapp_web_2'], 'Status': 'Exit 1'},
+            {'Id': '3', 'Names': ['/other_web_1'], 'Status': 'Up 2 hours'},
+        ]
+        project = mock.Mock(client=self.client, services=[
+            Service('web', client=self.client, project='myapp', image='busybox'),
+            Service('db', client=self.client, project='myapp', image='busybox'),
+        ])
+        self.counter = OutputCounter()
+        self.sink = StreamSink(mock.Mock())
+        self.metrics = Metrics()
+        self.collector = Collector(project, self.counter, [self.sink], self.metrics)
+
+    def test_containers_by_state(self):
+        text = self.collector.collect()
+
+        self.assertIn('# TYPE fig_containers gauge\n', text)
+        self.assertIn('fig_containers{service="web",state="running"} 1\n', text)
+        self.assertIn('fig_containers{service="web",state="exited"} 1\n', text)
+        self.assertIn('fig_containers{service="db",state="running"} 0\n', text)
+        self.client.containers.assert_called_once_with(all=True)
+
+    def test_output_and_backlog(self):
+        source = make_source('myapp_web_1')
+        self.counter.write(source, 1, b'one\ntwo\n')
+        self.counter.exit(source, 0)
+        self.sink.write(source, 1, b'one\ntwo\n')
+
+        text = self.collector.collect()
+
+        self.assertIn('fig_container_output_lines_total{container="myapp_web_1"} 2\n', text)
+        self.assertIn('fig_container_output_bytes_total{container="myapp_web_1"} 8\n', text)
+        self.assertIn('fig_container_exits_total{container="myapp_web_1"} 1\n', text)
+        self.assertIn('fig_output_backlog_bytes{sink="StreamSink"} 8\n', text)
+        self.assertIn('fig_output_dropped_lines_total{sink="StreamSink"} 0\n', text)
+
+    def test_api_latency_histogram(self):
+        self.metrics.stats.clear()
+        self.metrics.end_call('start', 'web', self.metrics.start_call() - 0.003)
+
+        text = self.collector.collect()
+
+        name = 'fig_docker_api_request_duration_seconds'
+        self.assertIn('# TYPE %s histogram\n' % name, text)
+        self.assertIn('%s_bucket{le="0.002",method="start",service="web"} 0\n' % name, text)
+        self.assertIn('%s_bucket{le="0.005",method="start",service="web"} 1\n' % name, text)
+        self.assertIn('%s_bucket{le="+Inf",method="start",service="web"} 1\n' % name, text)
+        self.assertIn('%s_count{method="start",service="web"} 1\n' % name, text)
+
+    def test_format_escapes_labels(self):
+        self.assertEqual(
+            format_family('fig_x', 'gauge', 'X.', [({'name': 'a"b\\c'}, 1.5)]),
+            '# HELP fig_x X.\n# TYPE fig_x gauge\nfig_x{name="a\\"b\\\\c"} 1.5\n')
+
+    def test_scrapes_through_the_unrecorded_client(self):
+        recorded = mock.Mock()
+        collector = Collector(mock.Mock(client=recorded, services=[]), self.counter, client=self.client)
+        collector.collect()
+        self.assertFalse(recorded.containers.called)
+        self.client.containers.assert_called_once_with(all=True)
+
+
+class MetricsServerTest(unittest.TestCase):
+    def test_serves_on_all_interfaces_without_a_host(self):
+        server = MetricsServer(('', 0), mock.Mock())
+        self.addCleanup(server.server.server_close)
+        self.assertEqual(server.address[0], '0.0.0.0')
+
+    def test_serves_metrics(self):
+        collector = mock.Mock()
+        collector.collect.return_value = 'fig_x 1\n'
+        server = MetricsServer(('127.0.0.1', 0), collector).start()
+        self.addCleanup(server.stop)
+        url = 'http://127.0.0.1:%d' % server.address[1]
+
+        response = urlopen(url + '/metrics')
+        self.assertEqual(response.read(), b'fig_x 1\n')
+        self.assertTrue(response.info()['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        with self.assertRaises(HTTPError):
+            urlopen(url + '/')
@@ -0,0 +1,23 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from tests import unittest
+
+from fig.cli.utils import parse_since
+
+
+class ParseSinceTest(unittest.TestCase):
+    def test_timestamp(self):
+        self.assertEqual(parse_since('1406851200'), 1406851200)
+
+    def test_duration(self):
+        self.assertEqual(parse_since('90s', now=1000), 910)
+        self.assertEqual(parse_since('2h', now=10000), 2800)
+        self.assertEqual(parse_since('1d', now=100000), 13600)
+
+    def test_date(self):
+        self.assertEqual(parse_since('2014-08-01'), 1406851200)
+        self.assertEqual(parse_since('2014-08-01T10:00:00Z'), 1406887200)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_since('yesterday')
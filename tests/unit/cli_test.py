@@ -1,14 +1,25 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
+import functools
+import json
 import logging
 import os
+import shutil
+import tempfile
 from .. import unittest
 
 import mock
+from docker import Client
 
+from fig import history
 from fig.cli import main
+from fig.cli.log_printer import LogPrinter
 from fig.cli.main import TopLevelCommand
+from fig.cli.metrics_proxy import Metrics, MetricsProxy
+from fig.cli.trace_proxy import TraceProxy
+from fig.cli.verbose_proxy import VerboseProxy
 from six import StringIO
+from ..fake_docker import FakeDocker
 
 
 class CLITestCase(unittest.TestCase):
@@ -59,3 +70,192 @@ class CLITestCase(unittest.TestCase):
         main.setup_logging()
         self.assertEqual(logging.getLogger().level, logging.DEBUG)
         self.assertEqual(logging.getLogger('requests').propagate, False)
+
+    def test_log_printer_options(self):
+        options = {'--no-color': True, '--buffer-size': '1024', '--flush-interval': '20'}
+        self.assertEqual(main.log_printer_options(options), {
+            'monochrome': True,
+            'buffer_size': 1024,
+            'flush_interval': 0.02,
+        })
+
+    def test_log_printer_options_defaults(self):
+        options = {'--no-color': False, '--buffer-size': None, '--flush-interval': None}
+        self.assertEqual(main.log_printer_options(options), {'monochrome': False})
+
+    def test_log_printer_options_invalid_number(self):
+        with self.assertRaises(main.UserError):
+            main.log_printer_options({'--no-color': False, '--buffer-size': 'lots'})
+        for name in ('--buffer-size', '--flush-interval', '--backlog', '--rate', '--shards', '--log-max-size'):
+            with self.assertRaises(main.UserError):
+                main.log_printer_options({'--no-color': False, '--log-dir': '/tmp/logs', name: '0'})
+
+    def test_log_printer_options_overflow(self):
+        options = {'--no-color': False, '--overflow': 'drop', '--backlog': '10', '--rate': '5'}
+        self.assertEqual(main.log_printer_options(options), {
+            'monochrome': False,
+            'policy': 'drop',
+            'backlog': 10,
+            'rate': 5,
+        })
+
+    def test_log_printer_options_invalid_overflow(self):
+        with self.assertRaises(main.UserError):
+            main.log_printer_options({'--no-color': False, '--overflow': 'explode'})
+
+    def test_log_printer_options_sinks(self):
+        options = {'--no-color': False, '--log-dir': '/tmp/logs', '--log-max-size': '1024', '--log-gzip': True,
+                   '--syslog': '127.0.0.1:1514'}
+        file_sink, syslog_sink = main.log_printer_options(options)['sinks']
+        self.assertEqual(file_sink.directory, '/tmp/logs')
+        self.assertEqual(file_sink.file_options['max_size'], 1024)
+        self.assertTrue(file_sink.file_options['compress'])
+        self.assertEqual(syslog_sink.output.address, ('127.0.0.1', 1514))
+        syslog_sink.output.close()
+
+    def test_log_printer_options_invalid_syslog(self):
+        with self.assertRaises(main.UserError):
+            main.log_printer_options({'--no-color': False, '--syslog': 'host:port'})
+
+    def test_make_instrumentation(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        printer_options = {}
+        instrumentation = main.make_instrumentation(
+            {'--stats-file': os.path.join(directory, 'stats.jsonl')}, printer_options)
+        self.assertTrue(instrumentation.close_output)
+        self.assertEqual(printer_options['sinks'], [instrumentation.counter])
+        instrumentation.output.close()
+
+        with self.assertRaises(main.UserError):
+            main.make_instrumentation({'--stats-file': os.path.join(directory, 'missing', 'stats.jsonl')}, {})
+        with self.assertRaises(main.UserError):
+            main.make_instrumentation({'--stats-file': '-', '--stats-interval': '0'}, {})
+
+    def test_unwrap_client(self):
+        client = mock.Mock()
+        proxy = MetricsProxy(TraceProxy(VerboseProxy('docker', client)), Metrics())
+        self.assertIs(main.unwrap_client(proxy), client)
+        self.assertIs(main.unwrap_client(client), client)
+
+    def test_bad_trace_file(self):
+        handler = mock.Mock(__name__='up')
+        with self.assertRaises(main.UserError):
+            TopLevelCommand().perform_command({'--trace': '/nonexistent/trace.json'}, handler, {})
+        self.assertFalse(handler.called)
+
+    def test_trace_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'trace.json')
+        command = TopLevelCommand()
+        command.base_dir = 'tests/fixtures/simple-figfile'
+
+        with mock.patch.dict(os.environ, {'FIG_HISTORY_FILE': ''}):
+            with self.assertRaises(main.UserError):
+                command.perform_command({'--trace': path}, mock.Mock(__name__='up', side_effect=main.UserError('no')), {})
+
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual([event['name'] for event in events if event['ph'] == 'X'], ['up'])
+
+    def test_log_params_tail_zero(self):
+        options = {'--tail': '0', '--since': None, '--no-follow': False}
+        self.assertEqual(main.log_params(options)['tail'], 0)
+
+    def test_log_params_attach_by_default(self):
+        options = {'--tail': None, '--since': None, '--no-follow': False}
+        self.assertEqual(main.log_params(options), None)
+
+    def test_log_params(self):
+        options = {'--tail': '10', '--since': '1406851200', '--no-follow': True}
+        self.assertEqual(main.log_params(options), {
+            'follow': False,
+            'tail': 10,
+            'since': 1406851200,
+        })
+
+    def test_log_params_invalid_since(self):
+        with self.assertRaises(main.UserError):
+            main.log_params({'--tail': None, '--since': 'yesterday', '--no-follow': False})
+
+    def test_log_printer_options_patterns(self):
+        kwargs = main.log_printer_options({'--no-color': False, '--grep': 'GET|POST', '--exclude': None})
+        self.assertTrue(kwargs['grep'].search(b'POST /'))
+        self.assertNotIn('exclude', kwargs)
+
+    def test_log_printer_options_invalid_pattern(self):
+        with self.assertRaises(main.UserError):
+            main.log_printer_options({'--no-color': False, '--grep': '('})
+
+    def test_log_printer_options_format(self):
+        self.assertEqual(main.log_printer_options({'--no-color': False, '--format': 'json'}),
+                         {'monochrome': False, 'format': 'json'})
+        with self.assertRaises(main.UserError):
+            main.log_printer_options({'--no-color': False, '--format': 'xml'})
+
+    def test_log_printer_options_streams(self):
+        self.assertEqual(main.log_printer_options({'--no-color': False, '--stderr-only': True}),
+                         {'monochrome': False, 'streams': ('stderr',)})
+        with self.assertRaises(main.UserError):
+            main.log_printer_options({'--no-color': False, '--stderr-only': True, '--stdout-only': True})
+
+    def test_perf_history(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'history.jsonl')
+        for seconds in [1.0] * 5 + [2.0] * 5:
+            history.append(path, {'project': 'simplefigfile', 'durations': {'simple': {'start': [seconds]}}})
+
+        command = TopLevelCommand()
+        command.base_dir = 'tests/fixtures/simple-figfile'
+
+        def perf(*args):
+            # As native strings, the way they would come from sys.argv
+            command.dispatch([str(arg) for arg in ('perf', 'history') + args], None)
+
+        with mock.patch.dict(os.environ, {'FIG_HISTORY_FILE': path}):
+            with mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+                perf()
+            self.assertIn('REGRESSED', mock_stdout.getvalue())
+            self.assertIn('+100%', mock_stdout.getvalue())
+
+            with mock.patch('sys.stdout', new_callable=StringIO):
+                with self.assertRaises(main.UserError):
+                    perf('--fail')
+                perf('--fail', '--threshold', '150')
+
+
+class LogsOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.docker = FakeDocker(log_lines=3).start()
+        self.addCleanup(self.docker.stop)
+        Client(self.docker.base_url).create_container('busybox', name='simplefigfile_simple_1')
+        self.command = TopLevelCommand()
+        self.command.base_dir = 'tests/fixtures/simple-figfile'
+
+    def logs(self, *args):
+        output = tempfile.TemporaryFile('w+')
+        self.addCleanup(output.close)
+        self.stderr = StringIO()
+        with mock.patch.dict(os.environ, {'DOCKER_HOST': self.docker.base_url}):
+            with mock.patch('sys.stdout', output), mock.patch('sys.stderr', self.stderr):
+                with mock.patch('fig.cli.main.LogPrinter', functools.partial(LogPrinter, output=output)):
+                    self.command.dispatch([str(arg) for arg in ('logs', '--no-follow') + args], None)
+        output.seek(0)
+        return output.read()
+
+    def test_json_lines_only(self):
+        lines = self.logs('--format', 'json').splitlines()
+        self.assertEqual(len(lines), 3)
+        for line in lines:
+            self.assertEqual(json.loads(line)['container'], 'simple_1')
+        self.assertEqual(self.stderr.getvalue(), 'Attaching to simplefigfile_simple_1\n')
+
+    def test_no_prefix_is_output_as_it_is(self):
+        self.assertEqual(self.logs('--no-prefix'), ''.join('simplefigfile_simple_1 line %d\n' % i for i in range(3)))
+        self.assertEqual(self.stderr.getvalue(), 'Attaching to simplefigfile_simple_1\n')
+
+    def test_attaching_to(self):
+        self.assertTrue(self.logs().startswith('Attaching to simplefigfile_simple_1\n'))
+        self.assertEqual(self.stderr.getvalue(), '')
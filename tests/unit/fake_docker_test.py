@@ -0,0 +1,59 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import time
+
+from docker import Client
+from docker.errors import APIError
+
+from fig.project import Project
+from ..fake_docker import FakeDocker
+from .. import unittest
+
+
+class FakeDockerTest(unittest.TestCase):
+    def setUp(self):
+        self.docker = FakeDocker().start()
+        self.addCleanup(self.docker.stop)
+        self.client = Client(self.docker.base_url)
+
+    def test_project_up_and_remove(self):
+        project = Project.from_dicts('figtest', [
+            {'name': 'db', 'image': 'busybox', 'command': ['sleep', '300']},
+            {'name': 'web', 'image': 'redis', 'links': ['db']},
+        ], self.client)
+
+        containers = project.up()
+
+        self.assertEqual(sorted(c.name for c in containers), ['figtest_db_1', 'figtest_web_1'])
+        self.assertTrue(all(c.is_running for c in project.containers()))
+        web = project.get_service('web').containers()[0]
+        self.assertEqual(sorted(web.links()), ['db_1', 'figtest_db_1'])
+        # redis wasn't there, so it was pulled
+        self.assertEqual(self.docker.calls['pull'], 1)
+
+        project.stop()
+        project.remove_stopped()
+        self.assertEqual(project.containers(stopped=True), [])
+
+    def test_logs(self):
+        self.docker.log_lines = 2
+        container = self.client.create_container('busybox', name='figtest_db_1')
+
+        self.assertEqual(self.client.logs(container['Id']), b'figtest_db_1 line 0\nfigtest_db_1 line 1\n')
+
+    def test_errors(self):
+        with self.assertRaises(APIError) as context:
+            self.client.inspect_container('missing')
+        self.assertEqual(context.exception.response.status_code, 404)
+
+        container = self.client.create_container('busybox')
+        self.client.start(container['Id'])
+        with self.assertRaises(APIError):
+            self.client.remove_container(container['Id'])
+        self.client.remove_container(container['Id'], force=True)
+
+    def test_latency(self):
+        self.docker.latencies = {'version': 0.05}
+        started = time.time()
+        self.client.version()
+        self.assertTrue(time.time() - started >= 0.05)
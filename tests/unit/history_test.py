@@ -0,0 +1,132 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+
+import docker
+import mock
+
+from fig import history
+from fig.service import BuildError, Service
+from .. import unittest
+
+
+def entry(project, durations):
+    return {'time': 0, 'project': project, 'command': 'up', 'durations': durations}
+
+
+class RecorderTest(unittest.TestCase):
+    def test_nothing_is_recorded_until_started(self):
+        with history.phase('start', 'web'):
+            pass
+        self.assertIsNone(history.recorder)
+
+    def test_phases(self):
+        recorder = history.start()
+        self.addCleanup(history.stop)
+
+        def stream_output(output, stream, consumers):
+            for consumer in consumers:
+                consumer(dict(stream='Successfully built abababab'))
+
+        service = Service('web', client=mock.create_autospec(docker.Client), build='/path')
+        with mock.patch('fig.service.stream_output', side_effect=stream_output):
+            service.build()
+        with mock.patch('fig.service.stream_output'):
+            with self.assertRaises(BuildError):
+                service.build()
+        with history.phase('start', 'web'):
+            pass
+        with history.phase('start', 'web'):
+            pass
+
+        self.assertEqual(sorted(recorder.durations), ['web'])
+        self.assertEqual(sorted(recorder.durations['web']), ['build', 'start'])
+        self.assertEqual(len(recorder.durations['web']['build']), 1)
+        self.assertEqual(len(recorder.durations['web']['start']), 2)
+
+        saved = recorder.entry('figtest', 'up')
+        self.assertEqual((saved['project'], saved['command']), ('figtest', 'up'))
+        self.assertEqual(saved['durations'], recorder.durations)
+
+    def test_failed_create_is_not_recorded(self):
+        recorder = history.start()
+        self.addCleanup(history.stop)
+
+        client = mock.create_autospec(docker.Client)
+        client.create_container.side_effect = [
+            docker.errors.APIError('', mock.Mock(status_code=404), explanation='No such image: busybox'),
+            {'Id': 'abc'},
+        ]
+        service = Service('web', client=client, image='busybox')
+        with mock.patch('fig.service.stream_output'):
+            service.create_container()
+
+        self.assertEqual(sorted(recorder.durations['web']), ['create', 'pull'])
+        self.assertEqual(len(recorder.durations['web']['create']), 1)
+
+
+class TrendsTest(unittest.TestCase):
+    def test_regression(self):
+        entries = [entry('figtest', {'web': {'start': [1.0]}, 'db': {'create': [0.1, 0.3]}})] * 20
+        entries += [entry('figtest', {'web': {'start': [1.5]}, 'db': {'create': [0.2]}})] * 5
+
+        db, web = history.trends(entries)
+
+        self.assertEqual((db['service'], db['phase'], db['runs']), ('db', 'create', 25))
+        self.assertAlmostEqual(db['change'], 0)
+        self.assertFalse(db['regressed'])
+        self.assertEqual((web['baseline'], web['recent']), (1.0, 1.5))
+        self.assertAlmostEqual(web['change'], 50)
+        self.assertTrue(web['regressed'])
+
+        web, = [result for result in history.trends(entries, threshold=60) if result['service'] == 'web']
+        self.assertFalse(web['regressed'])
+
+    def test_needs_enough_runs_to_compare(self):
+        entries = [entry('figtest', {'web': {'start': [1.0]}})] * 2
+        entries += [entry('figtest', {'web': {'start': [2.0]}})] * 5
+
+        web, = history.trends(entries)
+        self.assertEqual(web['baseline'], 1.0)
+        self.assertFalse(web['regressed'])
+
+        web, = history.trends(entries[2:])
+        self.assertEqual((web['baseline'], web['change']), (None, None))
+
+    def test_phases_in_order(self):
+        phases = dict((name, [1.0]) for name in history.PHASES)
+        self.assertEqual(
+            [result['phase'] for result in history.trends([entry('figtest', {'web': phases})])],
+            list(history.PHASES))
+
+    def test_median(self):
+        self.assertEqual(history.median([3, 1, 2]), 2)
+        self.assertEqual(history.median([4, 1, 2, 3]), 2.5)
+
+
+class HistoryFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_append_and_load(self):
+        path = os.path.join(self.directory, 'fig', 'history.jsonl')
+        history.append(path, entry('figtest', {'web': {'start': [1.0]}}))
+        history.append(path, entry('other', {'web': {'start': [2.0]}}))
+        with open(path, 'a') as f:
+            f.write('{"time": 0, "proj\n')
+        history.append(path, entry('figtest', {'web': {'start': [3.0]}}))
+
+        entries = history.load(path, 'figtest')
+        self.assertEqual([e['durations']['web']['start'] for e in entries], [[1.0], [3.0]])
+
+    def test_load_missing_file(self):
+        self.assertEqual(history.load(os.path.join(self.directory, 'nothing'), 'figtest'), [])
+
+    def test_history_path(self):
+        with mock.patch.dict(os.environ, {'FIG_HISTORY_FILE': '~/timings.jsonl'}):
+            self.assertEqual(history.history_path(), os.path.expanduser('~/timings.jsonl'))
+        with mock.patch.dict(os.environ, {'FIG_HISTORY_FILE': ''}):
+            self.assertIsNone(history.history_path())
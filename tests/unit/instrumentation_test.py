@@ -0,0 +1,77 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import os
+import signal
+import threading
+
+import mock
+from six import StringIO
+
+from fig.cli.instrumentation import Instrumentation, OutputCounter
+from fig.cli.log_sinks import StreamSink
+from fig.cli.log_writer import DROP
+from .. import unittest
+
+
+class InstrumentationTest(unittest.TestCase):
+    def test_counts_output_per_container(self):
+        counter = OutputCounter()
+        counter.write(make_source('myapp_web_1'), 1, b'GET /\nPOST /\n')
+        counter.write(make_source('myapp_web_1'), 2, b'partial')
+        counter.write(make_source('myapp_db_1'), 1, b'ready\n')
+        counter.exit(make_source('myapp_db_1'), 0)
+
+        self.assertEqual(counter.counts(), {
+            'myapp_web_1': {'bytes': 20, 'lines': 2, 'exits': 0},
+            'myapp_db_1': {'bytes': 6, 'lines': 1, 'exits': 1},
+        })
+
+    def test_sample(self):
+        sink = StreamSink(mock.Mock(), backlog=4, policy=DROP)
+        source = make_source('myapp_web_1')
+        sink.write(source, 1, b'one\n')
+        sink.write(source, 1, b'two\n')
+        instrumentation = Instrumentation(StringIO())
+        instrumentation.sinks = [sink]
+        instrumentation.counter.write(source, 1, b'one\ntwo\n')
+
+        sample = instrumentation.sample()
+
+        self.assertEqual(sample['writers'], [{'sink': 'StreamSink', 'pending': 4, 'dropped': 1}])
+        self.assertEqual(sample['containers'], {'myapp_web_1': {'bytes': 8, 'lines': 2, 'exits': 0}})
+        self.assertEqual(sample['threads'], threading.active_count())
+        self.assertTrue(sample['rss'] > 0)
+        self.assertTrue(sample.get('allocations') or sample.get('objects'))
+
+    @unittest.skipUnless(hasattr(signal, 'SIGUSR1'), "needs SIGUSR1")
+    def test_writes_sample_on_sigusr1(self):
+        output = mock.Mock()
+        written = threading.Event()
+        output.flush.side_effect = lambda: written.set()
+        instrumentation = Instrumentation(output, interval=3600).start([])
+        try:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            self.assertTrue(written.wait(5) or written.is_set())
+        finally:
+            instrumentation.stop()
+
+        samples = [json.loads(call[0][0]) for call in output.write.call_args_list]
+        self.assertEqual(len(samples), 2)
+        self.assertEqual(samples[0]['pid'], os.getpid())
+
+    def test_stop_closes_output(self):
+        output = mock.Mock()
+        Instrumentation(output, interval=3600).start([]).stop()
+        self.assertFalse(output.close.called)
+
+        Instrumentation(output, interval=3600, close_output=True).start([]).stop()
+        self.assertTrue(output.close.called)
+
+
+def make_source(name):
+    container = mock.Mock()
+    container.name = name
+    source = mock.Mock(container=container)
+    source.formatter.lines.side_effect = lambda stream, chunk: chunk
+    return source
@@ -1,8 +1,20 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
+import json
 import os
+import re
+import socket
+import struct
 
-from fig.cli.log_printer import LogPrinter
+import mock
+from docker import Client
+
+from fig.cli.instrumentation import OutputCounter
+from fig.cli.log_printer import LogPrinter, LineFilter, timestamp_key
+from fig.cli.log_sinks import StreamSink
+from fig.cli.log_writer import BLOCK, DROP
+from fig.project import Project
+from ..fake_docker import FakeDocker
 from .. import unittest
 
 
@@ -40,30 +52,370 @@ class LogPrinterTest(unittest.TestCase):
 
         self.assertIn(glyph, output)
 
+    def test_frame_split_across_reads(self):
+        def reader(*args, **kwargs):
+            yield b'hel'
+            yield b'lo\n'
+
+        container = MockContainer(reader, chunk_size=3)
+        output = run_log_printer([container], monochrome=True)
+
+        self.assertEqual(output, 'web_1 | hello\nmyapp_web_1 exited with code 0\n')
+
+    def test_multiple_containers(self):
+        def reader(*args, **kwargs):
+            yield b'hello\n'
+
+        containers = [MockContainer(reader), MockContainer(reader, name='db_1')]
+        output = run_log_printer(containers, monochrome=True)
+
+        self.assertIn('hello', output)
+        self.assertIn('exited with code 0', output)
+
+    def test_logs_endpoint_without_following(self):
+        def reader(*args, **kwargs):
+            yield b'hello\n'
+
+        web, db = MockContainer(reader), MockContainer(reader, name='db_1')
+        output = run_log_printer([web, db], monochrome=True, log_params={'follow': False, 'tail': 10})
+
+        self.assertEqual(output.count('hello'), 2)
+        self.assertNotIn('exited', output)
+        self.assertEqual(web.logs_params, {'stdout': 1, 'stderr': 1, 'follow': 0, 'tail': 10})
+
+    def test_grep_and_exclude(self):
+        def reader(*args, **kwargs):
+            yield b'GET /\nGET /health\nPOST /\npartial GET'
+
+        container = MockContainer(reader)
+        output = run_log_printer([container], monochrome=True, grep=re.compile(b'GET'), exclude=re.compile(b'health'))
+
+        self.assertEqual(output, 'web_1 | GET /\nweb_1 | partial GETmyapp_web_1 exited with code 0\n')
+
+    def test_json_format(self):
+        def reader(*args, **kwargs):
+            yield b'hello\n'
+            yield (2, b'w\xe2\x80\xa2rld\n')
+
+        output = run_log_printer([MockContainer(reader)], format='json')
+        lines = [json.loads(line) for line in output.splitlines()]
+
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0]['container'], 'web_1')
+        self.assertEqual(lines[0]['service'], 'web')
+        self.assertEqual(lines[0]['number'], 1)
+        self.assertEqual(lines[0]['stream'], 'stdout')
+        self.assertEqual(lines[0]['message'], 'hello')
+        self.assertIn('time', lines[0])
+        self.assertEqual(lines[1]['stream'], 'stderr')
+        self.assertEqual(lines[1]['message'], u'w\u2022rld')
+        self.assertEqual(lines[2]['event'], 'exit')
+        self.assertEqual(lines[2]['exit_code'], 0)
+        self.assertNotIn('\033[', output)
+
+    def test_streams_are_split_separately(self):
+        def reader(*args, **kwargs):
+            yield b'out'
+            yield (2, b'err\n')
+            yield b'put\n'
+
+        output = run_log_printer([MockContainer(reader)], monochrome=True)
+
+        self.assertIn('web_1 | err\n', output)
+        self.assertIn('web_1 | output\n', output)
+
+    def test_tty_output_is_not_framed(self):
+        def reader(*args, **kwargs):
+            yield b'\x01\x00\x00\x00 raw\n'
+
+        output = run_log_printer([MockContainer(reader, tty=True)], format='json')
+
+        self.assertEqual(json.loads(output.splitlines()[0])['message'], '\x01\x00\x00\x00 raw')
+
+    def test_streams_are_requested_from_docker(self):
+        def reader(*args, **kwargs):
+            yield (2, b'oops\n')
+
+        container = MockContainer(reader)
+        output = run_log_printer([container], monochrome=True, streams=('stderr',))
+
+        self.assertIn('oops', output)
+        self.assertEqual(container.attach_params, {'stdout': 0, 'stderr': 1, 'stream': 1})
+
+    def test_extra_sinks(self):
+        def reader(*args, **kwargs):
+            yield b'GET /\nPOST /\n'
 
-def run_log_printer(containers, monochrome=False):
+        sink = mock.Mock()
+        container = MockContainer(reader)
+        output = run_log_printer([container], monochrome=True, grep=re.compile(b'GET'), sinks=[sink])
+
+        self.assertIn('web_1 | GET /\n', output)
+        sink.start.assert_called_once_with()
+        (source, stream, chunk), _ = sink.write.call_args
+        self.assertIs(source.container, container)
+        self.assertEqual((stream, chunk), (1, b'GET /\n'))
+        sink.exit.assert_called_once_with(source, 0)
+        sink.close.assert_called_once_with()
+
+    def test_no_prefix(self):
+        def reader(*args, **kwargs):
+            yield b'hello\n'
+            yield (2, b'world\n')
+
+        containers = [MockContainer(reader), MockContainer(reader, name='db_1')]
+        output = run_log_printer(containers, monochrome=True, prefix=False)
+
+        self.assertEqual(output.count('hello\n'), 2)
+        self.assertNotIn('|', output)
+
+    def test_pass_through(self):
+        def reader(*args, **kwargs):
+            yield b'hello\n'
+            yield (2, b'partial')
+            yield b' line\n'
+
+        with mock.patch('fig.cli.log_printer.LineBuffer') as line_buffer:
+            output = run_log_printer([MockContainer(reader, chunk_size=5)], monochrome=True, prefix=False)
+
+        self.assertEqual(output, 'hello\npartial line\nmyapp_web_1 exited with code 0\n')
+        self.assertFalse(line_buffer.called)
+
+    def test_pass_through_tty_logs(self):
+        def reader(*args, **kwargs):
+            yield b'raw \x01 output'
+
+        container = MockContainer(reader, tty=True)
+        output = run_log_printer([container], prefix=False, log_params={'follow': False})
+
+        self.assertEqual(output, 'raw \x01 output')
+
+        output = run_log_printer([MockContainer(reader, tty=True, chunk_size=3)], monochrome=True, prefix=False)
+        self.assertEqual(output, 'raw \x01 outputmyapp_web_1 exited with code 0\n')
+
+    def test_shards(self):
+        def reader(*args, **kwargs):
+            for i in range(100):
+                yield ('line %d\n' % i).encode('ascii')
+
+        containers = [MockContainer(reader, name='web_%d' % i) for i in range(1, 6)]
+        output = run_log_printer(containers, monochrome=True, shards=2, log_params={'follow': False},
+                                 grep=re.compile(b'line'), exclude=re.compile(b'line 5'))
+
+        for i in range(1, 6):
+            prefix = 'web_%d | ' % i
+            lines = [line[len(prefix):] for line in output.splitlines() if line.startswith(prefix)]
+            self.assertEqual(lines, ['line %d' % n for n in range(100) if not str(n).startswith('5')])
+
+    def test_shards_stop_at_first_exit(self):
+        def reader(*args, **kwargs):
+            yield b'hello\n'
+
+        containers = [MockContainer(reader), MockContainer(reader, name='db_1')]
+        output = run_log_printer(containers, monochrome=True, shards=2)
+
+        self.assertIn('hello', output)
+        self.assertEqual(output.count('exited with code 0'), 1)
+
+    def test_terminal_drops_output_when_other_sinks_store_it(self):
+        store, counter = mock.Mock(stores_output=True), OutputCounter()
+
+        def terminal(**kwargs):
+            printer = LogPrinter([], **kwargs)
+            self.assertIs(printer.sinks[-1].__class__, StreamSink)
+            return printer.sinks[-1].writer
+
+        self.assertEqual(terminal(sinks=[store]).policy, DROP)
+        self.assertEqual(terminal(sinks=[counter]).policy, BLOCK)
+        self.assertEqual(terminal(sinks=[store], policy=BLOCK).policy, BLOCK)
+        self.assertEqual(terminal().policy, BLOCK)
+
+    def test_shards_with_other_sinks(self):
+        with self.assertRaises(ValueError):
+            LogPrinter([], shards=2, sinks=[mock.Mock()])
+
+    def test_merged_history(self):
+        def history(*lines):
+            def reader(follow=0, **kwargs):
+                if not follow:
+                    return iter(lines)
+                # What was written since the history was read, and again
+                # what was already printed from the same second on
+                return iter(lines[-1:] + (b'2014-08-01T10:00:03.5Z live\n',))
+            return reader
+
+        web = MockContainer(history(
+            b'2014-08-01T10:00:00.5Z web one\n',
+            (2, b'2014-08-01T10:00:02Z web two\n'),
+        ))
+        db = MockContainer(history(
+            b'2014-08-01T10:00:00.25Z db one\n2014-08-01T10:00:01.000000001Z db two\n',
+            b'2014-08-01T10:00:03Z db three\n',
+        ), name='db_1')
+        output = run_log_printer([web, db], monochrome=True, merge=True)
+
+        self.assertEqual(output.splitlines()[:5], [
+            'db_1  | db one',
+            'web_1 | web one',
+            'db_1  | db two',
+            'web_1 | web two',
+            'db_1  | db three',
+        ])
+        self.assertIn('| live', output)
+        self.assertEqual(output.count('two'), 2)
+        self.assertEqual(output.count('three'), 1)
+        history_params, live_params = web.logs_calls
+        self.assertEqual(history_params, {'stdout': 1, 'stderr': 1, 'follow': 0, 'tail': 'all', 'timestamps': 1})
+        self.assertEqual(live_params, {'stdout': 1, 'stderr': 1, 'follow': 1, 'tail': 'all', 'timestamps': 1,
+                                       'since': 1406887202})
+
+    def test_merged_history_follows_container_without_history(self):
+        def reader(follow=0, **kwargs):
+            if follow:
+                yield b'2014-08-01T10:00:00Z hello\n'
+
+        container = MockContainer(reader)
+        output = run_log_printer([container], monochrome=True, merge=True, log_params={'tail': 5})
+
+        self.assertEqual(output.splitlines()[0], 'web_1 | hello')
+        self.assertEqual(container.logs_calls[1], {'stdout': 1, 'stderr': 1, 'follow': 1, 'tail': 5, 'timestamps': 1})
+
+    def test_merged_history_without_following(self):
+        def reader(**kwargs):
+            yield b'2014-08-01T10:00:00Z hello\n'
+
+        container = MockContainer(reader)
+        output = run_log_printer([container], monochrome=True, merge=True, log_params={'follow': False})
+
+        self.assertEqual(output, 'web_1 | hello\n')
+        self.assertEqual(len(container.logs_calls), 1)
+
+    def test_timestamp_key_pads_fraction(self):
+        stamps = [b'2014-08-01T10:00:00Z', b'2014-08-01T10:00:00.12345Z', b'2014-08-01T10:00:00.1234Z']
+        self.assertEqual(sorted(stamps, key=timestamp_key), [stamps[0], stamps[2], stamps[1]])
+
+
+class LineFilterTest(unittest.TestCase):
+    def test_grep_skips_chunk_without_match(self):
+        self.assertEqual(LineFilter(grep=re.compile(b'x'))(b'a\nb\n'), b'')
+
+    def test_exclude_keeps_chunk_without_match(self):
+        chunk = b'a\nb\n'
+        self.assertIs(LineFilter(exclude=re.compile(b'x'))(chunk), chunk)
+
+    def test_grep_and_exclude(self):
+        line_filter = LineFilter(grep=re.compile(b'a'), exclude=re.compile(b'b'))
+        self.assertEqual(line_filter(b'a\nab\nc\nca'), b'a\nca')
+
+    def test_anchored_patterns_match_each_line(self):
+        chunk = b'INFO start\nERROR boom\nINFO ok\n'
+        self.assertEqual(LineFilter(grep=re.compile(b'^ERROR'))(chunk), b'ERROR boom\n')
+        self.assertEqual(LineFilter(grep=re.compile(b'boom$'))(chunk), b'ERROR boom\n')
+        self.assertEqual(LineFilter(exclude=re.compile(b'^INFO'))(chunk), b'ERROR boom\n')
+        self.assertEqual(LineFilter(exclude=re.compile(b'start$'))(chunk), b'ERROR boom\nINFO ok\n')
+
+    def test_patterns_that_look_past_the_line_match_each_line(self):
+        chunk = b'INFO start\nERROR boom\nINFO ok\n'
+        self.assertEqual(LineFilter(grep=re.compile(br'\AERROR'))(chunk), b'ERROR boom\n')
+        self.assertEqual(LineFilter(grep=re.compile(br'start\Z'))(chunk), b'INFO start\n')
+        self.assertEqual(LineFilter(grep=re.compile(b'(?<!\n)ERROR'))(chunk), b'ERROR boom\n')
+        self.assertEqual(LineFilter(exclude=re.compile(b'(?<!\n)INFO'))(chunk), b'ERROR boom\n')
+        self.assertEqual(LineFilter(exclude=re.compile(b'ok(?!\n)'))(chunk), b'INFO start\nERROR boom\n')
+
+
+class AttachTest(unittest.TestCase):
+    def test_history_that_arrives_with_the_headers(self):
+        docker = FakeDocker(log_lines=20).start()
+        self.addCleanup(docker.stop)
+        project = Project.from_dicts('figtest', [{'name': 'web', 'image': 'busybox'}], Client(docker.base_url))
+        project.up()
+
+        output = run_log_printer(project.containers(), monochrome=True, attach_params={'logs': True})
+
+        self.assertEqual(
+            [line for line in output.splitlines() if '|' in line],
+            ['web_1 | figtest_web_1 line %d' % i for i in range(20)])
+
+
+def run_log_printer(containers, monochrome=False, **kwargs):
     r, w = os.pipe()
     reader, writer = os.fdopen(r, 'r'), os.fdopen(w, 'w')
-    printer = LogPrinter(containers, output=writer, monochrome=monochrome)
+    printer = LogPrinter(containers, output=writer, monochrome=monochrome, **kwargs)
     printer.run()
     writer.close()
     return reader.read()
 
 
+def frame(payload):
+    stream = 1
+    if isinstance(payload, tuple):
+        stream, payload = payload
+    return struct.pack(str('>BxxxL'), stream, len(payload)) + payload
+
+
 class MockContainer(object):
-    def __init__(self, reader):
+    def __init__(self, reader, name='web_1', chunk_size=None, tty=False):
         self._reader = reader
+        self._name = name
+        self._chunk_size = chunk_size
+        self._tty = tty
+        self.client = mock.Mock()
 
     @property
     def name(self):
-        return 'myapp_web_1'
+        return 'myapp_' + self._name
 
     @property
     def name_without_project(self):
-        return 'web_1'
+        return self._name
+
+    @property
+    def number(self):
+        return int(self._name.split('_')[-1])
+
+    def get(self, key):
+        return {'Config.Tty': self._tty}[key]
+
+    def attach_response(self, **params):
+        self.attach_params = params
+        if self._tty:
+            sock = self._socket(b''.join(self._reader()))
+        else:
+            sock = self._socket(b''.join(frame(payload) for payload in self._reader()))
+
+        response = mock.Mock(headers={})
+        response.raw._fp.fp._sock = sock
+        response.raw._fp.fp.raw._sock = sock
+        response.raw._fp.fp._rbuf.getvalue.return_value = b''
+        return response
+
+    def logs_response(self, **params):
+        """
+        A chunked response whose first chunk httplib has already buffered,
+        followed by a connection that is kept open.
+        """
+        self.logs_params = params
+        self.logs_calls = getattr(self, 'logs_calls', []) + [params]
+        if self._tty:
+            data = b''.join(self._reader(**params))
+        else:
+            data = b''.join(frame(payload) for payload in self._reader(**params))
+        body = ('%x\r\n' % len(data)).encode('ascii') + data + b'\r\n0\r\n\r\n'
+        self._keep_alive, sock = socket.socketpair()
+
+        response = mock.Mock(headers={'transfer-encoding': 'chunked'})
+        response.raw._fp.fp._sock = sock
+        response.raw._fp.fp.raw._sock = sock
+        response.raw._fp.fp._rbuf.getvalue.return_value = body
+        return response
 
-    def attach(self, *args, **kwargs):
-        return self._reader()
+    def _socket(self, data):
+        ours, theirs = socket.socketpair()
+        chunk_size = self._chunk_size or len(data) or 1
+        for i in range(0, len(data), chunk_size):
+            ours.sendall(data[i:i + chunk_size])
+        ours.close()
+        return theirs
 
     def wait(self, *args, **kwargs):
         return 0
@@ -0,0 +1,65 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import threading
+
+import mock
+from docker import Client
+
+from fig.cli.log_printer import EXIT, LogPrinter
+from fig.cli.log_shards import run_shard, frame, LINES, EXITED
+from fig.cli.log_writer import BLOCK
+from fig.project import Project
+from ..fake_docker import FakeDocker
+from .. import unittest
+
+
+class RunShardTest(unittest.TestCase):
+    def test_frames_are_written_for_their_container(self):
+        source = mock.Mock()
+        source.formatter.lines.side_effect = lambda stream, data: b'web_1 | ' + data
+        container = mock.Mock()
+        read_fd, write_fd = os.pipe()
+
+        with mock.patch('fig.cli.log_shards.Multiplexer') as multiplexer:
+            multiplexer.return_value.loop.return_value = [(source, 1, b'hello\n'), (source, EXIT, 0)]
+            with mock.patch('fig.cli.log_shards.LogWriter') as log_writer:
+                run_shard([(3, container, mock.Mock())], lambda container, formatter: source,
+                          None, read_fd, write_fd)
+
+        self.assertEqual(log_writer.call_args[1], {'policy': BLOCK})
+        writer = log_writer.return_value.start.return_value
+        self.assertEqual(writer.write.mock_calls, [
+            mock.call(frame(3, LINES, b'web_1 | hello\n'), source),
+            mock.call(frame(3, EXITED, b'0'), source),
+        ])
+        writer.output.close.assert_called_once_with()
+        container.client.close.assert_called_once_with()
+        log_writer.call_args[0][0].close()
+
+
+class ShardsOverTCPTest(unittest.TestCase):
+    def test_workers_dont_share_the_parents_connections(self):
+        docker = FakeDocker(tcp=True, latency=0.01, log_lines=20).start()
+        self.addCleanup(docker.stop)
+        client = Client(docker.base_url)
+        project = Project.from_dicts('figtest', [
+            {'name': name, 'image': 'busybox'} for name in ('web', 'db', 'worker', 'cache')
+        ], client)
+        project.up()
+        # Leaves an idle keep-alive connection in the pool
+        containers = project.containers()
+
+        read_fd, write_fd = os.pipe()
+        reader, writer = os.fdopen(read_fd, 'r'), os.fdopen(write_fd, 'w')
+        printer = LogPrinter(containers, output=writer, monochrome=True, shards=2, log_params={'follow': False})
+        thread = threading.Thread(target=printer.run)
+        thread.daemon = True
+        thread.start()
+        thread.join(30)
+        self.assertFalse(thread.is_alive(), "workers got stuck on a shared connection")
+        writer.close()
+        output = reader.read()
+
+        for container in containers:
+            self.assertIn('%s line 19' % container.name, output)
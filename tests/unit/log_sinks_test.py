@@ -0,0 +1,134 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import gzip
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+import mock
+
+from fig.cli.log_printer import TextFormatter
+from fig.cli.log_sinks import FileSink, RotatingFile, SyslogSink, parse_address
+from .. import unittest
+
+
+class RotatingFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'web.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_rotates_by_size(self):
+        log_file = RotatingFile(self.path, max_size=10, keep=2)
+        for data in [b'aaaaaa\n', b'bbbbbb\n', b'cccccc\n', b'dddddd\n']:
+            log_file.write(data)
+        log_file.close()
+
+        self.assertEqual(self.read(self.path), b'dddddd\n')
+        self.assertEqual(self.read(self.path + '.1'), b'cccccc\n')
+        self.assertEqual(self.read(self.path + '.2'), b'bbbbbb\n')
+        self.assertFalse(os.path.exists(self.path + '.3'))
+
+    def test_rotates_by_age(self):
+        log_file = RotatingFile(self.path, max_age=60)
+        log_file.write(b'old\n')
+        with mock.patch('time.time', return_value=log_file.opened + 60):
+            log_file.write(b'new\n')
+        log_file.close()
+
+        self.assertEqual(self.read(self.path), b'new\n')
+        self.assertEqual(self.read(self.path + '.1'), b'old\n')
+
+    def test_compresses_rotated_files(self):
+        log_file = RotatingFile(self.path, max_size=4, compress=True)
+        log_file.write(b'old\n')
+        log_file.write(b'new\n')
+        log_file.close()
+
+        rotated = gzip.open(self.path + '.1.gz', 'rb')
+        self.assertEqual(rotated.read(), b'old\n')
+        rotated.close()
+        self.assertFalse(os.path.exists(self.path + '.1'))
+
+    def test_appends_to_existing_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'before\n')
+        log_file = RotatingFile(self.path, max_size=10)
+        log_file.write(b'after\n')
+        log_file.close()
+
+        self.assertEqual(self.read(self.path + '.1'), b'before\n')
+
+
+class FileSinkTest(unittest.TestCase):
+    def test_writes_a_file_per_container(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        web, db = make_source('web_1'), make_source('db_1')
+
+        sink = FileSink(os.path.join(directory, 'logs')).start()
+        sink.write(web, 1, b'hello\n')
+        sink.write(db, 2, b'oops\n')
+        sink.exit(web, 0)
+        sink.close()
+
+        with open(os.path.join(directory, 'logs', 'myapp_web_1.log'), 'rb') as f:
+            self.assertEqual(f.read(), b'hello\n[myapp_web_1 exited with code 0]\n')
+        with open(os.path.join(directory, 'logs', 'myapp_db_1.log'), 'rb') as f:
+            self.assertEqual(f.read(), b'oops\n')
+
+    def test_one_thread_for_all_containers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        sources = [make_source('web_%d' % i) for i in range(50)]
+        threads = threading.active_count()
+
+        sink = FileSink(directory).start()
+        for source in sources:
+            sink.write(source, 1, b'hello\n')
+        self.assertEqual(threading.active_count(), threads + 1)
+        sink.close()
+
+        self.assertEqual(sorted(os.listdir(directory)), sorted('myapp_web_%d.log' % i for i in range(50)))
+
+
+class SyslogSinkTest(unittest.TestCase):
+    def test_sends_a_datagram_per_line(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+
+        sink = SyslogSink(server.getsockname(), hostname='host').start()
+        sink.write(make_source('web_1'), 1, b'one\ntwo\n')
+        sink.write(make_source('web_1'), 2, b'oops')
+        sink.close()
+
+        messages = [server.recv(1024) for _ in range(3)]
+        self.assertTrue(messages[0].startswith(b'<14>'))
+        self.assertTrue(messages[0].endswith(b' host myapp_web_1: one'))
+        self.assertTrue(messages[1].endswith(b' host myapp_web_1: two'))
+        self.assertTrue(messages[2].startswith(b'<11>'))
+        self.assertTrue(messages[2].endswith(b': oops'))
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('logs.example.com'), ('logs.example.com', 514))
+        self.assertEqual(parse_address('10.0.0.1:1514'), ('10.0.0.1', 1514))
+        self.assertEqual(parse_address('[::1]:1514'), ('::1', 1514))
+        self.assertEqual(parse_address(':9100'), ('', 9100))
+        with self.assertRaises(ValueError):
+            parse_address('host:port')
+
+
+def make_source(name):
+    container = mock.Mock(name_without_project=name)
+    container.name = 'myapp_' + name
+    return mock.Mock(container=container, formatter=TextFormatter(container, name + ' | ', lambda s: s))
@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+
+import mock
+
+from fig.cli.log_store import LogStore, SegmentIndex, SegmentWriter, StoreSink, read_index, trigram_numbers, trigrams
+from .. import unittest
+
+
+class LogStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def store_output(self, writes, window=100):
+        sink = StoreSink(self.directory, window=window).start()
+        for (now, name, stream, chunk) in writes:
+            with mock.patch('time.time', return_value=now):
+                sink.write(make_source(name), stream, chunk)
+        sink.close()
+
+    def test_search_merges_containers_in_time_order(self):
+        self.store_output([
+            (10, 'myapp_web_1', 1, b'GET /\nPOST /\n'),
+            (20, 'myapp_db_1', 2, b'GET lock\n'),
+            (30, 'myapp_web_1', 1, b'GET /health'),
+        ])
+
+        results = list(LogStore(self.directory).search(b'GET'))
+
+        self.assertEqual(results, [
+            (10.0, 'myapp_web_1', 1, b'GET /'),
+            (20.0, 'myapp_db_1', 2, b'GET lock'),
+            (30.0, 'myapp_web_1', 1, b'GET /health'),
+        ])
+
+    def test_segments_are_indexed(self):
+        self.store_output([
+            (10, 'myapp_web_1', 1, b'hello\n'),
+            (150, 'myapp_web_1', 1, b'world\n'),
+        ])
+
+        index = read_index(os.path.join(self.directory, 'myapp_web_1', '0.log'))
+        self.assertEqual((index['start'], index['end'], index['lines']), (10.0, 10.0, 1))
+        self.assertEqual(list(index['trigrams']), trigram_numbers(trigrams(b'hello')))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'myapp_web_1', '100.log.idx')))
+
+    def test_index_is_built_as_segment_is_written(self):
+        index = SegmentIndex()
+        index.add(b'10.0 1 GET /a\n11.0 1 GET /a\n')
+        index.add(b'')
+        index.add(b'12.5 2 done\n')
+
+        self.assertEqual((index.start, index.end, index.lines, index.size), (10.0, 12.5, 3, 40))
+        self.assertEqual(index.grams, trigrams(b'GET /a') | trigrams(b'done'))
+
+    def test_batch_is_split_between_windows(self):
+        segments = SegmentWriter(self.directory, window=100)
+        segments.write(b'98.0 1 one\n99.5 1 two\n100.5 2 three\n')
+        segments.close()
+
+        with open(os.path.join(self.directory, '0.log'), 'rb') as f:
+            self.assertEqual(f.read(), b'98.0 1 one\n99.5 1 two\n')
+        with open(os.path.join(self.directory, '100.log'), 'rb') as f:
+            self.assertEqual(f.read(), b'100.5 2 three\n')
+        self.assertEqual(read_index(os.path.join(self.directory, '100.log'))['lines'], 1)
+
+    def test_segment_with_another_writer_is_not_indexed(self):
+        # Two runs writing for the same container in the same window, so the
+        # second hasn't seen all of the segment
+        self.store_output([(10, 'myapp_web_1', 1, b'hello\n')])
+        self.store_output([(20, 'myapp_web_1', 1, b'world\n')])
+
+        self.assertIsNone(read_index(os.path.join(self.directory, 'myapp_web_1', '0.log')))
+        self.assertEqual([r[3] for r in LogStore(self.directory).search(b'world')], [b'world'])
+
+    def test_search_skips_segments_by_index(self):
+        self.store_output([
+            (10, 'myapp_web_1', 1, b'hello\n'),
+            (150, 'myapp_web_1', 1, b'world\n'),
+        ])
+        store = LogStore(self.directory, window=100)
+
+        with mock.patch('fig.cli.log_store.search_segment', return_value=[]) as search_segment:
+            list(store.search(b'world'))
+        self.assertEqual(search_segment.call_count, 1)
+
+        self.assertEqual([r[3] for r in store.search(b'o', since=100)], [b'world'])
+        self.assertEqual([r[3] for r in store.search(b'hello', names=['myapp_db_1'])], [])
+
+    def test_search_unindexed_segment(self):
+        path = os.path.join(self.directory, 'myapp_web_1')
+        os.makedirs(path)
+        with open(os.path.join(path, '0.log'), 'wb') as f:
+            f.write(b'1.5 1 still being written\n')
+
+        results = list(LogStore(self.directory).search(b'written'))
+        self.assertEqual(results, [(1.5, 'myapp_web_1', 1, b'still being written')])
+
+
+def make_source(name):
+    container = mock.Mock()
+    container.name = name
+    return mock.Mock(container=container)
@@ -0,0 +1,128 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import time
+
+from fig.cli.log_writer import LogWriter, BLOCK, DROP, SAMPLE
+from .. import unittest
+
+
+class LogWriterTest(unittest.TestCase):
+    def test_coalesces_writes(self):
+        output = RecordingOutput()
+        writer = LogWriter(output, buffer_size=1024, flush_interval=10)
+        for _ in range(10):
+            writer.write(b'line\n')
+        writer.close()
+
+        self.assertEqual(output.writes, [b'line\n' * 10])
+
+    def test_flushes_at_buffer_size(self):
+        output = RecordingOutput()
+        writer = LogWriter(output, buffer_size=8, flush_interval=10).start()
+        writer.write(b'12345678')
+        wait_for(lambda: output.writes)
+
+        self.assertEqual(output.writes, [b'12345678'])
+        writer.close()
+
+    def test_flushes_after_interval(self):
+        output = RecordingOutput()
+        writer = LogWriter(output, buffer_size=1024, flush_interval=0.01).start()
+        # Only a write to a thread that is already waiting shows whether it
+        # gets woken up
+        wait_for(lambda: is_waiting(writer.condition))
+        writer.write(b'a\n')
+        wait_for(lambda: output.writes)
+
+        self.assertEqual(output.writes, [b'a\n'])
+        writer.close()
+
+    def test_close_flushes_pending_output(self):
+        output = RecordingOutput()
+        writer = LogWriter(output, buffer_size=1024, flush_interval=10).start()
+        writer.write(b'a\n')
+        writer.write(b'b\n')
+        writer.close()
+
+        self.assertEqual(b''.join(output.writes), b'a\nb\n')
+
+    def test_drop_policy_discards_oldest_output(self):
+        output = RecordingOutput()
+        writer = LogWriter(output, backlog=8, policy=DROP)
+        writer.write(b'one\n', 'web')
+        writer.write(b'two\n', 'web')
+        writer.write(b'three\n', 'web')
+        writer.write(b'db\n', 'db')
+        writer.close()
+
+        self.assertEqual(b''.join(output.writes), b'[dropped 2 lines]\nthree\ndb\n')
+
+    def test_sample_policy_limits_lines_per_second(self):
+        output = RecordingOutput()
+        writer = LogWriter(output, policy=SAMPLE, rate=2)
+        writer.write(b'a\nb\nc\nd\n', 'web')
+        writer.close()
+
+        self.assertEqual(b''.join(output.writes), b'a\nb\n[dropped 2 lines]\n')
+
+    def test_block_policy_keeps_everything(self):
+        output = RecordingOutput()
+        writer = LogWriter(output, backlog=4, policy=BLOCK, flush_interval=0.001).start()
+        for i in range(20):
+            writer.write(('%02d\n' % i).encode('ascii'), 'web')
+        writer.close()
+
+        self.assertEqual(b''.join(output.writes), ''.join('%02d\n' % i for i in range(20)).encode('ascii'))
+
+    def test_notice_is_formatted_per_source(self):
+        output = RecordingOutput()
+        writer = LogWriter(output, backlog=2, policy=DROP,
+                           format_notice=lambda source, message: ('%s: %s\n' % (source, message)).encode('utf-8'))
+        writer.write(b'a\n', 'web')
+        writer.write(b'b\n', 'web')
+        writer.close()
+
+        self.assertEqual(b''.join(output.writes), b'web: dropped 1 lines\nb\n')
+
+    def test_split_by(self):
+        output = RecordingOutput()
+        writer = LogWriter(output, split_by=lambda source: source.split('.')[0])
+        writer.write(b'a\n', 'web.history')
+        writer.write(b'b\n', 'db')
+        writer.write(b'c\n', 'web')
+        writer.write(b'd\n', 'web')
+        writer.write(b'e\n', 'web.history')
+        writer.write(b'exited\n', 'web', exempt=True)
+        writer.close()
+
+        self.assertEqual(output.writes, [(b'a\nc\nd\ne\nexited\n', 'web'), (b'b\n', 'db')])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            LogWriter(RecordingOutput(), policy='explode')
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.001)
+
+
+def is_waiting(condition):
+    # The list of waiting threads is private, and named differently in
+    # Python 2 and 3
+    waiters = getattr(condition, '_waiters', None)
+    if waiters is None:
+        waiters = getattr(condition, '_Condition__waiters', [])
+    return bool(waiters)
+
+
+class RecordingOutput(object):
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data, source=None):
+        self.writes.append(data if source is None else (data, source))
+
+    def flush(self):
+        pass
@@ -0,0 +1,48 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+
+from fig.cli.multiplexer import Multiplexer, SelectPoller, STOP, DONE
+from .. import unittest
+
+
+class MultiplexerTest(unittest.TestCase):
+    def test_yields_items_until_stop(self):
+        first = PipeSource([b'a', b'b'])
+        second = PipeSource([b'c', STOP])
+
+        items = list(Multiplexer([first, second]).loop())
+
+        self.assertIn(b'c', items)
+        self.assertNotIn(STOP, items)
+
+    def test_finishes_when_every_source_is_done(self):
+        first = PipeSource([b'a', DONE])
+        second = PipeSource([b'b', DONE, b'ignored'])
+
+        self.assertEqual(sorted(Multiplexer([first, second]).loop()), [b'a', b'b'])
+
+    def test_select_poller(self):
+        source = PipeSource([b'a'])
+        poller = SelectPoller()
+        poller.register(source)
+
+        self.assertEqual(poller.poll(), [source])
+
+        poller.unregister(source)
+        self.assertEqual(poller.sources, {})
+
+
+class PipeSource(object):
+    def __init__(self, items):
+        self.items = items
+        self.r, w = os.pipe()
+        os.write(w, b'x')
+        os.close(w)
+
+    def fileno(self):
+        return self.r
+
+    def read(self):
+        items, self.items = self.items, []
+        return items
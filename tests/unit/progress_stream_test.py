@@ -0,0 +1,154 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import os
+
+import mock
+from six import StringIO
+
+from fig.progress_stream import (
+    stream_output,
+    StreamOutputError,
+    ImageIdExtractor,
+    TerminalRenderer,
+    TransferTracker,
+    json_stream,
+)
+from .. import unittest
+
+
+class ProgressStreamTest(unittest.TestCase):
+    def test_events_are_passed_to_consumers(self):
+        events = [{'stream': 'Step 0 : FROM busybox\n'}, {'stream': 'Successfully built 1a2b3c\n'}]
+        output = StringIO()
+        consumer = mock.Mock()
+        extractor = ImageIdExtractor()
+
+        stream_output((json.dumps(event) for event in events), output, [consumer, extractor])
+
+        self.assertEqual(consumer.call_args_list, [mock.call(event) for event in events])
+        self.assertEqual(extractor.image_id, '1a2b3c')
+        self.assertEqual(extractor.last_event, events[-1])
+        self.assertIn('Step 0 : FROM busybox', output.getvalue())
+
+    def test_error_stops_the_stream(self):
+        events = [{'errorDetail': {'message': 'oops'}}, {'stream': 'not reached'}]
+        consumer = mock.Mock()
+
+        with self.assertRaises(StreamOutputError):
+            stream_output((json.dumps(event) for event in events), StringIO(), [consumer])
+        self.assertFalse(consumer.called)
+
+    def test_progress_events_get_a_line_each(self):
+        events = [
+            {'id': 'a', 'status': 'Downloading', 'progress': '[=> ]'},
+            {'id': 'b', 'status': 'Downloading', 'progress': '[=> ]'},
+            {'id': 'a', 'status': 'Downloading', 'progress': '[==>]'},
+        ]
+        output = StringIO()
+
+        stream_output((json.dumps(event) for event in events), output)
+
+        self.assertEqual(output.getvalue(), 'a: Downloading\nb: Downloading\n')
+
+    def test_terminal_redraws_at_frame_rate(self):
+        output = StringIO()
+        renderer = TerminalRenderer(output, fps=10)
+
+        with mock.patch('time.time', return_value=100.0):
+            for i in range(100):
+                renderer({'id': 'a', 'status': 'Downloading', 'progress': '%d%%' % i})
+                renderer({'id': 'b', 'status': 'Downloading', 'progress': '%d%%' % i})
+        with mock.patch('time.time', return_value=100.2):
+            renderer({'id': 'a', 'status': 'Download complete', 'progressDetail': {}})
+        renderer.finish()
+
+        value = output.getvalue()
+        self.assertEqual(value.count('\x1b[2K'), 3)
+        self.assertIn('a: Downloading 0%', value)
+        self.assertIn('b: Downloading 99%', value)
+        self.assertIn('a: Download complete', value)
+        self.assertNotIn('a: Downloading 50%', value)
+
+
+class JsonStreamTest(unittest.TestCase):
+    def test_any_chunk_boundaries(self):
+        for name in ('pull.json', 'build.json'):
+            data = recorded_stream(name)
+            expected = [json.loads(line.decode('utf-8')) for line in data.splitlines()]
+            for size in (1, 7, 4096, len(data)):
+                chunks = [data[i:i + size] for i in range(0, len(data), size)]
+                self.assertEqual(list(json_stream(chunks)), expected)
+
+    def test_several_documents_in_a_chunk(self):
+        chunks = [b'{"a": 1}{"b": 2}\n {"c"', b': 3}']
+        self.assertEqual(list(json_stream(chunks)), [{'a': 1}, {'b': 2}, {'c': 3}])
+
+    def test_invalid_json(self):
+        with self.assertRaises(StreamOutputError):
+            list(json_stream([b'{"a": 1}\n', b'{"b": oops}\n']))
+
+
+def recorded_stream(name):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'fixtures', 'progress-streams', name), 'rb') as f:
+        return f.read()
+
+
+class TransferTrackerTest(unittest.TestCase):
+    def downloading(self, layer, current, total):
+        return {'id': layer, 'status': 'Downloading', 'progressDetail': {'current': current, 'total': total}}
+
+    def test_concurrent_streams_are_added_up(self):
+        output = StringIO()
+        with mock.patch('time.time', return_value=0.0):
+            tracker = TransferTracker(output, interval=1)
+            busybox = tracker.consumer('busybox')
+            ubuntu = tracker.consumer('ubuntu')
+
+        with mock.patch('time.time', return_value=2.0):
+            busybox(self.downloading('a', 1024 * 1024, 2 * 1024 * 1024))
+            ubuntu(self.downloading('b', 1024 * 1024, 4 * 1024 * 1024))
+            ubuntu(self.downloading('c', 0, 2 * 1024 * 1024))
+
+        self.assertEqual(output.getvalue(), (
+            'Downloading: busybox 1.0 MB/2.0 MB, 512.0 KB/s, ETA 2s, total 1.0 MB/2.0 MB, 512.0 KB/s, ETA 2s\n'
+        ))
+        self.assertEqual(tracker.current, 2 * 1024 * 1024)
+        self.assertEqual(tracker.total, 8 * 1024 * 1024)
+
+        with mock.patch('time.time', return_value=4.0):
+            busybox({'id': 'a', 'status': 'Download complete', 'progressDetail': {}})
+            busybox.finish()
+            ubuntu({'id': 'b', 'status': 'Download complete', 'progressDetail': {}})
+            ubuntu({'id': 'c', 'status': 'Download complete', 'progressDetail': {}})
+            ubuntu.finish()
+
+        self.assertEqual(tracker.summary(), [
+            'busybox: 2.0 MB in 4s (512.0 KB/s)',
+            'ubuntu: 6.0 MB in 4s (1.5 MB/s)',
+            'Total: 8.0 MB in 4s (2.0 MB/s) for 2 images',
+        ])
+
+    def test_no_status_without_download_totals(self):
+        output = StringIO()
+        with mock.patch('time.time', return_value=0.0):
+            tracker = TransferTracker(output, interval=1)
+            build = tracker.consumer('myapp_web')
+            pull = tracker.consumer('busybox')
+
+        for now in (10.0, 20.0):
+            with mock.patch('time.time', return_value=now):
+                build({'stream': 'Step 1 : RUN make\n'})
+                pull({'id': 'a', 'status': 'Pulling fs layer', 'progressDetail': {}})
+
+        self.assertEqual(output.getvalue(), '')
+
+    def test_builds_report_time_taken(self):
+        with mock.patch('time.time', return_value=0.0):
+            tracker = TransferTracker()
+            build = tracker.consumer('myapp_web')
+        with mock.patch('time.time', return_value=65.0):
+            build({'stream': 'Successfully built 1a2b3c\n'})
+            build.finish()
+
+        self.assertEqual(tracker.summary(), ['myapp_web: took 1m05s'])
@@ -37,10 +37,11 @@ class ServiceTest(unittest.TestCase):
             tags=['foo', 'foo:v2'])
         expected = 'abababab'
 
-        with mock.patch('fig.service.stream_output') as mock_stream_output:
-            mock_stream_output.return_value = [
-                dict(stream='Successfully built %s' % expected)
-            ]
+        def stream_output(output, stream, consumers):
+            for consumer in consumers:
+                consumer(dict(stream='Successfully built %s' % expected))
+
+        with mock.patch('fig.service.stream_output', side_effect=stream_output):
             image_id = service.build()
         self.assertEqual(image_id, expected)
         mock_client.build.assert_called_once_with(
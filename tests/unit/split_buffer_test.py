@@ -1,8 +1,10 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
-from fig.cli.utils import split_buffer
+
+from fig.cli.utils import split_buffer, LineBuffer, prefix_lines
 from .. import unittest
 
+
 class SplitBufferTest(unittest.TestCase):
     def test_single_line_chunks(self):
         def reader():
@@ -50,3 +52,22 @@ class SplitBufferTest(unittest.TestCase):
         for (actual, expected) in zip(split, expectations):
             self.assertEqual(type(actual), type(expected))
             self.assertEqual(actual, expected)
+
+
+class LineBufferTest(unittest.TestCase):
+    def test_whole_lines(self):
+        lines = LineBuffer()
+        self.assertEqual(lines.feed(b'abc\ndef\n'), b'abc\ndef\n')
+        self.assertEqual(lines.flush(), b'')
+
+    def test_partial_line_is_kept(self):
+        lines = LineBuffer()
+        self.assertEqual(lines.feed(b'abc\nde'), b'abc\n')
+        self.assertEqual(lines.feed(b'f'), b'')
+        self.assertEqual(lines.feed(b'\nghi'), b'def\n')
+        self.assertEqual(lines.flush(), b'ghi')
+
+    def test_prefix_lines(self):
+        self.assertEqual(prefix_lines(b'> ', b'abc\ndef\n'), b'> abc\n> def\n')
+        self.assertEqual(prefix_lines(b'> ', b'abc\ndef'), b'> abc\n> def')
+        self.assertEqual(prefix_lines(b'> ', b''), b'')
@@ -0,0 +1,48 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import mock
+
+from fig.service import Service
+from fig.timings import Timings
+from .. import unittest
+
+
+class TimingsTest(unittest.TestCase):
+    def test_report(self):
+        db = Service('db', image='busybox')
+        cache = Service('cache', image='busybox')
+        data = Service('data', image='busybox')
+        web = Service('web', image='busybox', links=[(db, None), (cache, 'c')], volumes_from=[data])
+        worker = Service('worker', image='busybox', links=[(db, None)])
+
+        # Each service starts when the one before it is ready
+        clock = [0]
+        with mock.patch('time.time', lambda: clock[0]):
+            timings = Timings()
+            for (service, duration) in [(db, 2), (cache, 5), (data, 0.5), (web, 1), (worker, 1)]:
+                timings.start(service)
+                clock[0] += duration
+                timings.ready(service)
+
+        report = timings.report()
+
+        self.assertEqual(report['total'], 9.5)
+        self.assertEqual(report['critical_path'], ['cache', 'web'])
+        self.assertEqual(report['critical_path_duration'], 6)
+        web_timings = report['services'][3]
+        self.assertEqual(web_timings, {
+            'name': 'web',
+            'depends_on': ['db', 'cache', 'data'],
+            'start': 7.5,
+            'ready': 8.5,
+            'duration': 1,
+            'waited_for': 'data',
+            'critical': True,
+        })
+        self.assertEqual(report['services'][4]['waited_for'], 'db')
+        self.assertFalse(report['services'][4]['critical'])
+
+    def test_empty(self):
+        report = Timings().report()
+        self.assertEqual((report['services'], report['critical_path']), ([], []))
@@ -0,0 +1,87 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import mock
+
+from fig import trace
+from fig.cli.trace_proxy import TraceProxy
+from .. import unittest
+
+
+class TraceTest(unittest.TestCase):
+    def setUp(self):
+        self.tracer = trace.start()
+        self.addCleanup(trace.stop)
+
+    def test_spans_nest(self):
+        @trace.traced('recreate_container', lambda name: {'container': name})
+        def recreate_container(name):
+            with trace.span('start', 'docker'):
+                pass
+
+        recreate_container('myapp_web_1')
+
+        outer, inner = sorted(self.tracer.events, key=lambda event: -event['dur'])
+        self.assertEqual(outer['name'], 'recreate_container')
+        self.assertEqual(outer['args'], {'container': 'myapp_web_1'})
+        self.assertEqual((inner['name'], inner['cat'], inner['ph']), ('start', 'docker', 'X'))
+        self.assertTrue(outer['ts'] <= inner['ts'])
+        self.assertTrue(inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur'])
+
+    def test_spans_record_their_thread(self):
+        def work():
+            with trace.span('pull'):
+                pass
+
+        thread = threading.Thread(target=work, name='puller')
+        thread.start()
+        thread.join()
+        with trace.span('up'):
+            pass
+
+        threads = dict((event['name'], event['tid']) for event in self.tracer.events)
+        self.assertEqual(threads['pull'], thread.ident)
+        self.assertEqual(threads['up'], threading.current_thread().ident)
+        self.assertIn(
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread.ident, 'args': {'name': 'puller'}},
+            self.tracer.trace_events())
+
+    def test_proxy_records_calls(self):
+        client = mock.Mock()
+        client.containers.return_value = ['a']
+
+        self.assertEqual(TraceProxy(client).containers(all=True), ['a'])
+        client.containers.assert_called_once_with(all=True)
+        self.assertEqual([(e['name'], e['cat']) for e in self.tracer.events], [('containers', 'docker')])
+
+    def test_proxy_skips_client_helpers(self):
+        client = mock.Mock()
+        proxy = TraceProxy(client)
+        proxy._raise_for_status(proxy._get(proxy._url('/containers/abc/logs')))
+
+        self.assertEqual([e['name'] for e in self.tracer.events], ['_get'])
+
+    def test_nothing_is_recorded_when_stopped(self):
+        trace.stop()
+        with trace.span('up'):
+            pass
+        self.assertEqual(self.tracer.events, [])
+
+    def test_write(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'trace.json')
+        with trace.span('up'):
+            pass
+
+        with open(path, 'w') as f:
+            self.tracer.write(f)
+
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual([event['ph'] for event in events], ['M', 'M', 'X'])